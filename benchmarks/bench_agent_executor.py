@@ -0,0 +1,64 @@
+"""Per-message agent setup overhead: rebuilding the executor vs. using the cached one.
+
+Run from the repo root: python -m benchmarks.bench_agent_executor
+No LLM server is needed, only the client/agent construction is measured.
+"""
+import os
+import time
+import tempfile
+from types import SimpleNamespace
+from services.llm_service import LLMService
+
+ITERATIONS = 200
+
+
+def fake_config(memory_dir):
+    return SimpleNamespace(
+        API_KEY="bench",
+        LOCAL_HOST="http://127.0.0.1:1/v1",
+        MODEL="bench-model",
+        VISION_MODEL="bench-vision",
+        SYSTEM_MESSAGE="You are a benchmark.",
+        SHORT_MEMORY=10,
+        SERPER_API_KEY="bench",
+        COMFYUI_API="http://127.0.0.1:1",
+        COMFYUI_IMAGE_PATH=".",
+        COMFYUI_IMAGE_WIDTH=512,
+        COMFYUI_IMAGE_HEIGHT=512,
+        COMFYUI_STEPS=20,
+        # Keep the benchmark's conversation store out of the working directory
+        MEMORY_DB_PATH=os.path.join(memory_dir, "memory.db"),
+    )
+
+
+def measure(label, fn):
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        fn()
+    per_call_ms = (time.perf_counter() - start) * 1000 / ITERATIONS
+    print(f"{label:<32} {per_call_ms:8.3f} ms/message")
+    return per_call_ms
+
+
+def main():
+    with tempfile.TemporaryDirectory() as memory_dir:
+        run(LLMService(fake_config(memory_dir)))
+
+
+def run(service):
+    def rebuild_per_message():
+        # What _run_agent used to do: new tools, new client, new prompt, new executor
+        service.serper_web_search_tool.get_web_tool()
+        service.comfy_image_tool.get_tool()
+        service._build_executor(LLMService.PROFILE_TEXT)
+
+    def cached():
+        service.get_executor(LLMService.PROFILE_TEXT)
+
+    before = measure("rebuild per message", rebuild_per_message)
+    after = measure("cached executor", cached)
+    print(f"{'saved per message':<32} {before - after:8.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Latency of one agent step with several tool calls: sequential vs. parallel execution.
+
+Run from the repo root: python -m benchmarks.bench_parallel_tools
+No LLM server is needed: a scripted agent asks for the same tool calls the model
+would emit in one turn (two web searches and the date), and the tools sleep for a
+typical Serper/network round trip instead of calling out.
+"""
+import time
+from langchain.agents import AgentExecutor
+from langchain_core.agents import AgentAction, AgentFinish
+from langchain_core.runnables import RunnableLambda
+from langchain_core.tools import tool
+from services.parallel_agent import ParallelAgentExecutor
+
+ITERATIONS = 5
+SEARCH_SECONDS = 0.8
+DATE_SECONDS = 0.05
+
+
+@tool
+def serper_search(query: str):
+    """Fake web search."""
+    time.sleep(SEARCH_SECONDS)
+    return f"Results for {query}"
+
+
+@tool
+def get_current_date():
+    """Fake date lookup."""
+    time.sleep(DATE_SECONDS)
+    return "The current date is Monday, January 01, 2024"
+
+
+def scripted_agent(inputs):
+    # First step: three tool calls at once; second step: answer from the observations
+    if inputs["intermediate_steps"]:
+        observations = [step[1] for step in inputs["intermediate_steps"]]
+        return AgentFinish(return_values={"output": " | ".join(observations)}, log="")
+    calls = [
+        ("serper_search", {"query": "python release"}),
+        ("serper_search", {"query": "slack api changes"}),
+        ("get_current_date", {}),
+    ]
+    return [AgentAction(tool=name, tool_input=args, log="") for name, args in calls]
+
+
+def measure(label, executor):
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        output = executor.invoke({"input": "bench"})["output"]
+    per_run = (time.perf_counter() - start) / ITERATIONS
+    print(f"{label:<24} {per_run * 1000:8.1f} ms/step  ({output[:40]}...)")
+    return per_run
+
+
+def main():
+    tools = [serper_search, get_current_date]
+    agent = RunnableLambda(scripted_agent)
+
+    sequential = AgentExecutor(agent=agent, tools=tools, max_iterations=3)
+    parallel = ParallelAgentExecutor(agent=agent, tools=tools, max_iterations=3, tool_timeout=30)
+
+    before = measure("sequential tools", sequential)
+    after = measure("parallel tools", parallel)
+    print(f"{'speedup':<24} {before / after:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
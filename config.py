@@ -3,12 +3,14 @@ from dotenv import load_dotenv
 
 
 class Config:
-    def __init__(self) -> None:
-        load_dotenv()
+    def __init__(self, override: bool = False) -> None:
+        # override=True re-reads .env over already loaded values (used on config save)
+        load_dotenv(override=override)
 
         self.BOT_TOKEN = self._get_required("BOT_TOKEN")
         self.APP_TOKEN = self._get_required("APP_TOKEN")
         self.API_KEY = os.getenv("API_KEY", "")
+        # One or more OpenAI compatible endpoints, comma separated (least busy one is used)
         self.LOCAL_HOST = self._get_required("LOCAL_HOST")
         self.MODEL = self._get_required("MODEL")
         self.SYSTEM_MESSAGE = self._get_required("SYSTEM_MESSAGE")
@@ -17,12 +19,108 @@ class Config:
             os.getenv("ALLOWED_GROUP_CHANNEL_IDS", "")
         )
         self.SERPER_API_KEY = self._get_required("SERPER_API_KEY")
+        # Seconds a web search result is reused (news queries expire sooner, 0 = no cache)
+        self.SERPER_CACHE_TTL = float(os.getenv("SERPER_CACHE_TTL", "600"))
+        self.SERPER_NEWS_CACHE_TTL = float(os.getenv("SERPER_NEWS_CACHE_TTL", "120"))
+        # Cached search queries kept at most
+        self.SERPER_CACHE_SIZE = int(os.getenv("SERPER_CACHE_SIZE", "256"))
+        # Seconds before a Serper request is given up
+        self.SERPER_TIMEOUT = float(os.getenv("SERPER_TIMEOUT", "10"))
+        # One or more ComfyUI endpoints, comma separated (jobs go to the least-loaded one)
         self.COMFYUI_API = self._get_required("COMFYUI_API")
-        self.COMFYUI_IMAGE_PATH = self._get_required("COMFYUI_IMAGE_PATH")
+        # Optional: ComfyUI output folder, only used if fetching an image over HTTP fails
+        self.COMFYUI_IMAGE_PATH = os.getenv("COMFYUI_IMAGE_PATH", "")
         self.COMFYUI_IMAGE_WIDTH = self._get_required("COMFYUI_IMAGE_WIDTH")
         self.COMFYUI_IMAGE_HEIGHT = self._get_required("COMFYUI_IMAGE_HEIGHT")
         self.COMFYUI_STEPS = self._get_required("COMFYUI_STEPS")
+        # Image jobs running inside each ComfyUI backend at once, the rest wait in the bot's queue
+        self.COMFYUI_MAX_CONCURRENT = int(os.getenv("COMFYUI_MAX_CONCURRENT", "1"))
+        # Unfinished image jobs allowed per user (0 = no limit)
+        self.COMFYUI_MAX_PER_USER = int(os.getenv("COMFYUI_MAX_PER_USER", "2"))
+        # Seconds before a running image job is given up
+        self.COMFYUI_TIMEOUT = float(os.getenv("COMFYUI_TIMEOUT", "300"))
         self.VISION_MODEL = self._get_required("VISION_MODEL")
+        # Optional endpoints for VISION_MODEL, comma separated (default: LOCAL_HOST)
+        self.VISION_HOST = os.getenv("VISION_HOST", "")
+        # Seconds between health probes of the endpoints (only with several endpoints)
+        self.LLM_HEALTH_INTERVAL = float(os.getenv("LLM_HEALTH_INTERVAL", "15"))
+        # Keep the prompt prefix reusable: each conversation sticks to one backend and its
+        # history window only grows until it has to jump forward
+        self.PREFIX_CACHE = os.getenv("PREFIX_CACHE", "false").strip().lower() == "true"
+        # A sticky conversation moves when its backend has this many more requests in flight
+        self.AFFINITY_MAX_IMBALANCE = int(os.getenv("AFFINITY_MAX_IMBALANCE", "4"))
+        # llama.cpp server slots (--parallel) to pin conversations to (0 = let the server pick)
+        self.LLM_SLOTS = int(os.getenv("LLM_SLOTS", "0"))
+        # Number of Slack events processed in parallel (ordered per conversation)
+        self.WORKER_POOL_SIZE = int(os.getenv("WORKER_POOL_SIZE", "4"))
+        # "threads" (worker pool) or "asyncio" (one event loop, awaited Slack/LLM/HTTP calls)
+        self.RUNTIME = os.getenv("RUNTIME", "threads").strip().lower()
+        # Conversations handled at once in the asyncio runtime
+        self.ASYNC_MAX_CONCURRENCY = int(os.getenv("ASYNC_MAX_CONCURRENCY", "100"))
+        # Conversation memory: "sqlite" (persistent) or "memory" (lost on restart)
+        self.MEMORY_BACKEND = os.getenv("MEMORY_BACKEND", "sqlite").strip().lower()
+        self.MEMORY_DB_PATH = os.getenv("MEMORY_DB_PATH", "memory.db")
+        self.MEMORY_CACHE_SIZE = int(os.getenv("MEMORY_CACHE_SIZE", "256"))
+        # Upper bound on the memory used by cached conversations
+        self.MEMORY_CACHE_MB = int(os.getenv("MEMORY_CACHE_MB", "64"))
+        self.MEMORY_IDLE_SECONDS = float(os.getenv("MEMORY_IDLE_SECONDS", "1800"))
+        # History window: token budget per prompt (0 = use SHORT_MEMORY message count instead)
+        self.HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "3000"))
+        # Per-model overrides, e.g. "qwen3:8b=6000,llama3.2:3b=2000"
+        self.MODEL_TOKEN_BUDGETS = self._parse_model_budgets(os.getenv("MODEL_TOKEN_BUDGETS", ""))
+        # Upper bound on stored messages per conversation
+        self.MEMORY_MAX_MESSAGES = int(os.getenv("MEMORY_MAX_MESSAGES", "200"))
+        # Rolling summary of turns that fall out of the history window (runs in background)
+        self.SUMMARY_ENABLED = os.getenv("SUMMARY_ENABLED", "false").strip().lower() == "true"
+        self.SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", "")
+        self.SUMMARY_MAX_WORDS = int(os.getenv("SUMMARY_MAX_WORDS", "200"))
+        # Retrieval over uploaded documents (empty EMBEDDING_MODEL = inline whole documents)
+        self.EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "")
+        self.RAG_CHUNK_SIZE = int(os.getenv("RAG_CHUNK_SIZE", "1000"))
+        self.RAG_CHUNK_OVERLAP = int(os.getenv("RAG_CHUNK_OVERLAP", "150"))
+        self.RAG_TOP_K = int(os.getenv("RAG_TOP_K", "6"))
+        self.RAG_MIN_SCORE = float(os.getenv("RAG_MIN_SCORE", "0.2"))
+        # Later messages without documents only get excerpts this close to the question
+        self.RAG_FOLLOWUP_MIN_SCORE = float(os.getenv("RAG_FOLLOWUP_MIN_SCORE", "0.45"))
+        # Documents smaller than this (characters) are still inlined in full
+        self.RAG_INLINE_CHARS = int(os.getenv("RAG_INLINE_CHARS", "6000"))
+        self.RAG_MAX_INDEXES = int(os.getenv("RAG_MAX_INDEXES", "64"))
+        self.RAG_MAX_CHUNKS = int(os.getenv("RAG_MAX_CHUNKS", "5000"))
+        # Disk cache of extracted file text and images (empty FILE_CACHE_DIR = disabled)
+        self.FILE_CACHE_DIR = os.getenv("FILE_CACHE_DIR", ".file_cache")
+        self.FILE_CACHE_MAX_MB = int(os.getenv("FILE_CACHE_MAX_MB", "200"))
+        # Attachment downloads: parallel downloads per message and max size per file
+        self.DOWNLOAD_WORKERS = int(os.getenv("DOWNLOAD_WORKERS", "4"))
+        self.FILE_MAX_MB = int(os.getenv("FILE_MAX_MB", "50"))
+        # PDF/DOCX parsing processes (0 = up to 4 by CPU count), timeout per file, size caps
+        self.PARSER_WORKERS = int(os.getenv("PARSER_WORKERS", "0"))
+        self.PARSE_TIMEOUT = float(os.getenv("PARSE_TIMEOUT", "60"))
+        self.PARSE_MAX_PAGES = int(os.getenv("PARSE_MAX_PAGES", "300"))
+        self.PARSE_MAX_CHARS = int(os.getenv("PARSE_MAX_CHARS", "500000"))
+        # Uploaded images are downscaled to this longest side before the vision call
+        self.VISION_MAX_SIDE = int(os.getenv("VISION_MAX_SIDE", "1024"))
+        self.VISION_JPEG_QUALITY = int(os.getenv("VISION_JPEG_QUALITY", "85"))
+        # Vision description cache size in KB (0 = disabled), optional SQLite file to persist it
+        self.VISION_CACHE_MAX_KB = int(os.getenv("VISION_CACHE_MAX_KB", "2048"))
+        self.VISION_CACHE_PATH = os.getenv("VISION_CACHE_PATH", "")
+        # Reuse answers to repeated questions in group channels (per channel, off by default)
+        self.RESPONSE_CACHE = os.getenv("RESPONSE_CACHE", "false").strip().lower() == "true"
+        self.RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+        self.RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "500"))
+        # Cosine similarity for matching a reworded question (needs EMBEDDING_MODEL, 0 = exact only)
+        self.RESPONSE_CACHE_SIMILARITY = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.95"))
+        # Shorter questions are usually follow-ups that depend on the conversation
+        self.RESPONSE_CACHE_MIN_WORDS = int(os.getenv("RESPONSE_CACHE_MIN_WORDS", "3"))
+        # One JSON line per handled Slack event (empty = off), see python -m services.trace_report
+        self.TRACE_LOG_PATH = os.getenv("TRACE_LOG_PATH", "logs/requests.jsonl")
+        self.TRACE_LOG_FLUSH_INTERVAL = float(os.getenv("TRACE_LOG_FLUSH_INTERVAL", "1"))
+        self.TRACE_LOG_MAX_MB = int(os.getenv("TRACE_LOG_MAX_MB", "100"))
+        # Run the tool calls of one agent step in parallel, each limited to TOOL_TIMEOUT seconds
+        self.PARALLEL_TOOLS = os.getenv("PARALLEL_TOOLS", "true").strip().lower() == "true"
+        self.TOOL_TIMEOUT = float(os.getenv("TOOL_TIMEOUT", "30"))
+        # Stream tokens into the Slack placeholder while the model generates
+        self.STREAM_REPLIES = os.getenv("STREAM_REPLIES", "true").strip().lower() == "true"
+        self.STREAM_UPDATE_INTERVAL = float(os.getenv("STREAM_UPDATE_INTERVAL", "1.0"))
 
     def _get_required(self, name: str) -> str:
         value = os.getenv(name)
@@ -36,3 +134,12 @@ class Config:
             return None
 
         return {v.strip() for v in raw_value.split(",") if v.strip()}
+
+    def _parse_model_budgets(self, raw_value: str) -> dict[str, int]:
+        budgets = {}
+        for item in raw_value.split(","):
+            # Model names may contain ":" so the separator is the last "="
+            model, sep, budget = item.strip().rpartition("=")
+            if sep and model.strip() and budget.strip().isdigit():
+                budgets[model.strip()] = int(budget)
+        return budgets
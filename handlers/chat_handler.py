@@ -0,0 +1,179 @@
+import time
+from services.slack_streamer import AsyncSlackStreamer, SlackStreamer
+from services.request_context import RequestContext
+from services import metrics
+
+
+class ChatRequest:
+    """One Slack message on its way through a chat handler."""
+
+    def __init__(self, client, event, user_input, thread_ts) -> None:
+        self.client = client
+        self.conv_id = event.get("channel")
+        self.user_id = event.get("user")
+        self.user_input = user_input
+        self.files = event.get("files")
+        self.thread_ts = thread_ts
+        self.msg_ts = None
+        self.started_at = time.perf_counter()
+        self.context = None
+
+
+class ChatHandlerBase:
+    """Everything a chat handler does apart from the Slack and LLM calls themselves.
+
+    Subclasses set the texts below and may override the hooks (_user_input,
+    _stage_call, _attachments); ChatHandler and AsyncChatHandler make the calls.
+    """
+
+    HANDLER = ""
+    PLACEHOLDER = "_Initializing..._"
+    ERROR_LOG = "LLM Error"
+    ERROR_REPLY = "Sorry, I had trouble processing that request."
+    EMPTY_REPLY = "Done."
+    EMPTY_PROMPT = "Please analyze these files."
+    CACHE_REPLIES = False
+    IMAGE_COMMENT = None
+
+    def __init__(self, llm_service, image_tracker, tracker_client=None):
+        self.llm_service = llm_service
+        self.image_tracker = image_tracker
+        # The tracker posts from its own threads, so the asyncio runtime gives it a
+        # blocking WebClient; the threaded runtime uses the request's own client
+        self.tracker_client = tracker_client
+
+    def _user_input(self, event) -> str:
+        return event.get("text", "").strip()
+
+    def _stage_call(self, request, stage):
+        """(client method, kwargs) showing pipeline progress, or None for no update."""
+        return None
+
+    def _attachments(self, request) -> list | None:
+        return None
+
+    def _start(self, event, client, thread_ts):
+        if event.get("bot_id") is not None:
+            return None
+
+        # Slack API calls of this request are timed for /metrics
+        client = metrics.InstrumentedSlackClient(client)
+        metrics.REQUESTS.inc(handler=self.HANDLER)
+        request = ChatRequest(client, event, self._user_input(event), thread_ts)
+        # Sources and images the tools produce for this message are collected here
+        request.context = RequestContext(request.conv_id, request.user_id, cache_replies=self.CACHE_REPLIES)
+        return request
+
+    def _placeholder(self, request) -> dict:
+        return {"channel": request.conv_id, "thread_ts": request.thread_ts, "text": self.PLACEHOLDER}
+
+    def _streamer(self, request, streamer_class):
+        # Stream tokens into the placeholder as they are generated
+        if not self.llm_service.config.STREAM_REPLIES:
+            return None
+        return streamer_class(
+            request.client, request.conv_id, request.msg_ts,
+            min_interval=self.llm_service.config.STREAM_UPDATE_INTERVAL
+        )
+
+    def _reply_args(self, request, on_stage, streamer) -> dict:
+        # Files (text + images) are extracted inside the LLM pipeline
+        return {
+            "conversation_id": request.conv_id,
+            "prompt": request.user_input,
+            "files": request.files,
+            "token": request.client.token,
+            "empty_prompt": self.EMPTY_PROMPT,
+            "on_stage": on_stage,
+            "streamer": streamer,
+            "context": request.context,
+        }
+
+    def _failed(self, request, error) -> str:
+        print(f"{self.ERROR_LOG}: {error}")
+        metrics.ERRORS.inc(component="handler")
+        request.context.error = str(error)
+        return self.ERROR_REPLY
+
+    def _final_update(self, request, final_text) -> dict:
+        # Even if final_text is weirdly empty, the "Thinking" text is replaced
+        update = {
+            "channel": request.conv_id,
+            "ts": request.msg_ts,
+            "text": final_text if (final_text and final_text.strip()) else self.EMPTY_REPLY,
+        }
+        attachments = self._attachments(request)
+        if attachments is not None:
+            update["attachments"] = attachments
+        return update
+
+    def _finish(self, request) -> None:
+        elapsed = time.perf_counter() - request.started_at
+        metrics.REQUEST_SECONDS.observe(elapsed, handler=self.HANDLER)
+        self.llm_service.trace_request(request.context, self.HANDLER, elapsed)
+
+        # Images started by this request are uploaded to its thread when ComfyUI finishes them
+        extra = {"initial_comment": self.IMAGE_COMMENT} if self.IMAGE_COMMENT else {}
+        for started in request.context.images_started:
+            self.image_tracker.track(
+                started["job"], started["queue"], self.tracker_client or request.client,
+                request.conv_id, request.thread_ts, **extra
+            )
+
+
+class ChatHandler(ChatHandlerBase):
+    """Threaded runtime: blocking Slack and LLM calls."""
+
+    def _respond(self, event, client, thread_ts) -> None:
+        request = self._start(event, client, thread_ts)
+        if request is None:
+            return
+        client = request.client
+
+        request.msg_ts = client.chat_postMessage(**self._placeholder(request))["ts"]
+
+        def on_stage(stage):
+            call = self._stage_call(request, stage)
+            if call is not None:
+                getattr(client, call[0])(**call[1])
+
+        streamer = self._streamer(request, SlackStreamer)
+        try:
+            final_text = self.llm_service.generate_reply(**self._reply_args(request, on_stage, streamer)).reply
+        except Exception as e:
+            final_text = self._failed(request, e)
+
+        if streamer:
+            streamer.close()
+
+        client.chat_update(**self._final_update(request, final_text))
+        self._finish(request)
+
+
+class AsyncChatHandler(ChatHandlerBase):
+    """asyncio runtime (AsyncApp): the same steps with awaited Slack and LLM calls."""
+
+    async def _respond(self, event, client, thread_ts) -> None:
+        request = self._start(event, client, thread_ts)
+        if request is None:
+            return
+        client = request.client
+
+        request.msg_ts = (await client.chat_postMessage(**self._placeholder(request)))["ts"]
+
+        async def on_stage(stage):
+            call = self._stage_call(request, stage)
+            if call is not None:
+                await getattr(client, call[0])(**call[1])
+
+        streamer = self._streamer(request, AsyncSlackStreamer)
+        try:
+            final_text = (await self.llm_service.agenerate_reply(**self._reply_args(request, on_stage, streamer))).reply
+        except Exception as e:
+            final_text = self._failed(request, e)
+
+        if streamer:
+            streamer.close()
+
+        await client.chat_update(**self._final_update(request, final_text))
+        self._finish(request)
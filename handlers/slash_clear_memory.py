@@ -16,13 +16,14 @@ class SlashClearMemoryHandler:
         channel_id = body["channel_id"]
         user_id = body["user_id"]
 
-        if channel_id in self.llm_service.history_db:
+        memory = self.llm_service.memory
+        if channel_id in memory:
             # Keep system messages and remove user messages in this channel
-            self.llm_service.history_db[channel_id] = [
-                msg for msg in self.llm_service.history_db[channel_id]
+            memory.set(channel_id, [
+                msg for msg in memory.get(channel_id)
                 if msg.__class__.__name__ == "SystemMessage"
                 or (msg.__class__.__name__ != "HumanMessage" or getattr(msg, "user_id", None) != user_id)
-            ]
+            ])
 
         client.chat_postMessage(
             channel=channel_id,
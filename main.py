@@ -6,6 +6,7 @@ from web.app import app
 from config import Config
 from services.llm_service import LLMService
 from services.slack_bot_service import SlackBotService
+from services.async_slack_bot_service import AsyncSlackBotService
 from services.bot_manager import BotManager
 
 def open_browser():
@@ -15,12 +16,23 @@ def main():
         config = Config()
         llm_service = LLMService(config)
         
-        slack_bot = SlackBotService(
-            llm_service=llm_service,
-            bot_token=config.BOT_TOKEN,
-            app_token=config.APP_TOKEN,
-            allowed_channel_ids=config.ALLOWED_GROUP_CHANNEL_IDS
-        )
+        if config.RUNTIME == "asyncio":
+            # One event loop handles every conversation, no thread per request
+            slack_bot = AsyncSlackBotService(
+                llm_service=llm_service,
+                bot_token=config.BOT_TOKEN,
+                app_token=config.APP_TOKEN,
+                allowed_channel_ids=config.ALLOWED_GROUP_CHANNEL_IDS,
+                max_concurrency=config.ASYNC_MAX_CONCURRENCY
+            )
+        else:
+            slack_bot = SlackBotService(
+                llm_service=llm_service,
+                bot_token=config.BOT_TOKEN,
+                app_token=config.APP_TOKEN,
+                allowed_channel_ids=config.ALLOWED_GROUP_CHANNEL_IDS,
+                worker_pool_size=config.WORKER_POOL_SIZE
+            )
         
         bot_manager = BotManager(slack_bot)
 
@@ -31,5 +43,9 @@ def main():
 
         uvicorn.run(app, host="127.0.0.1", port=5000, log_level="info")
 
+        # Write out trace records still waiting for the background writer
+        if llm_service.trace_log is not None:
+            llm_service.trace_log.close()
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,29 @@
+import asyncio
+import aiohttp
+
+
+class LoopBoundSession:
+    """Lazily created aiohttp session for the running event loop.
+
+    An aiohttp session only works on the loop it was created on, and the asyncio
+    runtime gets a new loop every time the bot is started from the control panel,
+    so the session is recreated when the loop changes.
+    """
+
+    def __init__(self, **session_kwargs) -> None:
+        self.session_kwargs = session_kwargs
+        self._session: aiohttp.ClientSession | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def get(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            self._session = aiohttp.ClientSession(**self.session_kwargs)
+            self._loop = loop
+        return self._session
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        self._loop = None
@@ -0,0 +1,91 @@
+import asyncio
+from slack_bolt.async_app import AsyncApp
+from slack_bolt.adapter.socket_mode.async_handler import AsyncSocketModeHandler
+from slack_sdk import WebClient
+from services.llm_service import LLMService
+from handlers.group_chat import AsyncGroupChatHandler
+from handlers.private_chat import AsyncPrivateChatHandler
+from services.event_dispatcher import AsyncConversationDispatcher
+from services.comfy_tracker import ComfyCompletionTracker
+from services import metrics
+
+class AsyncSlackBotService:
+    """SlackBotService on asyncio: AsyncApp, async Socket Mode and awaited LLM calls.
+
+    Every conversation in flight is a task on one event loop instead of a worker
+    thread, so the number of concurrent conversations is bounded by max_concurrency
+    rather than by a thread pool. Same start/stop interface as SlackBotService.
+    """
+
+    def __init__(
+        self,
+        llm_service: LLMService,
+        bot_token: str,
+        app_token: str,
+        allowed_channel_ids: set[str] | None,
+        max_memory: int = 10,
+        max_concurrency: int = 100
+    ) -> None:
+        self.llm_service = llm_service
+        self.app = AsyncApp(token=bot_token)
+        self.app_token = app_token
+
+        # One shared tracker uploads finished ComfyUI images to the right thread
+        self.image_tracker = ComfyCompletionTracker(
+            image_path=llm_service.config.COMFYUI_IMAGE_PATH,
+        )
+        tracker_client = metrics.InstrumentedSlackClient(WebClient(token=bot_token))
+
+        # Handlers
+        self.group_handler = AsyncGroupChatHandler(llm_service, self.image_tracker, tracker_client)
+        self.private_handler = AsyncPrivateChatHandler(llm_service, self.image_tracker, tracker_client)
+
+        # Events are acked right away and processed as tasks, in order per conversation
+        self.dispatcher = AsyncConversationDispatcher(max_concurrency=max_concurrency)
+
+        self.handler: AsyncSocketModeHandler | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._stop_event: asyncio.Event | None = None
+        self._register_handlers()
+
+    def _register_handlers(self) -> None:
+        @self.app.event("app_mention")
+        async def handle_mention(event, say, client):
+            # This only fires in channels/groups when @bot is tagged
+            thread_ts = event.get("thread_ts") or event.get("ts")
+            self.dispatcher.submit(
+                event.get("channel"),
+                self.group_handler.handle, event, say, client, thread_ts
+            )
+
+        @self.app.event("message")
+        async def handle_message(event, say, client):
+            # Only Direct Messages, mentions in groups arrive as app_mention
+            if event.get("channel_type") == "im":
+                self.dispatcher.submit(
+                    event.get("channel"),
+                    self.private_handler.handle, event, say, client
+                )
+
+    def run_sync(self) -> None:
+        """Runs the bot on its own event loop. This blocks the thread it is called in."""
+        asyncio.run(self._run())
+
+    async def _run(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._stop_event = asyncio.Event()
+
+        self.handler = AsyncSocketModeHandler(self.app, self.app_token)
+        # connect_async() opens the websocket WITHOUT registering OS signals
+        await self.handler.connect_async()
+        try:
+            await self._stop_event.wait()
+        finally:
+            self.dispatcher.shutdown()
+            await self.handler.close_async()
+            self.handler = None
+
+    def stop(self) -> None:
+        """Gracefully shuts down the connection. Safe to call from any thread."""
+        if self._loop is not None and self._stop_event is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._stop_event.set)
@@ -0,0 +1,128 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from tools.comfy_queue import QUEUED, RUNNING, DONE, FAILED, CANCELLED
+
+
+class ComfyCompletionTracker:
+    """Shows ComfyUI job progress in Slack and uploads each finished image to the
+    conversation and thread that asked for it.
+
+    Jobs are followed by the ComfyJobQueue in the tool layer; this class only listens to
+    their state changes. A status message shows the queue position and ETA, and is
+    updated at most every `update_interval` seconds while waiting (a change inside the
+    interval is shown when it ends). Images are fetched from the backend over HTTP;
+    `image_path` is only a fallback for a shared folder.
+    """
+
+    def __init__(self, image_path: str = "", update_interval: float = 5.0) -> None:
+        self.image_path = image_path
+        self.update_interval = update_interval
+        # Slack calls run here so the job queue thread never waits on Slack
+        self._slack_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="comfy-slack")
+
+    def track(self, job, queue, client, channel: str, thread_ts: str | None, initial_comment: str | None = None) -> None:
+        target = {
+            "queue": queue,
+            "client": client,
+            "channel": channel,
+            "thread_ts": thread_ts,
+            "initial_comment": initial_comment,
+            "status_ts": None,
+            "last_text": None,
+            "last_update": 0.0,
+            # A throttled change is shown by a timer once the interval is over
+            "flush_scheduled": False,
+            # Serializes the updates of one status message
+            "lock": threading.Lock(),
+        }
+
+        def listener(changed_job):
+            self._slack_pool.submit(self._on_change, changed_job, target)
+
+        job.listeners.append(listener)
+        # Post the first status right away (the job may even be finished already)
+        listener(job)
+
+    def _on_change(self, job, target) -> None:
+        with target["lock"]:
+            # The current state is read here, so late or merged events are harmless
+            text = self._status_text(job, target["queue"])
+            if text == target["last_text"]:
+                return
+            waiting = job.state in (QUEUED, RUNNING)
+            elapsed = time.monotonic() - target["last_update"]
+            if waiting and target["status_ts"] and elapsed < self.update_interval:
+                # Too soon after the last update; without a later change this one
+                # would never be shown, so flush it when the interval is over
+                if not target["flush_scheduled"]:
+                    target["flush_scheduled"] = True
+                    self._flush_later(job, target, self.update_interval - elapsed)
+                return
+            target["last_text"] = text
+            target["last_update"] = time.monotonic()
+
+            client = target["client"]
+            try:
+                if target["status_ts"] is None:
+                    response = client.chat_postMessage(channel=target["channel"], thread_ts=target["thread_ts"], text=text)
+                    target["status_ts"] = response["ts"]
+                else:
+                    client.chat_update(channel=target["channel"], ts=target["status_ts"], text=text)
+            except Exception as e:
+                print(f"Image status message failed: {e}")
+
+            if job.state == DONE:
+                for image in job.images:
+                    self._upload(job, image, target)
+
+    def _flush_later(self, job, target, delay: float) -> None:
+        def flush():
+            with target["lock"]:
+                target["flush_scheduled"] = False
+            # Reads the state at that time, so it shows the latest of the skipped changes
+            self._slack_pool.submit(self._on_change, job, target)
+
+        timer = threading.Timer(delay, flush)
+        timer.daemon = True
+        timer.start()
+
+    def _status_text(self, job, queue) -> str:
+        if job.state == QUEUED:
+            return f"🎨 _Image queued: position {queue.position(job)}, ready in about {queue.eta(job):.0f}s_"
+        if job.state == RUNNING:
+            return f"🎨 _Generating image, ready in about {queue.eta(job):.0f}s_"
+        if job.state == DONE:
+            return "🎨 _Image generated._"
+        if job.state == CANCELLED:
+            return "🚫 _Image generation cancelled._"
+        if job.state == FAILED:
+            return f"⚠️ _Image generation failed: {job.error}_"
+        return ""
+
+    def _upload(self, job, image, target) -> None:
+        try:
+            content = self._fetch(job, image, target["queue"])
+            target["client"].files_upload_v2(
+                channel=target["channel"],
+                thread_ts=target["thread_ts"],
+                content=content,
+                filename=image["filename"],
+                title="AI Generated Image",
+                initial_comment=target["initial_comment"],
+            )
+        except Exception as e:
+            print(f"Image upload failed: {e}")
+
+    def _fetch(self, job, image, queue) -> bytes:
+        try:
+            return queue.fetch_image(job, image)
+        except Exception as e:
+            if not self.image_path:
+                raise
+            # Bot and ComfyUI share a folder, read the file from there instead
+            print(f"Image fetch over HTTP failed, reading from {self.image_path}: {e}")
+            path = os.path.join(self.image_path, image.get("subfolder", ""), image["filename"])
+            with open(path, "rb") as f:
+                return f.read()
@@ -0,0 +1,178 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+from langchain_openai import OpenAIEmbeddings
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from services.llm_backend_pool import parse_hosts
+
+
+class DocumentIndex:
+    """Chunks of one conversation's documents with their normalized embeddings."""
+
+    def __init__(self, max_chunks: int) -> None:
+        self.max_chunks = max_chunks
+        self.chunks: list[dict] = []
+        self.vectors: np.ndarray | None = None
+        # Content hashes of the files indexed here
+        self.hashes: set[str] = set()
+
+    def add(self, chunks: list[dict], vectors: np.ndarray) -> None:
+        self.chunks.extend(chunks)
+        self.vectors = vectors if self.vectors is None else np.vstack([self.vectors, vectors])
+
+        # Keep the newest chunks when the index grows too big
+        excess = len(self.chunks) - self.max_chunks
+        if excess > 0:
+            self.chunks = self.chunks[excess:]
+            self.vectors = self.vectors[excess:]
+        self.hashes = {chunk["hash"] for chunk in self.chunks if chunk["hash"]}
+
+    def search(self, query_vector: np.ndarray, k: int, min_score: float = 0.0) -> list[dict]:
+        if self.vectors is None or not self.chunks:
+            return []
+
+        # Vectors are normalized, so the dot product is the cosine similarity
+        scores = self.vectors @ query_vector
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = [i for i in top if scores[i] >= min_score]
+
+        # Return in document order so excerpts read naturally
+        return [self.chunks[i] for i in sorted(top)]
+
+
+class DocumentRetriever:
+    """Chunks and embeds uploaded documents into per-conversation indexes and retrieves
+    the chunks relevant to a question. Indexes live in memory with LRU eviction.
+
+    A file already indexed for the conversation (same content hash) is not added again.
+    Chunks scoring below `min_score` are never returned; on a later turn without new
+    documents the question may be about something else entirely, so chunks must score
+    at least `followup_min_score` there.
+    """
+
+    def __init__(
+        self,
+        embeddings: OpenAIEmbeddings,
+        chunk_size: int = 1000,
+        chunk_overlap: int = 150,
+        top_k: int = 6,
+        min_score: float = 0.2,
+        followup_min_score: float = 0.45,
+        max_indexes: int = 64,
+        max_chunks: int = 5000,
+    ) -> None:
+        self.embeddings = embeddings
+        self.top_k = top_k
+        self.min_score = min_score
+        self.followup_min_score = followup_min_score
+        self.max_indexes = max_indexes
+        self.max_chunks = max_chunks
+        self.splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+        self._indexes: OrderedDict[str, DocumentIndex] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def has_index(self, conversation_id: str) -> bool:
+        with self._lock:
+            return conversation_id in self._indexes
+
+    def add_documents(self, conversation_id: str, documents: list[dict]) -> int:
+        """Indexes documents ({"name", "content", "hash"}) for a conversation. Returns the new chunk count."""
+        with self._lock:
+            index = self._indexes.get(conversation_id)
+            seen = set(index.hashes) if index is not None else set()
+
+        chunks = []
+        for doc in documents:
+            content_hash = doc.get("hash")
+            if content_hash in seen:
+                # Uploaded again, its chunks are already there
+                continue
+            if content_hash:
+                seen.add(content_hash)
+            for i, text in enumerate(self.splitter.split_text(doc["content"])):
+                chunks.append({"source": doc["name"], "part": i + 1, "text": text, "hash": content_hash})
+
+        if not chunks:
+            return 0
+
+        vectors = self._normalize(self.embeddings.embed_documents([c["text"] for c in chunks]))
+
+        with self._lock:
+            index = self._indexes.get(conversation_id)
+            if index is None:
+                index = DocumentIndex(self.max_chunks)
+                self._indexes[conversation_id] = index
+            # Another message may have indexed the same file while these were embedded
+            keep = [i for i, chunk in enumerate(chunks) if chunk["hash"] not in index.hashes]
+            if keep:
+                index.add([chunks[i] for i in keep], vectors[keep])
+            self._touch(conversation_id)
+
+        return len(keep)
+
+    def retrieve(self, conversation_id: str, query: str, followup: bool = False) -> list[dict]:
+        """Chunks relevant to the query; `followup` when the message brought no documents."""
+        with self._lock:
+            index = self._indexes.get(conversation_id)
+            if index is None:
+                return []
+            self._touch(conversation_id)
+
+        query_vector = self._normalize([self.embeddings.embed_query(query)])[0]
+
+        with self._lock:
+            min_score = max(self.min_score, self.followup_min_score) if followup else self.min_score
+            return index.search(query_vector, self.top_k, min_score)
+
+    def clear(self, conversation_id: str) -> None:
+        with self._lock:
+            self._indexes.pop(conversation_id, None)
+
+    def _touch(self, conversation_id: str) -> None:
+        # Call with the lock held
+        self._indexes.move_to_end(conversation_id)
+        while len(self._indexes) > self.max_indexes:
+            self._indexes.popitem(last=False)
+
+    @staticmethod
+    def _normalize(vectors) -> np.ndarray:
+        matrix = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+
+def create_embeddings(config) -> OpenAIEmbeddings | None:
+    """Client for EMBEDDING_MODEL, or None when no embedding model is configured."""
+    model = getattr(config, "EMBEDDING_MODEL", "")
+    if not model:
+        return None
+
+    return OpenAIEmbeddings(
+        model=model,
+        # Embeddings go to the first model endpoint
+        base_url=parse_hosts(config.LOCAL_HOST)[0],
+        api_key=config.API_KEY or "none",
+        # Local servers take raw text, not tiktoken ids
+        check_embedding_ctx_length=False,
+    )
+
+
+def create_document_retriever(config) -> DocumentRetriever | None:
+    """Returns a retriever when an embedding model is configured, otherwise None (inline documents)."""
+    embeddings = create_embeddings(config)
+    if embeddings is None:
+        return None
+
+    return DocumentRetriever(
+        embeddings,
+        chunk_size=config.RAG_CHUNK_SIZE,
+        chunk_overlap=config.RAG_CHUNK_OVERLAP,
+        top_k=config.RAG_TOP_K,
+        min_score=config.RAG_MIN_SCORE,
+        followup_min_score=getattr(config, "RAG_FOLLOWUP_MIN_SCORE", 0.45),
+        max_indexes=config.RAG_MAX_INDEXES,
+        max_chunks=config.RAG_MAX_CHUNKS,
+    )
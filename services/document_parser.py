@@ -0,0 +1,151 @@
+import io
+import os
+import time
+import signal
+import weakref
+import threading
+import multiprocessing
+from concurrent.futures import CancelledError, ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+import docx2txt
+from pypdf import PdfReader
+
+
+class ParseTimeoutError(Exception):
+    pass
+
+
+# Runs inside the worker processes, so it must stay a plain module-level function
+def parse_document(extension: str, data: bytes, max_pages: int, max_chars: int) -> str:
+    """Extracts text page by page and stops as soon as a page or character cap is hit."""
+    if extension == ".pdf":
+        reader = PdfReader(io.BytesIO(data))
+        total_pages = len(reader.pages)
+        parts = []
+        length = 0
+
+        for number, page in enumerate(reader.pages, start=1):
+            if number > max_pages:
+                parts.append(f"[... truncated after {max_pages} of {total_pages} pages ...]")
+                break
+            text = page.extract_text() or ""
+            remaining = max(max_chars - length, 0)
+            if len(text) > remaining:
+                parts.append(text[:remaining])
+                parts.append(f"[... truncated on page {number} of {total_pages} ...]")
+                break
+            parts.append(text)
+            length += len(text) + 1
+
+        return "\n".join(parts)
+
+    # DOCX has no pages, only the character cap applies
+    content = docx2txt.process(io.BytesIO(data))
+    if len(content) > max_chars:
+        content = content[:max_chars] + "\n[... truncated ...]"
+    return content
+
+
+# Runs in every new worker process: reports its pid so a hung worker can be killed
+def _report_pid(pids) -> None:
+    pids.put(os.getpid())
+
+
+class ParseJob:
+    """A document handed to DocumentParserPool, with its deadline counted from submit()."""
+
+    def __init__(self, extension: str, data: bytes, deadline: float) -> None:
+        self.extension = extension
+        self.data = data
+        self.deadline = deadline
+        self.executor: ProcessPoolExecutor | None = None
+        self.future = None
+        self.resubmitted = False
+
+
+class DocumentParserPool:
+    """Parses PDF/DOCX files in a bounded process pool with a timeout per file.
+
+    Heavy documents run on other cores and cannot stall the Slack worker threads. Every
+    file gets one deadline from the moment it is submitted, so waiting for N files takes
+    at most one timeout, not N. A process pool cannot stop a single task, so a file
+    that hits its deadline retires the pool it runs on: new files go to a fresh pool,
+    and the files that were sharing the old one are resubmitted there once (with a new
+    deadline counted from the retirement) instead of failing with BrokenProcessPool.
+    """
+
+    def __init__(self, max_workers: int | None = None, timeout: float = 60, max_pages: int = 300, max_chars: int = 500_000) -> None:
+        self.max_workers = max_workers or min(4, os.cpu_count() or 1)
+        self.timeout = timeout
+        self.max_pages = max_pages
+        self.max_chars = max_chars
+
+        self._executor: ProcessPoolExecutor | None = None
+        # Retired pool -> when it was retired
+        self._retired: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+        # Pool -> queue its workers report their pids on
+        self._pids: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def submit(self, extension: str, data: bytes) -> ParseJob:
+        job = ParseJob(extension, data, time.monotonic() + self.timeout)
+        self._start(job)
+        return job
+
+    def result(self, job: ParseJob) -> str:
+        while True:
+            try:
+                return job.future.result(timeout=max(job.deadline - time.monotonic(), 0))
+            except FutureTimeoutError:
+                self._retire(job.executor)
+                raise ParseTimeoutError(f"parsing took longer than {self.timeout}s")
+            except (BrokenProcessPool, CancelledError):
+                # Its pool was retired by another file's timeout, or a worker crashed
+                self._retire(job.executor)
+                if job.resubmitted:
+                    raise
+                # A full timeout from when its pool went down, the same for every file on it
+                job.resubmitted = True
+                job.deadline = self._retired.get(job.executor, time.monotonic()) + self.timeout
+                self._start(job)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def _start(self, job: ParseJob) -> None:
+        job.executor = self._get_executor()
+        job.future = job.executor.submit(parse_document, job.extension, job.data, self.max_pages, self.max_chars)
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                pids = multiprocessing.SimpleQueue()
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers, initializer=_report_pid, initargs=(pids,)
+                )
+                self._pids[self._executor] = pids
+            return self._executor
+
+    def _retire(self, executor: ProcessPoolExecutor | None) -> None:
+        with self._lock:
+            if executor is None:
+                return
+            if self._executor is executor:
+                self._executor = None
+            self._retired.setdefault(executor, time.monotonic())
+            pids = self._pids.pop(executor, None)
+
+        # Queued files get CancelledError (or BrokenProcessPool once the workers are
+        # gone) and their result() call resubmits them to a fresh pool
+        executor.shutdown(wait=False, cancel_futures=True)
+
+        # shutdown() cannot stop a running task, so end the pool's workers ourselves
+        while pids is not None and not pids.empty():
+            try:
+                os.kill(pids.get(), signal.SIGTERM)
+            except OSError:
+                # Already gone
+                pass
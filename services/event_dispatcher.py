@@ -0,0 +1,179 @@
+import time
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+class _DispatcherStats:
+    """Queue and wait-time counters shared by both dispatchers."""
+
+    max_workers = 0
+    _queues: dict
+
+    def _reset_stats(self) -> None:
+        self._stats_lock = threading.Lock()
+        self._queued = 0
+        self._active = 0
+        self._processed = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._last_wait = 0.0
+
+    def _record_queued(self) -> None:
+        with self._stats_lock:
+            self._queued += 1
+
+    def _record_start(self) -> None:
+        with self._stats_lock:
+            self._queued -= 1
+            self._active += 1
+
+    def _record_dropped(self, count: int) -> None:
+        # Queued work that will never run (its task was cancelled on shutdown)
+        with self._stats_lock:
+            self._queued -= count
+
+    def _record_done(self, wait: float) -> None:
+        with self._stats_lock:
+            self._active -= 1
+            self._processed += 1
+            self._total_wait += wait
+            self._last_wait = wait
+            self._max_wait = max(self._max_wait, wait)
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                "workers": self.max_workers,
+                "queue_depth": self._queued,
+                "active": self._active,
+                "conversations": len(self._queues),
+                "processed": self._processed,
+                "avg_wait_seconds": self._total_wait / self._processed if self._processed else 0.0,
+                "max_wait_seconds": self._max_wait,
+                "last_wait_seconds": self._last_wait,
+            }
+
+
+class ConversationDispatcher(_DispatcherStats):
+    """Runs Slack event work on a bounded worker pool.
+
+    Work for the same conversation runs strictly in arrival order, one item at a time,
+    while different conversations run in parallel on the pool.
+    """
+
+    def __init__(self, max_workers: int = 4) -> None:
+        self.max_workers = max_workers
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="slack-worker")
+        self._queues: dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+        self._reset_stats()
+
+    def submit(self, conversation_id: str, fn, *args) -> None:
+        """Queues fn(*args) behind any pending work of the same conversation and returns at once."""
+        item = (fn, args, time.perf_counter())
+
+        self._record_queued()
+        with self._lock:
+            queue = self._queues.get(conversation_id)
+            if queue is not None:
+                # A worker already owns this conversation, it will pick this up in order
+                queue.append(item)
+                return
+            self._queues[conversation_id] = deque([item])
+
+        self._pool.submit(self._run_next, conversation_id)
+
+    def _run_next(self, conversation_id: str) -> None:
+        with self._lock:
+            fn, args, queued_at = self._queues[conversation_id][0]
+        self._record_start()
+
+        wait = time.perf_counter() - queued_at
+        try:
+            fn(*args)
+        except Exception as e:
+            print(f"Worker error in {conversation_id}: {e}")
+        finally:
+            self._record_done(wait)
+            with self._lock:
+                queue = self._queues[conversation_id]
+                queue.popleft()
+                has_more = bool(queue)
+                if not has_more:
+                    del self._queues[conversation_id]
+
+        # Re-queue instead of looping so a busy conversation cannot hog a worker
+        if has_more:
+            self._pool.submit(self._run_next, conversation_id)
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+class AsyncConversationDispatcher(_DispatcherStats):
+    """ConversationDispatcher for the asyncio runtime.
+
+    Each conversation with pending events gets one task that awaits its handlers in
+    arrival order; a semaphore bounds how many handlers run at once. submit() must be
+    called on the event loop.
+    """
+
+    def __init__(self, max_concurrency: int = 100) -> None:
+        self.max_workers = max_concurrency
+        self._queues: dict[str, deque] = {}
+        self._tasks: set[asyncio.Task] = set()
+        # Created on first use, the bot gets a new event loop on every start
+        self._semaphore: asyncio.Semaphore | None = None
+        self._loop = None
+
+        self._reset_stats()
+
+    def submit(self, conversation_id: str, fn, *args) -> None:
+        """Queues the coroutine fn(*args) behind any pending work of the same conversation."""
+        item = (fn, args, time.perf_counter())
+        self._record_queued()
+
+        queue = self._queues.get(conversation_id)
+        if queue is not None:
+            # The conversation's task is still running, it will pick this up in order
+            queue.append(item)
+            return
+        self._queues[conversation_id] = deque([item])
+
+        task = asyncio.get_running_loop().create_task(self._drain(conversation_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _drain(self, conversation_id: str) -> None:
+        queue = self._queues[conversation_id]
+        try:
+            while queue:
+                async with self._get_semaphore():
+                    # Taken off only once it starts, so the queue holds exactly what never ran
+                    fn, args, queued_at = queue.popleft()
+                    self._record_start()
+                    wait = time.perf_counter() - queued_at
+                    try:
+                        await fn(*args)
+                    except Exception as e:
+                        print(f"Worker error in {conversation_id}: {e}")
+                    finally:
+                        self._record_done(wait)
+        finally:
+            # Cancelled by shutdown(): what is left will not run, stop counting it as queued
+            self._record_dropped(len(queue))
+            del self._queues[conversation_id]
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_workers)
+            self._loop = loop
+        return self._semaphore
+
+    def shutdown(self) -> None:
+        for task in list(self._tasks):
+            task.cancel()
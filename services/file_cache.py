@@ -0,0 +1,145 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+
+
+class FileCache:
+    """Content-addressed disk cache for extracted file text and image bytes.
+
+    Entries are stored under the SHA-256 of the original file. A second index maps a
+    Slack file key (id + size + timestamp) to that hash, so a file that was seen before
+    is served without downloading it again, and the same content uploaded as a new
+    Slack file is served without parsing it again. The least recently used entries are
+    evicted when the cache grows over `max_bytes`.
+    """
+
+    def __init__(self, directory: str = ".file_cache", max_bytes: int = 200 * 1024 * 1024) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(directory, "index.db"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " hash TEXT PRIMARY KEY,"
+            " kind TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS file_keys ("
+            " file_key TEXT PRIMARY KEY,"
+            " hash TEXT NOT NULL)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def file_key(file_info: dict) -> str | None:
+        file_id = file_info.get("id")
+        if not file_id:
+            return None
+        return f"{file_id}:{file_info.get('size', '')}:{file_info.get('timestamp', '')}"
+
+    @staticmethod
+    def hash_bytes(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+    def lookup(self, file_key: str | None) -> str | None:
+        """Returns the content hash of a Slack file that was cached before."""
+        if not file_key:
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT f.hash FROM file_keys f JOIN entries e ON e.hash = f.hash WHERE f.file_key = ?",
+                (file_key,),
+            ).fetchone()
+        return row[0] if row else None
+
+    def get(self, content_hash: str, kind: str):
+        """Returns cached text (kind "text") or bytes (kind "image"), or None."""
+        path = self._path(content_hash, kind)
+        # Read under the lock so _evict() cannot remove the file halfway
+        with self._lock, self._conn:
+            try:
+                if kind == "text":
+                    with open(path, "r", encoding="utf-8") as f:
+                        value = f.read()
+                else:
+                    with open(path, "rb") as f:
+                        value = f.read()
+            except FileNotFoundError:
+                # Deleted behind our back, forget it so lookup() stops pointing at it
+                self._conn.execute("DELETE FROM entries WHERE hash = ? AND kind = ?", (content_hash, kind))
+                return None
+            except OSError:
+                return None
+
+            self._conn.execute("UPDATE entries SET last_used = ? WHERE hash = ?", (time.time(), content_hash))
+        return value
+
+    def put(self, file_key: str | None, content_hash: str, kind: str, value) -> None:
+        path = self._path(content_hash, kind)
+        data = value.encode("utf-8") if kind == "text" else value
+
+        # Write to a temp name first so readers never see a partial file
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+        with self._lock:
+            with self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO entries (hash, kind, size, last_used) VALUES (?, ?, ?, ?)",
+                    (content_hash, kind, len(data), time.time()),
+                )
+                if file_key:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO file_keys (file_key, hash) VALUES (?, ?)",
+                        (file_key, content_hash),
+                    )
+            self._evict()
+
+    def link(self, file_key: str | None, content_hash: str) -> None:
+        """Points a new Slack file key at already cached content."""
+        if not file_key:
+            return
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO file_keys (file_key, hash) VALUES (?, ?)",
+                (file_key, content_hash),
+            )
+
+    def _evict(self) -> None:
+        # Call with the lock held
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        rows = self._conn.execute("SELECT hash, kind, size FROM entries ORDER BY last_used").fetchall()
+        with self._conn:
+            for content_hash, kind, size in rows:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(self._path(content_hash, kind))
+                except OSError:
+                    pass
+                self._conn.execute("DELETE FROM entries WHERE hash = ?", (content_hash,))
+                self._conn.execute("DELETE FROM file_keys WHERE hash = ?", (content_hash,))
+                total -= size
+
+    def _path(self, content_hash: str, kind: str) -> str:
+        extension = "txt" if kind == "text" else "bin"
+        return os.path.join(self.directory, f"{content_hash}.{extension}")
+
+
+def create_file_cache(config) -> FileCache | None:
+    directory = getattr(config, "FILE_CACHE_DIR", "")
+    if not directory:
+        return None
+    return FileCache(directory, max_bytes=int(getattr(config, "FILE_CACHE_MAX_MB", 200)) * 1024 * 1024)
@@ -0,0 +1,280 @@
+import io
+import os
+import asyncio
+import hashlib
+import aiohttp
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from services.document_parser import DocumentParserPool
+from services.image_service import ImagePreprocessor, sniff_mime
+from services.async_http import LoopBoundSession
+
+PDF_EXTENSIONS = [".pdf"]
+DOCX_EXTENSIONS = [".docx", ".doc"]
+TEXT_EXTENSIONS = [".txt", ".md", ".py", ".json", ".csv"]
+IMAGE_EXTENSIONS = [".png", ".jpg", ".jpeg", ".webp"]
+
+
+class FileTooLargeError(Exception):
+    pass
+
+
+class FileService:
+    """Downloads Slack attachments and extracts their text and images.
+
+    Attachments are downloaded in parallel over one pooled session and kept in memory,
+    nothing is written to the working directory. PDF/DOCX parsing is offloaded to a
+    process pool with a timeout and page/character caps. With a FileCache, files seen
+    before are neither downloaded nor parsed again. adownload() is the aiohttp version
+    used by the asyncio runtime.
+    """
+
+    def __init__(
+        self,
+        cache=None,
+        parser_pool=None,
+        image_preprocessor=None,
+        max_workers: int = 4,
+        max_file_bytes: int = 50 * 1024 * 1024,
+    ) -> None:
+        self.cache = cache
+        # PDF/DOCX parsing runs in separate processes
+        self.parser_pool = parser_pool or DocumentParserPool()
+        self.image_preprocessor = image_preprocessor or ImagePreprocessor()
+        self.max_workers = max_workers
+        self.max_file_bytes = max_file_bytes
+
+        # Keep-alive connections to files.slack.com are reused across downloads
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        # aiohttp session for adownload() (asyncio runtime)
+        self.async_session = LoopBoundSession()
+
+    # DOWNLOAD STAGE
+    def download(self, files, token) -> list[dict]:
+        files = [f for f in files if f.get("url_private_download")]
+        if not files:
+            return []
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(files))) as pool:
+            results = pool.map(lambda file_info: self._download_one(file_info, token), files)
+            # Keep the upload order, drop failed downloads
+            return [item for item in results if item is not None]
+
+    def _download_one(self, file_info, token) -> dict | None:
+        file_name, extension, file_key, cached = self._from_cache(file_info)
+        if cached is not None:
+            return cached
+
+        try:
+            self._check_size(file_info)
+
+            with self.session.get(
+                file_info["url_private_download"],
+                headers={"Authorization": f"Bearer {token}"},
+                stream=True,
+                timeout=(5, 60),
+            ) as resp:
+                if resp.status_code != 200:
+                    print(f"Download of {file_name} failed: {resp.status_code}")
+                    return None
+
+                buffer = io.BytesIO()
+                hasher = hashlib.sha256()
+                for chunk in resp.iter_content(chunk_size=65536):
+                    self._append_chunk(buffer, hasher, chunk)
+
+            return self._downloaded_item(file_name, extension, file_key, buffer, hasher)
+
+        except FileTooLargeError as e:
+            print(f"Skipping {file_name}: file too large ({e})")
+        except Exception as e:
+            print(f"Error downloading {file_name}: {e}")
+        return None
+
+    async def adownload(self, files, token) -> list[dict]:
+        """download() for the asyncio runtime: concurrent aiohttp requests, no threads."""
+        files = [f for f in files if f.get("url_private_download")]
+        if not files:
+            return []
+
+        limit = asyncio.Semaphore(self.max_workers)
+        session = self.async_session.get()
+        results = await asyncio.gather(*(self._adownload_one(session, limit, f, token) for f in files))
+        # Keep the upload order, drop failed downloads
+        return [item for item in results if item is not None]
+
+    async def _adownload_one(self, session, limit, file_info, token) -> dict | None:
+        file_name, extension, file_key, cached = self._from_cache(file_info)
+        if cached is not None:
+            return cached
+
+        try:
+            self._check_size(file_info)
+
+            async with limit:
+                async with session.get(
+                    file_info["url_private_download"],
+                    headers={"Authorization": f"Bearer {token}"},
+                    timeout=aiohttp.ClientTimeout(sock_connect=5, sock_read=60),
+                ) as resp:
+                    if resp.status != 200:
+                        print(f"Download of {file_name} failed: {resp.status}")
+                        return None
+
+                    buffer = io.BytesIO()
+                    hasher = hashlib.sha256()
+                    async for chunk in resp.content.iter_chunked(65536):
+                        self._append_chunk(buffer, hasher, chunk)
+
+            return self._downloaded_item(file_name, extension, file_key, buffer, hasher)
+
+        except FileTooLargeError as e:
+            print(f"Skipping {file_name}: file too large ({e})")
+        except Exception as e:
+            print(f"Error downloading {file_name}: {e}")
+        return None
+
+    def _from_cache(self, file_info):
+        file_name = file_info.get("name")
+        extension = os.path.splitext(file_name)[1].lower()
+
+        # Known Slack file: serve it from the cache without downloading
+        file_key = self.cache.file_key(file_info) if self.cache else None
+        content_hash = self.cache.lookup(file_key) if self.cache else None
+        if content_hash:
+            # Read it now; if it was evicted in the meantime the file is downloaded after all
+            kind = "image" if extension in IMAGE_EXTENSIONS else "text"
+            value = self.cache.get(content_hash, kind)
+            if value is None:
+                print(f"Cached file {file_name} is no longer available, downloading it again")
+                return file_name, extension, file_key, None
+            cached = {
+                "name": file_name,
+                "extension": extension,
+                "data": None,
+                "cached": value,
+                "key": file_key,
+                "hash": content_hash,
+            }
+            return file_name, extension, file_key, cached
+        return file_name, extension, file_key, None
+
+    def _check_size(self, file_info) -> None:
+        # Slack reports the size up front, refuse oversized files before downloading
+        if int(file_info.get("size") or 0) > self.max_file_bytes:
+            raise FileTooLargeError(f"{file_info.get('size')} bytes")
+
+    def _append_chunk(self, buffer, hasher, chunk) -> None:
+        buffer.write(chunk)
+        hasher.update(chunk)
+        if buffer.tell() > self.max_file_bytes:
+            raise FileTooLargeError(f"over {self.max_file_bytes} bytes")
+
+    @staticmethod
+    def _downloaded_item(file_name, extension, file_key, buffer, hasher) -> dict:
+        return {
+            "name": file_name,
+            "extension": extension,
+            "data": buffer.getvalue(),
+            "key": file_key,
+            "hash": hasher.hexdigest(),
+        }
+
+    # DOCUMENT STAGE
+    def extract_texts(self, downloaded) -> list[dict]:
+        # PDF/DOCX go to the parser processes all at once; slots keep the upload order
+        slots = []
+
+        for item in downloaded:
+            extension = item["extension"]
+            if extension in IMAGE_EXTENSIONS:
+                continue
+
+            cached = self._cached(item, "text")
+            if cached is not None:
+                slots.append({"name": item["name"], "content": cached, "hash": item["hash"]})
+                continue
+
+            try:
+                if extension in PDF_EXTENSIONS or extension in DOCX_EXTENSIONS:
+                    slots.append((item, self.parser_pool.submit(extension, item["data"])))
+                    continue
+                elif extension in TEXT_EXTENSIONS:
+                    content = item["data"].decode("utf-8")
+                else:
+                    print(f"Unsupported file type: {extension}")
+                    continue
+
+                slots.append({"name": item["name"], "content": content, "hash": item["hash"]})
+                self._store(item, "text", content)
+
+            except Exception as e:
+                print(f"Error processing {item['name']}: {e}")
+
+        extracted_text = []
+        for slot in slots:
+            if isinstance(slot, dict):
+                extracted_text.append(slot)
+                continue
+
+            item, job = slot
+            try:
+                # Each job's deadline started at submit(), waiting in order adds no extra time
+                content = self.parser_pool.result(job)
+                extracted_text.append({"name": item["name"], "content": content, "hash": item["hash"]})
+                self._store(item, "text", content)
+            except Exception as e:
+                print(f"Error processing {item['name']}: {e}")
+
+        return extracted_text
+
+    # IMAGE STAGE
+    def extract_images(self, downloaded) -> list[dict]:
+        extracted_images = []
+
+        for item in downloaded:
+            if item["extension"] not in IMAGE_EXTENSIONS:
+                continue
+
+            try:
+                # The cache holds the already downscaled bytes
+                data = self._cached(item, "image")
+                if data is None:
+                    data = self.image_preprocessor.prepare(item["data"], item["name"])
+                    self._store(item, "image", data)
+
+                # Base64 encoding is left to the vision call, which is the only one that needs it
+                extracted_images.append({
+                    "filename": item["name"],
+                    "mime": sniff_mime(data),
+                    "data": data,
+                })
+            except Exception as e:
+                print(f"Error processing {item['name']}: {e}")
+
+        return extracted_images
+
+    # CACHE HELPERS
+    def _cached(self, item, kind):
+        # Served from the cache instead of downloaded: the content was read in _from_cache
+        if item.get("cached") is not None:
+            return item["cached"]
+        if self.cache is None:
+            return None
+        value = self.cache.get(item["hash"], kind)
+        if value is not None:
+            # Same content under a new Slack file id: remember it for next time
+            self.cache.link(item["key"], item["hash"])
+        return value
+
+    def _store(self, item, kind, value) -> None:
+        if self.cache is None:
+            return
+        try:
+            self.cache.put(item["key"], item["hash"], kind, value)
+        except Exception as e:
+            print(f"File cache write failed: {e}")
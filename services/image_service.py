@@ -0,0 +1,62 @@
+import io
+from PIL import Image, ImageOps
+
+
+def sniff_mime(data: bytes) -> str:
+    """Detects the image type from its first bytes (file names and Slack types can lie)."""
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if data.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    if data[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    return "image/png"
+
+
+class ImagePreprocessor:
+    """Downscales uploads to what the vision model can use and re-encodes them compactly.
+
+    Photos become JPEG, images with transparency stay PNG. If re-encoding does not make
+    an image smaller and no resize was needed, the original bytes are kept.
+    """
+
+    def __init__(self, max_side: int = 1024, jpeg_quality: int = 85) -> None:
+        self.max_side = max_side
+        self.jpeg_quality = jpeg_quality
+
+    def prepare(self, data: bytes, filename: str = "") -> bytes:
+        try:
+            image = Image.open(io.BytesIO(data))
+            # Phone photos store their rotation in EXIF, apply it before resizing
+            image = ImageOps.exif_transpose(image)
+        except Exception as e:
+            print(f"[Images] Could not decode {filename}, sending as is: {e}")
+            return data
+
+        resized = max(image.size) > self.max_side
+        if resized:
+            image.thumbnail((self.max_side, self.max_side), Image.LANCZOS)
+
+        output = io.BytesIO()
+        if self._has_alpha(image):
+            image.save(output, format="PNG", optimize=True)
+        else:
+            image.convert("RGB").save(output, format="JPEG", quality=self.jpeg_quality, optimize=True)
+        prepared = output.getvalue()
+
+        if not resized and len(prepared) >= len(data):
+            prepared = data
+
+        saved = len(data) - len(prepared)
+        if saved > 0:
+            print(
+                f"[Images] {filename}: {len(data) / 1024:.0f}KB -> {len(prepared) / 1024:.0f}KB "
+                f"({saved / 1024:.0f}KB saved, {image.size[0]}x{image.size[1]})"
+            )
+        return prepared
+
+    @staticmethod
+    def _has_alpha(image) -> bool:
+        return image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
@@ -0,0 +1,196 @@
+import time
+import threading
+from collections import OrderedDict
+import requests
+import openai
+from services.metrics import ERRORS
+
+
+def parse_hosts(value: str) -> list[str]:
+    """Comma separated endpoint list -> clean URLs (trailing slashes removed)."""
+    return [host.strip().rstrip("/") for host in (value or "").split(",") if host.strip()]
+
+
+def is_connection_error(error: Exception) -> bool:
+    """Errors after which the same request can be sent to another backend."""
+    return isinstance(error, (openai.APIConnectionError, requests.ConnectionError, ConnectionError))
+
+
+def is_transient_error(error: Exception) -> bool:
+    """Rate limits and server errors of a backend that is up; another backend may serve the request."""
+    return isinstance(error, openai.APIStatusError) and (error.status_code == 429 or error.status_code >= 500)
+
+
+class Backend:
+    def __init__(self, url: str) -> None:
+        self.url = url
+        self.healthy = True
+        self.outstanding = 0
+        self.requests = 0
+        self.failures = 0
+        self.last_error: str | None = None
+        self.last_probe: float | None = None
+
+
+class NoBackendError(Exception):
+    pass
+
+
+class LLMBackendPool:
+    """OpenAI-compatible endpoints serving one model, with least-outstanding-requests routing.
+
+    acquire() picks the healthy backend with the fewest requests in flight. A backend
+    that fails with a connection error is marked down right away; a background thread
+    probes every backend's /models endpoint each `probe_interval` seconds and brings
+    recovered ones back. With a single endpoint no probing is done.
+
+    With an affinity key (the conversation id) a conversation keeps going to the same
+    backend so its prompt prefix stays in that server's KV cache. It only moves when
+    its backend is down or has `max_imbalance` more requests in flight than the least
+    busy one.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        urls: list[str],
+        api_key: str = "",
+        probe_interval: float = 15,
+        probe_timeout: float = 3,
+        max_imbalance: int = 4,
+        max_affinities: int = 10000,
+    ) -> None:
+        if not urls:
+            raise ValueError(f"No endpoints configured for the {name} pool")
+        self.name = name
+        self.backends = [Backend(url) for url in urls]
+        self.api_key = api_key
+        self.probe_interval = probe_interval
+        self.probe_timeout = probe_timeout
+        self.max_imbalance = max_imbalance
+        self.max_affinities = max_affinities
+
+        # affinity key -> backend url, least recently used first
+        self._affinity: OrderedDict[str, str] = OrderedDict()
+        self.affinity_hits = 0
+        self.affinity_moves = 0
+
+        self._lock = threading.Lock()
+        self._next = 0
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        if len(self.backends) > 1 and probe_interval > 0:
+            self._thread = threading.Thread(target=self._probe_loop, daemon=True)
+            self._thread.start()
+
+    @property
+    def urls(self) -> list[str]:
+        return [backend.url for backend in self.backends]
+
+    def acquire(self, exclude: set[str] | None = None, affinity_key: str | None = None) -> Backend:
+        """Reserves the least busy healthy backend not in `exclude`. Call release() after."""
+        exclude = exclude or set()
+        with self._lock:
+            candidates = [b for b in self.backends if b.url not in exclude]
+            if not candidates:
+                raise NoBackendError(f"All {self.name} backends failed")
+            # If every backend is marked down, still try them: the probe may lag behind
+            healthy = [b for b in candidates if b.healthy] or candidates
+
+            # Rotate the start so ties are spread instead of always hitting the first one
+            self._next = (self._next + 1) % len(healthy)
+            ordered = healthy[self._next:] + healthy[:self._next]
+            backend = min(ordered, key=lambda b: b.outstanding)
+
+            if affinity_key is not None and len(self.backends) > 1:
+                backend = self._sticky(affinity_key, healthy, backend)
+
+            backend.outstanding += 1
+            backend.requests += 1
+            return backend
+
+    def pinned(self, affinity_key: str) -> str | None:
+        """The backend url the key is currently pinned to, if any."""
+        with self._lock:
+            return self._affinity.get(affinity_key)
+
+    def _sticky(self, affinity_key: str, healthy: list[Backend], least_busy: Backend) -> Backend:
+        # Call with the lock held
+        url = self._affinity.get(affinity_key)
+        pinned = next((b for b in healthy if b.url == url), None)
+
+        if pinned is not None and pinned.outstanding - least_busy.outstanding < self.max_imbalance:
+            self._affinity.move_to_end(affinity_key)
+            self.affinity_hits += 1
+            return pinned
+
+        # New conversation, or its backend is down/overloaded: pin it to the least busy one
+        if url is not None:
+            self.affinity_moves += 1
+        self._affinity[affinity_key] = least_busy.url
+        self._affinity.move_to_end(affinity_key)
+        while len(self._affinity) > self.max_affinities:
+            self._affinity.popitem(last=False)
+        return least_busy
+
+    def release(self, backend: Backend, error: Exception | None = None) -> None:
+        with self._lock:
+            backend.outstanding -= 1
+            if error is not None:
+                ERRORS.inc(component=f"llm_{self.name}")
+            if error is not None and is_connection_error(error):
+                backend.failures += 1
+                backend.last_error = str(error)
+                if backend.healthy and len(self.backends) > 1:
+                    print(f"[LLM] {self.name} backend {backend.url} marked down: {error}")
+                backend.healthy = False
+
+    def affinity_stats(self) -> dict:
+        with self._lock:
+            return {
+                "pinned_conversations": len(self._affinity),
+                "hits": self.affinity_hits,
+                "moves": self.affinity_moves,
+            }
+
+    def stats(self) -> list[dict]:
+        with self._lock:
+            return [
+                {
+                    "url": b.url,
+                    "healthy": b.healthy,
+                    "outstanding": b.outstanding,
+                    "requests": b.requests,
+                    "failures": b.failures,
+                    "last_error": b.last_error,
+                }
+                for b in self.backends
+            ]
+
+    def close(self) -> None:
+        self._stop.set()
+
+    # HEALTH PROBES
+    def _probe_loop(self) -> None:
+        session = requests.Session()
+        session.trust_env = False # Local inference servers, ignore system proxies
+        headers = {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+
+        while not self._stop.wait(self.probe_interval):
+            for backend in self.backends:
+                try:
+                    response = session.get(f"{backend.url}/models", headers=headers, timeout=self.probe_timeout)
+                    healthy = response.status_code < 500
+                    error = None if healthy else f"HTTP {response.status_code}"
+                except Exception as e:
+                    healthy, error = False, str(e)
+
+                with self._lock:
+                    if healthy and not backend.healthy:
+                        print(f"[LLM] {self.name} backend {backend.url} is back up")
+                    elif not healthy and backend.healthy:
+                        print(f"[LLM] {self.name} backend {backend.url} failed its health probe: {error}")
+                    backend.healthy = healthy
+                    backend.last_probe = time.time()
+                    if error:
+                        backend.last_error = error
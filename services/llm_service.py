@@ -1,139 +1,1020 @@
+import time
+import zlib
+import base64
+import asyncio
+import hashlib
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.messages import HumanMessage, AIMessage
+from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
+from langchain_core.callbacks import AsyncCallbackHandler, BaseCallbackHandler
 from langchain.agents import create_tool_calling_agent, AgentExecutor
-# Import tool 
+from services.parallel_agent import ParallelAgentExecutor
+# Import tool
 from tools.time_tool import get_current_date, get_current_time
 from tools.serper_web_search import SerperSearchTool
 from tools.comfy_tool import ComfyUIImageTool
+from services.file_service import FileService
+from services.file_cache import create_file_cache
+from services.document_parser import DocumentParserPool
+from services.image_service import ImagePreprocessor
+from services.vision_cache import create_vision_cache
+from services.request_context import RequestContext, current_request, request_scope
+from services.memory_store import create_memory_store, message_fingerprint
+from services.token_counter import TokenCounter
+from services.summarizer import ConversationSummarizer
+from services.document_index import create_document_retriever
+from services.response_cache import create_response_cache
+from services.trace_log import create_trace_log
+from services.llm_backend_pool import LLMBackendPool, is_connection_error, is_transient_error, parse_hosts
+from services import metrics
 from config import Config
 
+class StreamCallbackHandler(BaseCallbackHandler):
+    """Forwards LLM tokens and tool phases from the agent to a streamer (see SlackStreamer)."""
+
+    def __init__(self, streamer) -> None:
+        self.streamer = streamer
+
+    def on_llm_start(self, serialized, prompts, **kwargs) -> None:
+        self.streamer.on_llm_start()
+
+    def on_chat_model_start(self, serialized, messages, **kwargs) -> None:
+        self.streamer.on_llm_start()
+
+    def on_llm_new_token(self, token: str, **kwargs) -> None:
+        self.streamer.on_token(token)
+
+    def on_tool_start(self, serialized, input_str, **kwargs) -> None:
+        self.streamer.on_tool((serialized or {}).get("name") or kwargs.get("name"))
+
+    def on_tool_end(self, output, **kwargs) -> None:
+        self.streamer.on_tool(None)
+
+    def on_tool_error(self, error, **kwargs) -> None:
+        self.streamer.on_tool(None)
+
+
+class AsyncStreamCallbackHandler(AsyncCallbackHandler):
+    """StreamCallbackHandler for ainvoke, forwards to an AsyncSlackStreamer."""
+
+    def __init__(self, streamer) -> None:
+        self.streamer = streamer
+
+    async def on_llm_start(self, serialized, prompts, **kwargs) -> None:
+        await self.streamer.on_llm_start()
+
+    async def on_chat_model_start(self, serialized, messages, **kwargs) -> None:
+        await self.streamer.on_llm_start()
+
+    async def on_llm_new_token(self, token: str, **kwargs) -> None:
+        await self.streamer.on_token(token)
+
+    async def on_tool_start(self, serialized, input_str, **kwargs) -> None:
+        await self.streamer.on_tool((serialized or {}).get("name") or kwargs.get("name"))
+
+    async def on_tool_end(self, output, **kwargs) -> None:
+        await self.streamer.on_tool(None)
+
+    async def on_tool_error(self, error, **kwargs) -> None:
+        await self.streamer.on_tool(None)
+
+
+class LLMTimingCallbackHandler(BaseCallbackHandler):
+    """Splits every streamed model call into prefill (until the first token) and decode time.
+
+    Prefill is where a prompt-prefix (KV cache) hit shows up, so each call is tagged
+    with its backend and whether the conversation stayed on its pinned backend.
+    """
+
+    # ainvoke: called on the event loop rather than in an executor, so the timestamps are
+    # not delayed (run_inline only affects the async callback manager)
+    run_inline = True
+
+    def __init__(self, service, context, backend_url: str, sticky: bool) -> None:
+        self.service = service
+        self.context = context
+        self.backend_url = backend_url
+        self.sticky = sticky
+        self._calls = {}
+        # invoke: the callbacks run on whichever thread makes the call
+        self._lock = threading.Lock()
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs) -> None:
+        prompt_tokens = sum(self.service.token_counter.count_message(m) for batch in messages for m in batch)
+        with self._lock:
+            self._calls[run_id] = {"start": time.perf_counter(), "first": None, "tokens": 0, "prompt_tokens": prompt_tokens}
+
+    def on_llm_new_token(self, token: str, *, run_id, **kwargs) -> None:
+        if not token:
+            return
+        with self._lock:
+            call = self._calls.get(run_id)
+            if call is None:
+                return
+            if call["first"] is None:
+                call["first"] = time.perf_counter()
+                if self.context is not None:
+                    self.context.output_started = True
+            call["tokens"] += 1
+
+    def on_llm_end(self, response, *, run_id, **kwargs) -> None:
+        with self._lock:
+            call = self._calls.pop(run_id, None)
+        if call is None:
+            return
+        end = time.perf_counter()
+        # A call that only returned tool calls streams no text, all of it counts as prefill
+        first = call["first"] or end
+        record = {
+            "backend": self.backend_url,
+            "sticky": self.sticky,
+            "prefill": first - call["start"],
+            "decode": end - first,
+            "prompt_tokens": call["prompt_tokens"],
+            "tokens": call["tokens"],
+        }
+        self.service.record_llm_call(self.context, record)
+
+    def on_llm_error(self, error, *, run_id, **kwargs) -> None:
+        with self._lock:
+            self._calls.pop(run_id, None)
+
+
+class ToolMetricsCallbackHandler(BaseCallbackHandler):
+    """Counts and times the agent's tool calls for /metrics and the request's trace record."""
+
+    # ainvoke: called on the event loop rather than in an executor (run_inline only
+    # affects the async callback manager)
+    run_inline = True
+
+    def __init__(self, context=None) -> None:
+        self.context = context
+        self._calls = {}
+        # invoke: the tools of one step, and so their callbacks, run on several threads
+        self._lock = threading.Lock()
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs) -> None:
+        name = (serialized or {}).get("name") or kwargs.get("name") or "unknown"
+        with self._lock:
+            self._calls[run_id] = (name, time.perf_counter())
+        # Recorded on start: a tool that times out or fails still decides what may be cached
+        if self.context is not None:
+            self.context.add_tool_used(name)
+            self.context.output_started = True
+
+    def on_tool_end(self, output, *, run_id, **kwargs) -> None:
+        self._finish(run_id, "ok")
+
+    def on_tool_error(self, error, *, run_id, **kwargs) -> None:
+        self._finish(run_id, "error")
+
+    def _finish(self, run_id, status: str) -> None:
+        with self._lock:
+            call = self._calls.pop(run_id, None)
+        if call is None:
+            return
+        name, start = call
+        seconds = time.perf_counter() - start
+        metrics.TOOL_CALLS.inc(tool=name, status=status)
+        metrics.TOOL_SECONDS.observe(seconds, tool=name)
+        if self.context is not None:
+            self.context.add_tool_call({"tool": name, "seconds": round(seconds, 4), "status": status})
+        if status == "error":
+            metrics.ERRORS.inc(component="tool")
+
+
 class LLMService:
+    # Tool profiles an agent can be built with
+    PROFILE_TEXT = "text"
+    PROFILE_IMAGES = "images"
+
     def __init__(self, config: Config) -> None:
+        # Memory (SQLite with a hot LRU cache, or in-process dict)
+        self.memory = create_memory_store(config)
+
+        self.file_service = FileService(
+            cache=create_file_cache(config),
+            parser_pool=DocumentParserPool(
+                max_workers=getattr(config, "PARSER_WORKERS", 0) or None,
+                timeout=getattr(config, "PARSE_TIMEOUT", 60),
+                max_pages=getattr(config, "PARSE_MAX_PAGES", 300),
+                max_chars=getattr(config, "PARSE_MAX_CHARS", 500_000),
+            ),
+            image_preprocessor=ImagePreprocessor(
+                max_side=getattr(config, "VISION_MAX_SIDE", 1024),
+                jpeg_quality=getattr(config, "VISION_JPEG_QUALITY", 85),
+            ),
+            max_workers=getattr(config, "DOWNLOAD_WORKERS", 4),
+            max_file_bytes=int(getattr(config, "FILE_MAX_MB", 50)) * 1024 * 1024,
+        )
+        self.token_counter = TokenCounter()
+        # Vision descriptions by image hash (None = disabled)
+        self.vision_cache = create_vision_cache(config)
+        # Per-conversation vector index of uploaded documents (None = inline whole documents)
+        self.retriever = create_document_retriever(config)
+        # One JSON line per handled Slack event (None = disabled)
+        self.trace_log = create_trace_log(config)
+        # Answers to repeated questions in shared channels (None = disabled)
+        self.response_cache = create_response_cache(
+            config, self.retriever.embeddings if self.retriever is not None else None
+        )
+
+        # Prebuilt agent executors, keyed by (profile, model, temperature, host, slot, system message)
+        self._executors = {}
+        self._executor_lock = threading.Lock()
+
+        # Prefix cache mode: first message of each conversation's history window
+        self._window_anchors: dict[str, str] = {}
+        # Handlers, the summarizer and the asyncio executor threads all select windows
+        self._anchor_lock = threading.Lock()
+        # Prefill/decode totals per routing outcome (sticky = stayed on its backend)
+        self._llm_totals = {
+            "sticky": {"calls": 0, "prefill": 0.0, "decode": 0.0, "tokens": 0},
+            "moved": {"calls": 0, "prefill": 0.0, "decode": 0.0, "tokens": 0},
+        }
+        self._llm_totals_lock = threading.Lock()
+
+        # Settings each rebuildable part was last built with (see reload_config)
+        self._built_with: dict[str, tuple] = {}
+        self.reload_config(config)
+
+        # Optional background summarization of turns that fall out of the window
+        self.summarizer = None
+        if getattr(config, "SUMMARY_ENABLED", False):
+            self.summarizer = ConversationSummarizer(self, max_words=config.SUMMARY_MAX_WORDS)
+
+    def reload_config(self, config: Config) -> None:
+        """Applies a new config, rebuilding only the clients and agents whose settings changed.
+
+        The backend pools, search tool (with its cache) and image tool (with its job queue
+        and worker thread) are kept across reloads; only their settings are updated.
+        """
         self.config = config
+        self.temperature = 0.7
+
+        # Backend pools: LOCAL_HOST (and optional VISION_HOST) may list several endpoints
+        model_hosts = tuple(parse_hosts(config.LOCAL_HOST))
+        vision_hosts = tuple(parse_hosts(getattr(config, "VISION_HOST", ""))) or model_hosts
+        probe_interval = float(getattr(config, "LLM_HEALTH_INTERVAL", 15))
+        max_imbalance = int(getattr(config, "AFFINITY_MAX_IMBALANCE", 4))
+        if self._settings_changed("model_pool", (model_hosts, config.API_KEY, probe_interval, max_imbalance)):
+            if getattr(self, "model_pool", None) is not None:
+                self.model_pool.close()
+            self.model_pool = LLMBackendPool(
+                "model", list(model_hosts), config.API_KEY, probe_interval, max_imbalance=max_imbalance,
+            )
+        if self._settings_changed("vision_pool", (vision_hosts, config.API_KEY, probe_interval)):
+            if getattr(self, "vision_pool", None) is not None:
+                self.vision_pool.close()
+            self.vision_pool = LLMBackendPool("vision", list(vision_hosts), config.API_KEY, probe_interval)
+
+        # Prefix cache mode: sticky conversation -> backend routing, stable history window
+        # and (with LLM_SLOTS) a fixed llama.cpp slot per conversation
+        self.prefix_cache = bool(getattr(config, "PREFIX_CACHE", False))
+        self.llm_slots = int(getattr(config, "LLM_SLOTS", 0)) if self.prefix_cache else 0
+
+        # base_url is set per backend
         self.llm_params = {
             "openai_api_key": config.API_KEY,
-            "base_url": config.LOCAL_HOST,
             "model_name": config.MODEL,
-            "temperature": 0.7
+            "temperature": self.temperature
+        }
+
+        # Optional separate vision model, one client per vision backend
+        if self._settings_changed("vision_llms", (vision_hosts, config.API_KEY, config.VISION_MODEL)):
+            self.vision_llms = {
+                url: self._chat_model(self.vision_pool, url, config.VISION_MODEL, 0.2)
+                for url in self.vision_pool.urls
+            }
+
+        # Model for the rolling summaries, can be a smaller one
+        summary_model = getattr(config, "SUMMARY_MODEL", "") or config.MODEL
+        if self._settings_changed("summary_llms", (model_hosts, config.API_KEY, summary_model)):
+            self.summary_llms = {
+                url: self._chat_model(self.model_pool, url, summary_model, 0.2)
+                for url in self.model_pool.urls
+            }
+
+        # Tools are created once and shared by every cached executor; a reload only
+        # updates their settings so the search cache and queued image jobs survive
+        serper_settings = {
+            "cache_ttl": float(getattr(config, "SERPER_CACHE_TTL", 600)),
+            "news_cache_ttl": float(getattr(config, "SERPER_NEWS_CACHE_TTL", 120)),
+            "cache_size": int(getattr(config, "SERPER_CACHE_SIZE", 256)),
+            "timeout": float(getattr(config, "SERPER_TIMEOUT", 10)),
         }
+        if getattr(self, "tool_profiles", None) is None:
+            self.serper_web_search_tool = SerperSearchTool(config.SERPER_API_KEY, **serper_settings)
+            self.comfy_image_tool = ComfyUIImageTool(config)
+            web_tool = self.serper_web_search_tool.get_web_tool()
+            image_tool = self.comfy_image_tool.get_tool()
+            cancel_image_tool = self.comfy_image_tool.get_cancel_tool()
+
+            self.tool_profiles = {
+                # Image generation is only exposed when no images were uploaded
+                self.PROFILE_TEXT: [get_current_date, get_current_time, web_tool, image_tool, cancel_image_tool],
+                # Image generation disabled for image analysis
+                self.PROFILE_IMAGES: [get_current_date, get_current_time, web_tool],
+            }
+            # Tools available to the AI
+            self.tools = self.tool_profiles[self.PROFILE_TEXT]
+        else:
+            self.serper_web_search_tool.configure(config.SERPER_API_KEY, **serper_settings)
+            self.comfy_image_tool.configure(config)
 
-        # Optional separate vision model
-        self.vision_llm = ChatOpenAI(
-            openai_api_key=config.API_KEY,
-            base_url=config.LOCAL_HOST,
-            model_name=config.VISION_MODEL,
-            temperature=0.2
+        executor_settings = (
+            model_hosts,
+            config.API_KEY,
+            config.MODEL,
+            config.SYSTEM_MESSAGE,
+            bool(getattr(config, "PARALLEL_TOOLS", True)),
+            float(getattr(config, "TOOL_TIMEOUT", 30)),
         )
-        
-        # Memory
-        self.history_db = {} 
-
-        self.serper_web_search_tool = SerperSearchTool(config.SERPER_API_KEY)
-        self.comfy_image_tool = ComfyUIImageTool(config)
-        # Tools available to the AI
-        self.tools = [
-            get_current_date,
-            get_current_time,
-            self.serper_web_search_tool.get_web_tool(),
-            self.comfy_image_tool.get_tool(),
-            ]
-
-    def generate_reply(self, conversation_id: str, prompt: str, images=None) -> str:
-
-        if conversation_id not in self.history_db:
-            self.history_db[conversation_id] = []
-
-        # If images exist, describe them first
-        if images:
-            image_description = self._describe_images(images, prompt)
-            prompt = (
-                "The user uploaded image(s).\n"
-                "Here is a detailed description of the image(s):\n"
-                f"{image_description}\n\n"
-                f"User question: {prompt}"
+        if self._settings_changed("executors", executor_settings):
+            with self._executor_lock:
+                self._executors = {}
+                for profile in self.tool_profiles:
+                    for url in self.model_pool.urls:
+                        self._executors[self._executor_key(profile, url, None)] = self._build_executor(profile, url)
+
+    def _settings_changed(self, part: str, settings: tuple) -> bool:
+        """True (and remembered) when `part` was not built yet or was built with other settings."""
+        if self._built_with.get(part) == settings:
+            return False
+        self._built_with[part] = settings
+        return True
+
+    def _chat_model(self, pool, base_url, model_name, temperature, **kwargs) -> ChatOpenAI:
+        # With other backends to fail over to, do not retry a dead or overloaded one first:
+        # _should_retry moves connection errors, 429s and 5xx to the next backend
+        if len(pool.backends) > 1:
+            kwargs.setdefault("max_retries", 0)
+        return ChatOpenAI(
+            openai_api_key=self.config.API_KEY,
+            base_url=base_url,
+            model_name=model_name,
+            temperature=temperature,
+            **kwargs
+        )
+
+    def _executor_key(self, profile: str, base_url: str, slot: int | None) -> tuple:
+        return (
+            profile,
+            self.config.MODEL,
+            self.temperature,
+            base_url,
+            slot,
+            self.config.SYSTEM_MESSAGE,
+        )
+
+    def _build_executor(self, profile: str, base_url: str | None = None, slot: int | None = None) -> AgentExecutor:
+        extra = {}
+        if slot is not None:
+            # llama.cpp server: always use this slot and reuse its cached prompt prefix
+            extra["extra_body"] = {"id_slot": slot, "cache_prompt": True}
+
+        # streaming=True makes tokens reach the callbacks passed at invoke time
+        llm = self._chat_model(
+            self.model_pool, base_url or self.model_pool.urls[0],
+            self.config.MODEL, self.temperature, streaming=True, **extra
+        )
+        tools = self.tool_profiles[profile]
+
+        chat_prompt = ChatPromptTemplate.from_messages([
+            ("system", self.config.SYSTEM_MESSAGE),
+            MessagesPlaceholder(variable_name="history"),
+            ("human", "{input}"),
+            MessagesPlaceholder(variable_name="agent_scratchpad"),
+        ])
+
+        agent = create_tool_calling_agent(llm, tools, chat_prompt)
+
+        if not getattr(self.config, "PARALLEL_TOOLS", True):
+            return AgentExecutor(
+                agent=agent,
+                tools=tools,
+                verbose=True,
+                handle_parsing_errors=True,
+                max_iterations=3
             )
-            response = self._run_agent(conversation_id, prompt, images_present=True)
-        else:
-            response = self._run_agent(conversation_id, prompt, images_present=False)
 
-        # Run tool agent normally (text only)
-        response = self._run_agent(conversation_id, prompt)
+        # Tool calls of one step run concurrently, each bounded by TOOL_TIMEOUT
+        return ParallelAgentExecutor(
+            agent=agent,
+            tools=tools,
+            verbose=True,
+            handle_parsing_errors=True,
+            max_iterations=3,
+            tool_timeout=float(getattr(self.config, "TOOL_TIMEOUT", 30)),
+        )
+
+    def get_executor(self, profile: str, base_url: str | None = None, slot: int | None = None) -> AgentExecutor:
+        """Returns the prebuilt executor for a tool profile and backend, building it on a cache miss."""
+        base_url = base_url or self.model_pool.urls[0]
+        key = self._executor_key(profile, base_url, slot)
+        executor = self._executors.get(key)
+        if executor is not None:
+            return executor
+
+        with self._executor_lock:
+            executor = self._executors.get(key)
+            if executor is None:
+                executor = self._build_executor(profile, base_url, slot)
+                self._executors[key] = executor
+            return executor
+
+    def _slot_for(self, conversation_id: str) -> int | None:
+        if self.llm_slots <= 0:
+            return None
+        # crc32 is stable across restarts, unlike hash()
+        return zlib.crc32(conversation_id.encode("utf-8")) % self.llm_slots
+
+    # BACKEND ROUTING
+    def _with_failover(self, pool, call, affinity_key=None):
+        """Runs call(base_url) on the least busy backend, moving on to the next one on connection errors, 429s and 5xx."""
+        tried = set()
+        while True:
+            backend = pool.acquire(exclude=tried, affinity_key=affinity_key)
+            released = False
+            try:
+                return call(backend.url)
+            except Exception as e:
+                released = True
+                if self._should_retry(pool, backend, tried, e):
+                    continue
+                raise
+            finally:
+                # Also on cancellation (bot stop/restart) or KeyboardInterrupt, or the
+                # backend would count as busy for good
+                if not released:
+                    pool.release(backend)
+
+    async def _awith_failover(self, pool, call, affinity_key=None):
+        tried = set()
+        while True:
+            backend = pool.acquire(exclude=tried, affinity_key=affinity_key)
+            released = False
+            try:
+                return await call(backend.url)
+            except Exception as e:
+                released = True
+                if self._should_retry(pool, backend, tried, e):
+                    continue
+                raise
+            finally:
+                if not released:
+                    pool.release(backend)
+
+    @staticmethod
+    def _should_retry(pool, backend, tried, error) -> bool:
+        """Releases a backend whose call failed; True when another backend should take over.
+
+        Only a call that failed before it produced anything is repeated: once tokens were
+        streamed to Slack or a tool ran (a search, an image job), a rerun would show and
+        do it all twice, so the error is raised instead.
+        """
+        pool.release(backend, error)
+        tried.add(backend.url)
+        retryable = is_connection_error(error) or is_transient_error(error)
+        if not retryable or len(tried) >= len(pool.backends):
+            return False
+        context = current_request()
+        if context is not None and context.output_started:
+            print(f"[LLM] {pool.name} request failed on {backend.url} after output started, not retrying")
+            return False
+        print(f"[LLM] {pool.name} request failed on {backend.url}, trying another backend")
+        return True
+
+    def invoke_summary(self, messages):
+        """Calls the summary model on the model pool (used by ConversationSummarizer)."""
+        return self._with_failover(self.model_pool, lambda url: self.summary_llms[url].invoke(messages))
+
+    def record_llm_call(self, context, record: dict) -> None:
+        if context is not None:
+            # Not a stage of its own: the time is already part of "agent"
+            context.add_llm_call(record)
+
+        metrics.LLM_CALL_SECONDS.observe(record["prefill"], phase="prefill")
+        metrics.LLM_CALL_SECONDS.observe(record["decode"], phase="decode")
+        metrics.LLM_TOKENS.inc(record["tokens"], backend=record["backend"])
+        metrics.LLM_DECODE_SECONDS.inc(record["decode"], backend=record["backend"])
+        if record["tokens"] > 1 and record["decode"] > 0:
+            metrics.LLM_TOKENS_PER_SECOND.observe(record["tokens"] / record["decode"])
+
+        with self._llm_totals_lock:
+            totals = self._llm_totals["sticky" if record["sticky"] else "moved"]
+            totals["calls"] += 1
+            totals["prefill"] += record["prefill"]
+            totals["decode"] += record["decode"]
+            totals["tokens"] += record["tokens"]
+
+        rate = record["tokens"] / record["decode"] if record["decode"] > 0 else 0.0
+        print(
+            f"[LLM] {record['backend']} prefill={record['prefill'] * 1000:.0f}ms "
+            f"decode={record['decode'] * 1000:.0f}ms ({record['tokens']} tokens, {rate:.1f} tok/s)"
+            f"{' sticky' if record['sticky'] else ''}"
+        )
 
+    def backend_stats(self) -> dict:
+        with self._llm_totals_lock:
+            timings = {
+                outcome: {
+                    "calls": totals["calls"],
+                    "avg_prefill_ms": totals["prefill"] * 1000 / totals["calls"] if totals["calls"] else 0.0,
+                    "decode_tokens_per_second": totals["tokens"] / totals["decode"] if totals["decode"] else 0.0,
+                }
+                for outcome, totals in self._llm_totals.items()
+            }
+        return {
+            "model": self.model_pool.stats(),
+            "vision": self.vision_pool.stats(),
+            "affinity": self.model_pool.affinity_stats(),
+            "timings": timings,
+        }
+
+    def generate_reply(
+        self,
+        conversation_id: str,
+        prompt: str,
+        images=None,
+        files=None,
+        token: str | None = None,
+        empty_prompt: str = "Please analyze these files.",
+        on_stage=None,
+        streamer=None,
+        context: RequestContext | None = None,
+    ) -> RequestContext:
+        """Runs the request pipeline: file extraction -> optional vision -> agent -> post-processing.
+
+        Every stage runs exactly once. Document parsing and image description run in parallel.
+        on_stage(name) is called when a stage starts so callers can show progress.
+        streamer (see SlackStreamer) receives the agent's tokens and tool phases as they happen.
+        Returns the request context with the reply, the sources and images the tools
+        produced, and the stage timings. Pass `context` to keep it even if this raises.
+        """
+        context = context or RequestContext(conversation_id)
+        with self._pipeline_scope(context):
+            context.reply = self._run_pipeline(context, prompt, images, files, token, empty_prompt, on_stage, streamer)
+        return context
+
+    def _run_pipeline(self, context, prompt, images, files, token, empty_prompt, on_stage, streamer) -> str:
+        conversation_id = context.conversation_id
+        timer = context.timer
+        images = list(images or [])
+        documents = []
+        excerpts = []
+
+        # FILE EXTRACTION STAGE
+        downloaded = []
+        if files:
+            self._notify(on_stage, "download")
+            with timer.stage("download"):
+                downloaded = self.file_service.download(files, token)
+
+        question = prompt if prompt else empty_prompt
+        image_description = ""
+        with timer.stage("images"):
+            images.extend(self.file_service.extract_images(downloaded))
+        self._record_sizes(context, prompt, downloaded, images)
+
+        # DOCUMENTS + VISION STAGES (independent, run in parallel)
+        if downloaded or images:
+            self._notify(on_stage, "files")
+            with ThreadPoolExecutor(max_workers=2) as pool:
+                texts_future = pool.submit(self._timed, timer, "documents", self._process_documents, conversation_id, downloaded)
+                vision_future = None
+                if images:
+                    vision_future = pool.submit(self._timed, timer, "vision", self._describe_images, images)
+
+                documents = texts_future.result()
+                if vision_future is not None:
+                    image_description = vision_future.result()
+
+        # RETRIEVAL STAGE
+        if self._needs_retrieval(conversation_id, documents):
+            # Without new documents the question may not be about the earlier ones at all
+            retrieved = self._retrieve(timer, conversation_id, question, followup=not documents)
+            if retrieved is not None:
+                excerpts, documents = retrieved, []
+
+        # RESPONSE CACHE STAGE (repeated questions in shared channels)
+        lookup = self._cache_lookup(context, question, downloaded, images, excerpts)
+
+        # AGENT STAGE
+        agent_input = self._build_input(prompt, documents, excerpts, image_description, empty_prompt)
+        result = self._cached_result(context, lookup)
+        if result is None:
+            self._notify(on_stage, "agent")
+            with timer.stage("agent"):
+                result = self._run_agent(conversation_id, agent_input, images_present=bool(images), streamer=streamer)
+            self._cache_store(context, lookup, result)
+
+        # POST-PROCESSING STAGE
+        return self._complete(context, agent_input, result)
+
+    async def agenerate_reply(
+        self,
+        conversation_id: str,
+        prompt: str,
+        images=None,
+        files=None,
+        token: str | None = None,
+        empty_prompt: str = "Please analyze these files.",
+        on_stage=None,
+        streamer=None,
+        context: RequestContext | None = None,
+    ) -> RequestContext:
+        """generate_reply for the asyncio runtime.
+
+        Downloads, the vision call, web searches and the agent are awaited on the event
+        loop. CPU-bound work (image resizing, document parsing and indexing) and the memory
+        store reads and writes run in the default executor. on_stage may be a coroutine
+        function, streamer is an AsyncSlackStreamer.
+        """
+        context = context or RequestContext(conversation_id)
+        with self._pipeline_scope(context):
+            context.reply = await self._arun_pipeline(context, prompt, images, files, token, empty_prompt, on_stage, streamer)
+        return context
+
+    async def _arun_pipeline(self, context, prompt, images, files, token, empty_prompt, on_stage, streamer) -> str:
+        conversation_id = context.conversation_id
+        timer = context.timer
+        images = list(images or [])
+        documents = []
+        excerpts = []
+
+        # FILE EXTRACTION STAGE
+        downloaded = []
+        if files:
+            await self._anotify(on_stage, "download")
+            with timer.stage("download"):
+                downloaded = await self.file_service.adownload(files, token)
+
+        question = prompt if prompt else empty_prompt
+        image_description = ""
+        with timer.stage("images"):
+            images.extend(await asyncio.to_thread(self.file_service.extract_images, downloaded))
+        self._record_sizes(context, prompt, downloaded, images)
+
+        # DOCUMENTS + VISION STAGES (independent, run concurrently)
+        if downloaded or images:
+            await self._anotify(on_stage, "files")
+            documents_task = self._atimed(
+                timer, "documents", asyncio.to_thread(self._process_documents, conversation_id, downloaded)
+            )
+            if images:
+                documents, image_description = await asyncio.gather(
+                    documents_task, self._atimed(timer, "vision", self._adescribe_images(images))
+                )
+            else:
+                documents = await documents_task
+
+        # RETRIEVAL STAGE
+        if self._needs_retrieval(conversation_id, documents):
+            retrieved = await asyncio.to_thread(self._retrieve, timer, conversation_id, question, not documents)
+            if retrieved is not None:
+                excerpts, documents = retrieved, []
+
+        # RESPONSE CACHE STAGE (the similarity lookup embeds the question, a blocking call)
+        lookup = await asyncio.to_thread(self._cache_lookup, context, question, downloaded, images, excerpts)
+
+        # AGENT STAGE
+        agent_input = self._build_input(prompt, documents, excerpts, image_description, empty_prompt)
+        result = self._cached_result(context, lookup)
+        if result is None:
+            await self._anotify(on_stage, "agent")
+            with timer.stage("agent"):
+                result = await self._arun_agent(conversation_id, agent_input, images_present=bool(images), streamer=streamer)
+            self._cache_store(context, lookup, result)
+
+        # POST-PROCESSING STAGE (memory writes, token counting and trimming block)
+        return await asyncio.to_thread(self._complete, context, agent_input, result)
+
+    # PIPELINE STEPS SHARED BY BOTH RUNTIMES
+    @contextmanager
+    def _pipeline_scope(self, context):
+        metrics.IN_FLIGHT.inc()
+        try:
+            with request_scope(context):
+                yield context
+        finally:
+            metrics.IN_FLIGHT.dec()
+            metrics.observe_stages(context.timings)
+
+    @staticmethod
+    def _notify(on_stage, stage):
+        """Calls on_stage(stage); returns its result, a coroutine for async callbacks."""
+        if not on_stage:
+            return None
+        try:
+            return on_stage(stage)
+        except Exception as e:
+            print(f"Stage callback error: {e}")
+            return None
+
+    async def _anotify(self, on_stage, stage) -> None:
+        result = self._notify(on_stage, stage)
+        if asyncio.iscoroutine(result):
+            try:
+                await result
+            except Exception as e:
+                print(f"Stage callback error: {e}")
+
+    def _needs_retrieval(self, conversation_id, documents) -> bool:
+        # Large documents and follow-up questions use indexed chunks
+        if self.retriever is None or not self.retriever.has_index(conversation_id):
+            return False
+        inline_chars = sum(len(doc["content"]) for doc in documents)
+        return not documents or inline_chars > self.config.RAG_INLINE_CHARS
+
+    def _retrieve(self, timer, conversation_id, question, followup):
+        """Excerpts relevant to the question, None if retrieval failed (documents stay inline)."""
+        with timer.stage("retrieval"):
+            try:
+                return self.retriever.retrieve(conversation_id, question, followup=followup)
+            except Exception as e:
+                print(f"[RAG] Retrieval failed: {e}")
+                return None
+
+    def _complete(self, context, agent_input, result) -> str:
+        with context.timer.stage("post"):
+            response = self._finalize_reply(context.conversation_id, agent_input, result)
+
+        context.sizes["reply_chars"] = len(response)
+        model = ""
+        if context.llm_calls:
+            model = " (model: " + " ".join(f"{name}={seconds * 1000:.0f}ms" for name, seconds in context.model_timings().items()) + ")"
+        print(f"[Pipeline] {context.conversation_id}: {context.timer.summary()}{model}")
         return response
 
+    def _timed(self, timer, stage, fn, *args):
+        with timer.stage(stage):
+            return fn(*args)
+
+    async def _atimed(self, timer, stage, awaitable):
+        with timer.stage(stage):
+            return await awaitable
+
+    def _process_documents(self, conversation_id, downloaded):
+        documents = self.file_service.extract_texts(downloaded)
+        if documents and self.retriever is not None:
+            try:
+                chunk_count = self.retriever.add_documents(conversation_id, documents)
+                print(f"[RAG] {conversation_id}: indexed {chunk_count} chunks")
+            except Exception as e:
+                # Without an index the documents are simply inlined
+                print(f"[RAG] Indexing failed: {e}")
+        return documents
+
+    @staticmethod
+    def _record_sizes(context, prompt, downloaded, images):
+        context.sizes["prompt_chars"] = len(prompt or "")
+        context.sizes["files"] = len(downloaded)
+        context.sizes["images"] = len(images)
+        context.sizes["file_bytes"] = sum(len(item["data"]) for item in downloaded if item["data"] is not None)
+
+    def trace_request(self, context, handler: str, seconds: float) -> None:
+        """Queues the trace log line of a handled Slack event (no-op when the log is off)."""
+        if self.trace_log is None:
+            return
+        try:
+            self.trace_log.write(context.to_record(handler, seconds))
+        except Exception as e:
+            print(f"[Trace] {e}")
+
+    # RESPONSE CACHE HELPERS
+    def _cache_lookup(self, context, question, downloaded, images, excerpts):
+        cache = self.response_cache
+        if cache is None or not context.cache_replies or not cache.cacheable(question):
+            return None
+
+        # Same question about other files (or other retrieved excerpts) is a different question
+        file_hashes = [item["hash"] for item in downloaded]
+        for img in images:
+            data = img.get("data") or img.get("base64", "").encode("ascii")
+            file_hashes.append(hashlib.sha256(data).hexdigest())
+        fingerprint = cache.fingerprint(
+            self.config.MODEL,
+            self.config.SYSTEM_MESSAGE,
+            file_hashes,
+            [chunk["text"] for chunk in excerpts],
+        )
+
+        with context.timer.stage("cache"):
+            return cache.lookup(context.conversation_id, question, fingerprint)
+
+    def _cached_result(self, context, lookup):
+        """The cached answer as an agent result, None on a cache miss."""
+        if lookup is None or not lookup.hit:
+            return None
+        print(f"[Cache] {lookup.kind} hit in {context.conversation_id}: {lookup.question[:60]}")
+        context.cache_hit = lookup.kind
+        for link in lookup.sources:
+            context.add_source(link)
+        return {"output": lookup.reply}
+
+    def _cache_store(self, context, lookup, result):
+        if lookup is None or not result.get("output") or context.images_started:
+            return
+        # The executors do not return intermediate steps, the tool callback records them instead
+        tools_used = list(context.tools_used)
+        search_ttl = min(
+            float(getattr(self.config, "SERPER_CACHE_TTL", 600)),
+            float(getattr(self.config, "SERPER_NEWS_CACHE_TTL", 120)),
+        )
+        self.response_cache.store(lookup, result["output"], context.sources, tools_used, search_ttl)
+
+    def _build_input(self, prompt, documents, excerpts, image_description, empty_prompt):
+        if not documents and not excerpts and not image_description:
+            return prompt
+
+        parts = []
+        if documents:
+            joined = "\n\n".join(f"--- FILE: {doc['name']} ---\n{doc['content']}" for doc in documents)
+            parts.append(
+                "IMPORTANT: The user has uploaded a document. Use the following text to answer the question.\n"
+                "--- START OF DOCUMENT ---\n"
+                f"{joined}\n"
+                "--- END OF DOCUMENT ---"
+            )
+        if excerpts:
+            joined = "\n\n".join(f"[{chunk['source']} #{chunk['part']}]\n{chunk['text']}" for chunk in excerpts)
+            parts.append(
+                "IMPORTANT: The user has uploaded document(s). Use the following relevant excerpts to answer the question.\n"
+                "--- START OF DOCUMENT EXCERPTS ---\n"
+                f"{joined}\n"
+                "--- END OF DOCUMENT EXCERPTS ---"
+            )
+        if image_description:
+            parts.append(
+                "The user uploaded image(s).\n"
+                "Here is a detailed description of the image(s):\n"
+                f"{image_description}"
+            )
+
+        question = prompt if prompt else empty_prompt
+        return "\n\n".join(parts) + f"\n\nUSER QUESTION: {question}"
+
     # VISION STEP
-    def _describe_images(self, images, user_prompt):
+    def _describe_images(self, images):
+        cache_key, cached = self._cached_description(images)
+        if cached is not None:
+            return cached
+
+        messages = self._vision_messages(images)
+        vision_response = self._with_failover(self.vision_pool, lambda url: self.vision_llms[url].invoke(messages))
+        self._remember_description(cache_key, vision_response.content)
+        return vision_response.content
+
+    async def _adescribe_images(self, images):
+        cache_key, cached = self._cached_description(images)
+        if cached is not None:
+            return cached
+
+        messages = self._vision_messages(images)
+        vision_response = await self._awith_failover(self.vision_pool, lambda url: self.vision_llms[url].ainvoke(messages))
+        self._remember_description(cache_key, vision_response.content)
+        return vision_response.content
+
+    def _cached_description(self, images):
+        # Same images + same vision model = same description, skip the slowest stage
+        if self.vision_cache is None:
+            return None, None
 
+        cache_key = self.vision_cache.make_key(self.config.VISION_MODEL, images)
+        cached = self.vision_cache.get(cache_key)
+        if cached is not None:
+            print("[Vision] Description served from cache")
+        return cache_key, cached
+
+    def _remember_description(self, cache_key, description) -> None:
+        if cache_key is not None:
+            self.vision_cache.put(cache_key, description)
+
+    def _vision_messages(self, images):
+        # The question is answered by the agent, so the description does not depend on it
+        # and can be reused for any later question about the same image
         content = [{
             "type": "text",
-            "text": f"Describe this image in detail. Focus on objects, text, numbers, structure, and context. The user asked: {user_prompt}"
+            "text": "Describe this image in detail. Focus on objects, text, numbers, structure, and context."
         }]
 
         for img in images:
+            encoded = img.get("base64") or base64.b64encode(img["data"]).decode("utf-8")
             content.append({
                 "type": "image_url",
                 "image_url": {
-                    "url": f"data:image/png;base64,{img['base64']}"
+                    "url": f"data:{img.get('mime', 'image/png')};base64,{encoded}"
                 }
             })
 
-        vision_response = self.vision_llm.invoke([
+        return [
             ("system", "You are a precise visual analysis assistant."),
             HumanMessage(content=content)
-        ])
-
-        return vision_response.content
+        ]
 
     # AGENT STEP
-    def _run_agent(self, conversation_id, prompt, images_present = False):
+    def _run_agent(self, conversation_id, prompt, images_present = False, streamer=None):
+        callbacks = [StreamCallbackHandler(streamer)] if streamer else []
+        history = self._select_history(conversation_id)
+        call, affinity_key = self._agent_call(conversation_id, prompt, history, images_present, callbacks, "invoke")
+        return self._with_failover(self.model_pool, call, affinity_key=affinity_key)
 
-        llm = ChatOpenAI(**self.llm_params)
+    async def _arun_agent(self, conversation_id, prompt, images_present = False, streamer=None):
+        callbacks = [AsyncStreamCallbackHandler(streamer)] if streamer else []
+        # Memory reads and token counting block, keep them off the event loop
+        history = await asyncio.to_thread(self._select_history, conversation_id)
+        call, affinity_key = self._agent_call(conversation_id, prompt, history, images_present, callbacks, "ainvoke")
+        return await self._awith_failover(self.model_pool, call, affinity_key=affinity_key)
 
+    def _agent_call(self, conversation_id, prompt, history, images_present, callbacks, method):
+        """call(base_url) running the agent with `method` (invoke or ainvoke), plus the affinity key."""
         # Dynamically select tools
-        if images_present:
-            tools = [
-                get_current_date,
-                get_current_time,
-                self.serper_web_search_tool.get_web_tool(),
-                # self.comfy_image_tool.get_tool()  # <-- disabled for image analysis
-            ]
-        else:
-            tools = [
-                get_current_date,
-                get_current_time,
-                self.serper_web_search_tool.get_web_tool(),
-                self.comfy_image_tool.get_tool()  # <-- only exposed when generating
-            ]
+        profile = self.PROFILE_IMAGES if images_present else self.PROFILE_TEXT
+        inputs = {
+            "input": prompt,
+            "history": history
+        }
+        # Backend this conversation ran on last time (its prompt prefix is cached there)
+        pinned = self.model_pool.pinned(conversation_id)
 
-        chat_prompt = ChatPromptTemplate.from_messages([
-            ("system", self.config.SYSTEM_MESSAGE),
-            MessagesPlaceholder(variable_name="history"),
-            ("human", "{input}"),
-            MessagesPlaceholder(variable_name="agent_scratchpad"),
-        ])
+        def call(url):
+            executor = self._agent_executor(profile, url, conversation_id)
+            return getattr(executor, method)(
+                inputs, config={"callbacks": callbacks + self._call_handlers(url, url == pinned)}
+            )
 
-        agent = create_tool_calling_agent(llm, self.tools, chat_prompt)
+        # Least busy model backend (or the conversation's own one in prefix cache mode);
+        # another one takes over if it cannot be reached
+        return call, conversation_id if self.prefix_cache else None
 
-        agent_executor = AgentExecutor(
-            agent=agent,
-            tools=self.tools,
-            verbose=True,
-            handle_parsing_errors=True,
-            max_iterations=3
-        )
+    def _agent_executor(self, profile, url, conversation_id):
+        return self.get_executor(profile, url, self._slot_for(conversation_id))
 
-        # Add user message to memory
-        self.history_db[conversation_id].append(
-            HumanMessage(content=prompt)
-        )
+    def _call_handlers(self, url, sticky):
+        # Prefill/decode timings per model call and tool call metrics
+        context = current_request()
+        return [LLMTimingCallbackHandler(self, context, url, sticky), ToolMetricsCallbackHandler(context)]
 
-        result = agent_executor.invoke({
-            "input": prompt,
-            "history": self.history_db[conversation_id]
-        })
+    def history_token_budget(self) -> int:
+        budgets = getattr(self.config, "MODEL_TOKEN_BUDGETS", {})
+        return budgets.get(self.config.MODEL, int(getattr(self.config, "HISTORY_TOKEN_BUDGET", 0)))
+
+    def select_window(self, conversation_id, history):
+        """Returns the newest part of history that fits in the prompt."""
+        budget = self.history_token_budget()
+
+        # Legacy mode: fixed number of messages
+        if budget <= 0:
+            return history[-int(self.config.SHORT_MEMORY) * 2:]
 
+        # The running summary is sent with the history, so it uses part of the budget
+        summary = self.memory.get_summary(conversation_id)
+        budget -= self.token_counter.count_text(summary)
+        budget = max(budget, 0)
+
+        window = self.token_counter.select_window(history, budget)
+        if not self.prefix_cache:
+            return window
+
+        return self._anchored_window(conversation_id, history, window, budget)
+
+    def _anchored_window(self, conversation_id, history, window, budget):
+        # A window that slides by one turn every message changes the prompt right after
+        # the system message, so the server can never reuse its cached prefix. Instead the
+        # window keeps starting at the same message and only grows; when that message no
+        # longer fits it jumps forward, leaving room for several turns before the next jump.
+        earliest = len(history) - len(window)
+        with self._anchor_lock:
+            anchor = self._window_anchors.get(conversation_id)
+        if anchor is not None:
+            for index in range(earliest, len(history)):
+                if message_fingerprint(history[index]) == anchor:
+                    return history[index:]
+
+        window = self.token_counter.select_window(history, int(budget * 0.6))
+        if window:
+            with self._anchor_lock:
+                self._window_anchors[conversation_id] = message_fingerprint(window[0])
+                while len(self._window_anchors) > 10000:
+                    self._window_anchors.pop(next(iter(self._window_anchors)))
+        return window
+
+    def _select_history(self, conversation_id):
+        window = self.select_window(conversation_id, self.memory.get(conversation_id))
+
+        summary = self.memory.get_summary(conversation_id)
+        if summary:
+            return [SystemMessage(content=f"Summary of the earlier conversation:\n{summary}")] + window
+
+        return window
+
+    # POST-PROCESSING STEP
+    def _finalize_reply(self, conversation_id, prompt, result):
         response = result.get("output", "")
 
         if not response:
@@ -143,14 +1024,20 @@ class LLMService:
             else:
                 response = "Error no response. Please check if AI server is running."
 
-        # Add AI reply to memory
-        self.history_db[conversation_id].append(
-            AIMessage(content=response)
-        )
+        # Add the user turn and AI reply to memory, token counts are cached on each message
+        turn = [HumanMessage(content=prompt), AIMessage(content=response)]
+        for message in turn:
+            self.token_counter.count_message(message)
+        self.memory.append(conversation_id, turn)
 
-        # Trim memory
-        max_messages = int(self.config.SHORT_MEMORY) * 2
-        if len(self.history_db[conversation_id]) > max_messages:
-            self.history_db[conversation_id] = self.history_db[conversation_id][-max_messages:]
+        # Trim memory (the prompt window is chosen by token budget in _select_history)
+        max_messages = int(getattr(self.config, "MEMORY_MAX_MESSAGES", int(self.config.SHORT_MEMORY) * 2))
+        self.memory.trim(conversation_id, max_messages)
 
-        return response
\ No newline at end of file
+        # Compress turns that no longer fit in the window, off the request path
+        if self.summarizer is not None:
+            history = self.memory.get(conversation_id)
+            if len(self.select_window(conversation_id, history)) < len(history):
+                self.summarizer.schedule(conversation_id)
+
+        return response
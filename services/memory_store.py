@@ -0,0 +1,358 @@
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from langchain_core.messages import BaseMessage, message_to_dict, messages_from_dict
+
+
+def message_fingerprint(message: BaseMessage) -> str:
+    content = message.content if isinstance(message.content, str) else repr(message.content)
+    return hashlib.sha1(f"{message.type}\0{content}".encode("utf-8")).hexdigest()
+
+
+def summarized_prefix(history: list[BaseMessage], summarized: list[BaseMessage]) -> int:
+    """How many leading messages of `history` are the (tail of the) `summarized` messages.
+
+    The summarized messages were the start of the history when the summary was made;
+    since then trim() may have dropped some of them and new turns were appended.
+    """
+    wanted = [message_fingerprint(m) for m in summarized]
+    current = [message_fingerprint(m) for m in history[:len(wanted)]]
+    for skipped in range(len(wanted)):
+        remaining = wanted[skipped:]
+        if current[:len(remaining)] == remaining:
+            return len(remaining)
+    return 0
+
+
+class MemoryStore:
+    """Conversation history backend. Messages are LangChain message objects."""
+
+    def get(self, conversation_id: str) -> list[BaseMessage]:
+        raise NotImplementedError
+
+    def append(self, conversation_id: str, messages: list[BaseMessage]) -> None:
+        raise NotImplementedError
+
+    def set(self, conversation_id: str, messages: list[BaseMessage]) -> None:
+        raise NotImplementedError
+
+    def drop_oldest(self, conversation_id: str, count: int) -> None:
+        """Removes the first `count` messages. Safe while new messages are being appended."""
+        raise NotImplementedError
+
+    def trim(self, conversation_id: str, max_messages: int) -> None:
+        """Keeps the newest `max_messages` messages."""
+        raise NotImplementedError
+
+    def compact(self, conversation_id: str, summary: str, summarized: list[BaseMessage]) -> int:
+        """Stores a new summary and removes the messages it covers, in one step.
+
+        Messages are matched by content, not position, so turns appended or trimmed
+        while the summary was being written are left alone. If none of the summarized
+        messages are left (the conversation was cleared) nothing is stored. Returns the
+        number of messages removed.
+        """
+        raise NotImplementedError
+
+    def clear(self, conversation_id: str) -> None:
+        self.set(conversation_id, [])
+        self.set_summary(conversation_id, "")
+
+    # Rolling summary of turns that were dropped from the history
+    def get_summary(self, conversation_id: str) -> str:
+        raise NotImplementedError
+
+    def set_summary(self, conversation_id: str, summary: str) -> None:
+        raise NotImplementedError
+
+    def __contains__(self, conversation_id: str) -> bool:
+        return bool(self.get(conversation_id))
+
+
+class InMemoryStore(MemoryStore):
+    """Process-local store. History is lost on restart."""
+
+    def __init__(self) -> None:
+        self._data: dict[str, list[BaseMessage]] = {}
+        self._summaries: dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def get(self, conversation_id):
+        with self._lock:
+            return list(self._data.get(conversation_id, []))
+
+    def append(self, conversation_id, messages):
+        with self._lock:
+            self._data.setdefault(conversation_id, []).extend(messages)
+
+    def set(self, conversation_id, messages):
+        with self._lock:
+            if messages:
+                self._data[conversation_id] = list(messages)
+            else:
+                self._data.pop(conversation_id, None)
+
+    def drop_oldest(self, conversation_id, count):
+        with self._lock:
+            if conversation_id in self._data:
+                del self._data[conversation_id][:count]
+
+    def trim(self, conversation_id, max_messages):
+        with self._lock:
+            messages = self._data.get(conversation_id, [])
+            excess = len(messages) - max_messages
+            if excess > 0:
+                del messages[:excess]
+
+    def compact(self, conversation_id, summary, summarized):
+        with self._lock:
+            messages = self._data.get(conversation_id, [])
+            count = summarized_prefix(messages, summarized)
+            if count == 0:
+                return 0
+            del messages[:count]
+            self._summaries[conversation_id] = summary
+            return count
+
+    def get_summary(self, conversation_id):
+        with self._lock:
+            return self._summaries.get(conversation_id, "")
+
+    def set_summary(self, conversation_id, summary):
+        with self._lock:
+            if summary:
+                self._summaries[conversation_id] = summary
+            else:
+                self._summaries.pop(conversation_id, None)
+
+
+class _CachedConversation:
+    """A hot conversation: its messages, summary and serialized size."""
+
+    __slots__ = ("last_used", "messages", "ids", "sizes", "summary", "size")
+
+    def __init__(self, messages: list[BaseMessage], ids: list[int], sizes: list[int], summary: str) -> None:
+        self.last_used = time.monotonic()
+        self.messages = messages
+        # Row id and serialized size of each message
+        self.ids = ids
+        self.sizes = sizes
+        self.summary = summary
+        self.size = len(summary) + sum(sizes)
+
+
+class SQLiteStore(MemoryStore):
+    """SQLite (WAL) store with an in-memory LRU of hot conversations.
+
+    Reads of hot conversations (messages and summary) never touch the database.
+    Conversations are evicted from the cache when there are more than `cache_size` of
+    them, when together they are larger than `max_cache_bytes` (serialized size), or
+    when they were idle for `idle_seconds`; they are loaded back on the next message.
+    """
+
+    def __init__(
+        self,
+        path: str = "memory.db",
+        cache_size: int = 256,
+        idle_seconds: float = 1800,
+        max_cache_bytes: int = 64 * 1024 * 1024,
+    ) -> None:
+        self.path = path
+        self.cache_size = cache_size
+        self.idle_seconds = idle_seconds
+        self.max_cache_bytes = max_cache_bytes
+
+        self._cache: OrderedDict[str, _CachedConversation] = OrderedDict()
+        self._cache_bytes = 0
+        self._lock = threading.Lock()
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " conversation_id TEXT NOT NULL,"
+            " message TEXT NOT NULL,"
+            " created REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_messages_conversation ON messages (conversation_id, id)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS summaries ("
+            " conversation_id TEXT PRIMARY KEY,"
+            " summary TEXT NOT NULL,"
+            " updated REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, conversation_id):
+        with self._lock:
+            return list(self._load(conversation_id).messages)
+
+    def append(self, conversation_id, messages):
+        if not messages:
+            return
+        dumped = [self._dump(m) for m in messages]
+        with self._lock:
+            entry = self._load(conversation_id)
+            with self._conn:
+                ids = self._insert(conversation_id, dumped)
+            entry.messages.extend(messages)
+            entry.ids.extend(ids)
+            entry.sizes.extend(len(data) for data in dumped)
+            self._resize(conversation_id, entry)
+
+    def set(self, conversation_id, messages):
+        dumped = [self._dump(m) for m in messages]
+        with self._lock:
+            entry = self._load(conversation_id)
+            with self._conn:
+                self._conn.execute("DELETE FROM messages WHERE conversation_id = ?", (conversation_id,))
+                entry.ids = self._insert(conversation_id, dumped)
+            entry.messages = list(messages)
+            entry.sizes = [len(data) for data in dumped]
+            self._resize(conversation_id, entry)
+
+    def drop_oldest(self, conversation_id, count):
+        if count <= 0:
+            return
+        with self._lock:
+            entry = self._load(conversation_id)
+            with self._conn:
+                self._drop(conversation_id, entry, count)
+
+    def trim(self, conversation_id, max_messages):
+        with self._lock:
+            entry = self._load(conversation_id)
+            excess = len(entry.messages) - max_messages
+            if excess > 0:
+                with self._conn:
+                    self._drop(conversation_id, entry, excess)
+
+    def compact(self, conversation_id, summary, summarized):
+        with self._lock:
+            entry = self._load(conversation_id)
+            count = summarized_prefix(entry.messages, summarized)
+            if count == 0:
+                return 0
+            # One transaction: the summary never exists without its messages removed
+            with self._conn:
+                self._write_summary(conversation_id, summary)
+                self._drop(conversation_id, entry, count)
+            entry.summary = summary
+            self._resize(conversation_id, entry)
+            return count
+
+    def get_summary(self, conversation_id):
+        with self._lock:
+            return self._load(conversation_id).summary
+
+    def set_summary(self, conversation_id, summary):
+        with self._lock:
+            entry = self._load(conversation_id)
+            with self._conn:
+                self._write_summary(conversation_id, summary)
+            entry.summary = summary or ""
+            self._resize(conversation_id, entry)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    # Database and cache helpers (call with the lock held)
+    def _insert(self, conversation_id, dumped) -> list[int]:
+        now = time.time()
+        ids = []
+        for data in dumped:
+            cursor = self._conn.execute(
+                "INSERT INTO messages (conversation_id, message, created) VALUES (?, ?, ?)",
+                (conversation_id, data, now),
+            )
+            ids.append(cursor.lastrowid)
+        return ids
+
+    def _drop(self, conversation_id, entry, count) -> None:
+        # By row id, so exactly the cached messages that are removed go from disk too
+        self._conn.executemany("DELETE FROM messages WHERE id = ?", [(row_id,) for row_id in entry.ids[:count]])
+        del entry.messages[:count]
+        del entry.ids[:count]
+        del entry.sizes[:count]
+        self._resize(conversation_id, entry)
+
+    def _write_summary(self, conversation_id, summary) -> None:
+        if summary:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO summaries (conversation_id, summary, updated) VALUES (?, ?, ?)",
+                (conversation_id, summary, time.time()),
+            )
+        else:
+            self._conn.execute("DELETE FROM summaries WHERE conversation_id = ?", (conversation_id,))
+
+    def _load(self, conversation_id) -> _CachedConversation:
+        entry = self._cache.get(conversation_id)
+        if entry is None:
+            rows = self._conn.execute(
+                "SELECT id, message FROM messages WHERE conversation_id = ? ORDER BY id",
+                (conversation_id,),
+            ).fetchall()
+            row = self._conn.execute(
+                "SELECT summary FROM summaries WHERE conversation_id = ?", (conversation_id,)
+            ).fetchone()
+            entry = _CachedConversation(
+                messages_from_dict([json.loads(r[1]) for r in rows]),
+                [r[0] for r in rows],
+                [len(r[1]) for r in rows],
+                row[0] if row else "",
+            )
+            self._cache[conversation_id] = entry
+            self._cache_bytes += entry.size
+
+        entry.last_used = time.monotonic()
+        self._cache.move_to_end(conversation_id)
+        self._evict(entry.last_used)
+        return entry
+
+    def _resize(self, conversation_id, entry) -> None:
+        size = len(entry.summary) + sum(entry.sizes)
+        if self._cache.get(conversation_id) is entry:
+            self._cache_bytes += size - entry.size
+        entry.size = size
+        self._evict(time.monotonic())
+
+    def _evict(self, now) -> None:
+        # The most recently used conversation always stays, even if it alone is over the limit
+        while len(self._cache) > 1 and (
+            len(self._cache) > self.cache_size or self._cache_bytes > self.max_cache_bytes
+        ):
+            self._drop_cached(next(iter(self._cache)))
+        # Oldest entries are first, stop at the first one that is still fresh
+        while self._cache:
+            conversation_id, entry = next(iter(self._cache.items()))
+            if now - entry.last_used < self.idle_seconds:
+                break
+            self._drop_cached(conversation_id)
+
+    def _drop_cached(self, conversation_id) -> None:
+        entry = self._cache.pop(conversation_id)
+        self._cache_bytes -= entry.size
+
+    @staticmethod
+    def _dump(message: BaseMessage) -> str:
+        return json.dumps(message_to_dict(message))
+
+
+def create_memory_store(config) -> MemoryStore:
+    backend = getattr(config, "MEMORY_BACKEND", "sqlite")
+    if backend == "memory":
+        return InMemoryStore()
+    return SQLiteStore(
+        path=getattr(config, "MEMORY_DB_PATH", "memory.db"),
+        cache_size=int(getattr(config, "MEMORY_CACHE_SIZE", 256)),
+        idle_seconds=float(getattr(config, "MEMORY_IDLE_SECONDS", 1800)),
+        max_cache_bytes=int(getattr(config, "MEMORY_CACHE_MB", 64)) * 1024 * 1024,
+    )
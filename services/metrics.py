@@ -0,0 +1,224 @@
+import time
+import inspect
+import threading
+import functools
+
+# Seconds, from a cached lookup to a long generation
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+TOKEN_RATE_BUCKETS = (1, 2, 5, 10, 20, 30, 50, 75, 100, 150, 250)
+
+
+def _format_labels(names, values, extra=()) -> str:
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels=()) -> None:
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labels)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            lines.extend(self._samples())
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        for key, value in sorted(self._values.items()):
+            yield f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def _samples(self):
+        for key, value in sorted(self._values.items()):
+            yield f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels=(), buckets=LATENCY_BUCKETS) -> None:
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["counts"][index] += 1
+                    break
+            series["sum"] += value
+            series["count"] += 1
+
+    def _samples(self):
+        for key, series in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series["counts"]):
+                cumulative += count
+                le = (("le", _format_value(bound)),)
+                yield f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}"
+            yield f"{self.name}_bucket{_format_labels(self.labels, key, (('le', '+Inf'),))} {series['count']}"
+            yield f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(series['sum'])}"
+            yield f"{self.name}_count{_format_labels(self.labels, key)} {series['count']}"
+
+
+class Registry:
+    """Metrics of this process in the Prometheus text format (version 0.0.4).
+
+    Written out by hand so the bot does not need prometheus_client; only counters,
+    gauges and histograms with fixed buckets are supported.
+    """
+
+    def __init__(self) -> None:
+        self._metrics: list[_Metric] = []
+
+    def counter(self, name: str, help_text: str, labels=()) -> Counter:
+        return self._add(Counter(name, help_text, labels))
+
+    def gauge(self, name: str, help_text: str, labels=()) -> Gauge:
+        return self._add(Gauge(name, help_text, labels))
+
+    def histogram(self, name: str, help_text: str, labels=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help_text, labels, buckets))
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# HANDLERS
+REQUESTS = REGISTRY.counter("slackbot_requests_total", "Slack messages handled.", ["handler"])
+REQUEST_SECONDS = REGISTRY.histogram("slackbot_request_seconds", "Time from picking up a Slack message to the final reply.", ["handler"])
+IN_FLIGHT = REGISTRY.gauge("slackbot_requests_in_flight", "Messages currently going through the LLM pipeline.")
+QUEUE_DEPTH = REGISTRY.gauge("slackbot_queue_depth", "Slack events waiting for a worker.")
+ACTIVE_HANDLERS = REGISTRY.gauge("slackbot_active_handlers", "Slack events being handled right now.")
+IMAGE_JOBS = REGISTRY.gauge("slackbot_image_jobs", "ComfyUI jobs by state.", ["state"])
+ERRORS = REGISTRY.counter("slackbot_errors_total", "Errors by component.", ["component"])
+
+# PIPELINE (download, documents = parsing, vision, retrieval, cache, agent, post, ...)
+STAGE_SECONDS = REGISTRY.histogram("slackbot_stage_seconds", "Time per pipeline stage of one message.", ["stage"])
+
+# MODEL CALLS
+LLM_CALL_SECONDS = REGISTRY.histogram("slackbot_llm_call_seconds", "Model call time split into prefill and decode.", ["phase"])
+LLM_TOKENS = REGISTRY.counter("slackbot_llm_tokens_total", "Tokens streamed by the model.", ["backend"])
+LLM_DECODE_SECONDS = REGISTRY.counter("slackbot_llm_decode_seconds_total", "Time spent streaming tokens.", ["backend"])
+LLM_TOKENS_PER_SECOND = REGISTRY.histogram(
+    "slackbot_llm_tokens_per_second", "Decode speed of each model call.", buckets=TOKEN_RATE_BUCKETS
+)
+
+# TOOLS
+TOOL_CALLS = REGISTRY.counter("slackbot_tool_calls_total", "Agent tool calls.", ["tool", "status"])
+TOOL_SECONDS = REGISTRY.histogram("slackbot_tool_seconds", "Time per agent tool call.", ["tool"])
+
+# SLACK API
+SLACK_API_CALLS = REGISTRY.counter("slackbot_slack_api_calls_total", "Slack Web API calls.", ["method", "status"])
+SLACK_API_SECONDS = REGISTRY.histogram("slackbot_slack_api_seconds", "Time per Slack Web API call.", ["method"])
+
+
+def observe_stages(timings: dict[str, float]) -> None:
+    for stage, seconds in timings.items():
+        STAGE_SECONDS.observe(seconds, stage=stage)
+
+
+class InstrumentedSlackClient:
+    """Wraps a WebClient/AsyncWebClient and times every Web API method called on it.
+
+    Bolt builds a fresh client for every event, so the handlers wrap the one they get
+    instead of the app being given a custom client class.
+    """
+
+    def __init__(self, client) -> None:
+        self._client = client
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if name.startswith("_") or not callable(attr):
+            return attr
+
+        if inspect.iscoroutinefunction(attr):
+            @functools.wraps(attr)
+            async def timed_async(*args, **kwargs):
+                start = time.perf_counter()
+                status = "error"
+                try:
+                    result = await attr(*args, **kwargs)
+                    status = "ok"
+                    return result
+                finally:
+                    _record_slack_call(name, status, time.perf_counter() - start)
+            return timed_async
+
+        @functools.wraps(attr)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            status = "error"
+            try:
+                result = attr(*args, **kwargs)
+                status = "ok"
+                return result
+            finally:
+                _record_slack_call(name, status, time.perf_counter() - start)
+        return timed
+
+
+def _record_slack_call(method: str, status: str, seconds: float) -> None:
+    SLACK_API_CALLS.inc(method=method, status=status)
+    SLACK_API_SECONDS.observe(seconds, method=method)
+    if status == "error":
+        ERRORS.inc(component="slack_api")
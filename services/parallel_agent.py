@@ -0,0 +1,69 @@
+import asyncio
+import contextvars
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from langchain.agents import AgentExecutor
+from langchain_core.agents import AgentStep
+
+# Shared by every executor, tool calls are mostly network bound
+_TOOL_POOL = ThreadPoolExecutor(max_workers=8, thread_name_prefix="agent-tool")
+
+
+class ParallelAgentExecutor(AgentExecutor):
+    """AgentExecutor that runs all tool calls of one agent step at the same time.
+
+    The base class performs the actions of a step one by one, so a step with two web
+    searches costs both round trips. Here each action is started on a thread pool as
+    soon as the base class reaches it and the results are handed back in the original
+    order. A tool that takes longer than `tool_timeout` seconds is reported to the
+    model as timed out (the thread itself cannot be stopped and finishes in the
+    background). With ainvoke the base class already gathers the calls of a step,
+    only the timeout is added.
+    """
+
+    tool_timeout: float = 30.0
+
+    def _perform_agent_action(self, name_to_tool_map, color_mapping, agent_action, run_manager=None):
+        perform = super()._perform_agent_action
+        # Tools see the caller's context variables (request context, tracing parents)
+        context = contextvars.copy_context()
+        future = _TOOL_POOL.submit(context.run, perform, name_to_tool_map, color_mapping, agent_action, run_manager)
+        future.agent_action = agent_action
+        return future
+
+    def _iter_next_step(self, name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager=None):
+        # The base class yields the actions, then one _perform_agent_action result per
+        # action; with the override above those are futures that are already running
+        pending = []
+        for item in super()._iter_next_step(
+            name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager
+        ):
+            if isinstance(item, Future):
+                pending.append(item)
+            else:
+                yield item
+
+        for future in pending:
+            yield self._wait(future)
+
+    async def _aperform_agent_action(self, name_to_tool_map, color_mapping, agent_action, run_manager=None):
+        try:
+            return await asyncio.wait_for(
+                super()._aperform_agent_action(name_to_tool_map, color_mapping, agent_action, run_manager),
+                timeout=self.tool_timeout,
+            )
+        except asyncio.TimeoutError:
+            return self._timed_out(agent_action)
+
+    def _wait(self, future: Future) -> AgentStep:
+        try:
+            return future.result(timeout=self.tool_timeout)
+        except FutureTimeoutError:
+            # The tools run side by side, so later ones had this wait as extra time
+            return self._timed_out(future.agent_action)
+
+    def _timed_out(self, action) -> AgentStep:
+        print(f"[Agent] Tool {action.tool} timed out after {self.tool_timeout:g}s")
+        return AgentStep(
+            action=action,
+            observation=f"The tool {action.tool} did not answer within {self.tool_timeout:g} seconds.",
+        )
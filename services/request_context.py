@@ -0,0 +1,127 @@
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from services.stage_timer import StageTimer
+
+_current: contextvars.ContextVar["RequestContext | None"] = contextvars.ContextVar("request_context", default=None)
+
+
+class RequestContext:
+    """Everything that belongs to one handled Slack message.
+
+    Tools are shared singletons, so they record what they did for a request here
+    (found via current_request()) instead of on themselves. The handler creates it,
+    generate_reply fills it and returns it.
+    """
+
+    def __init__(self, conversation_id: str, user_id: str | None = None, cache_replies: bool = False) -> None:
+        self.conversation_id = conversation_id
+        self.user_id = user_id
+        # Shared channels may answer repeated questions from the response cache
+        self.cache_replies = cache_replies
+        # "exact" or "similar" when the reply came from the response cache
+        self.cache_hit: str | None = None
+        self.reply = ""
+        # Links of the web search results the answer is based on
+        self.sources: list[str] = []
+        # {"job": ComfyJob, "queue": ComfyJobQueue} for every image generation started
+        self.images_started: list[dict] = []
+        # One record per model call: backend, prefill/decode seconds, prompt and streamed tokens
+        self.llm_calls: list[dict] = []
+        # One record per tool call: tool, seconds, status
+        self.tool_calls: list[dict] = []
+        # Names of the tools the agent started, in order
+        self.tools_used: list[str] = []
+        # Sizes of what came in and went out (prompt/reply characters, files, bytes)
+        self.sizes: dict[str, int] = {}
+        # Set by the first streamed token or tool call: from then on the run has visible
+        # output or side effects and must not be repeated on another backend
+        self.output_started = False
+        # Set by the handler when the request failed
+        self.error: str | None = None
+        self.started_at = time.time()
+        self.timer = StageTimer()
+        # Tools of one agent step may run on several threads
+        self._lock = threading.Lock()
+
+    @property
+    def timings(self) -> dict[str, float]:
+        return dict(self.timer.timings)
+
+    def model_timings(self) -> dict[str, float]:
+        """Prefill and decode time of all model calls, a breakdown of the agent stage."""
+        with self._lock:
+            return {
+                "prefill": sum(call["prefill"] for call in self.llm_calls),
+                "decode": sum(call["decode"] for call in self.llm_calls),
+            }
+
+    def add_source(self, link: str | None) -> None:
+        if not link:
+            return
+        with self._lock:
+            if link not in self.sources:
+                self.sources.append(link)
+
+    def add_llm_call(self, record: dict) -> None:
+        with self._lock:
+            self.llm_calls.append(record)
+
+    def add_tool_used(self, name: str) -> None:
+        with self._lock:
+            self.tools_used.append(name)
+
+    def add_tool_call(self, record: dict) -> None:
+        with self._lock:
+            self.tool_calls.append(record)
+
+    def to_record(self, handler: str, seconds: float) -> dict:
+        """One trace log line for this request (see TraceLogWriter)."""
+        if self.error is not None:
+            outcome = "error"
+        elif self.cache_hit is not None:
+            outcome = "cached"
+        else:
+            outcome = "ok"
+
+        model = self.model_timings()
+        with self._lock:
+            return {
+                "ts": self.started_at,
+                "handler": handler,
+                "conversation": self.conversation_id,
+                "user": self.user_id,
+                "outcome": outcome,
+                "error": self.error,
+                "seconds": round(seconds, 4),
+                "stages": {name: round(value, 4) for name, value in self.timer.timings.items()},
+                # Part of the agent stage, kept apart so stage totals count it once
+                "model": {name: round(value, 4) for name, value in model.items()},
+                "prompt_tokens": sum(call.get("prompt_tokens", 0) for call in self.llm_calls),
+                "completion_tokens": sum(call["tokens"] for call in self.llm_calls),
+                "llm_calls": [dict(call) for call in self.llm_calls],
+                "tool_calls": [dict(call) for call in self.tool_calls],
+                "sizes": dict(self.sizes),
+                "sources": len(self.sources),
+                "images_started": len(self.images_started),
+            }
+
+    def add_image_job(self, job, queue) -> None:
+        with self._lock:
+            if all(entry["job"] is not job for entry in self.images_started):
+                self.images_started.append({"job": job, "queue": queue})
+
+
+def current_request() -> RequestContext | None:
+    """The context of the request being processed, or None outside of one."""
+    return _current.get()
+
+
+@contextmanager
+def request_scope(context: RequestContext):
+    token = _current.set(context)
+    try:
+        yield context
+    finally:
+        _current.reset(token)
@@ -0,0 +1,203 @@
+import re
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+
+# Answers built on these tools are never reused: the clock moves on and images are side effects
+UNCACHEABLE_TOOLS = {"get_current_date", "get_current_time", "generate_image", "cancel_image_generation"}
+# Answers built on a web search are reused no longer than the search results themselves
+SEARCH_TOOLS = {"serper_search"}
+
+
+class CacheLookup:
+    """Result of ResponseCache.lookup(). Holds what store() needs after a miss."""
+
+    def __init__(self, scope: str, fingerprint: str, question: str, entry: dict | None = None, kind: str | None = None) -> None:
+        self.scope = scope
+        self.fingerprint = fingerprint
+        self.question = question
+        self.entry = entry
+        # "exact" or "similar" on a hit
+        self.kind = kind
+        self.vector = None
+
+    @property
+    def hit(self) -> bool:
+        return self.entry is not None
+
+    @property
+    def reply(self) -> str:
+        return self.entry["reply"]
+
+    @property
+    def sources(self) -> list[str]:
+        return list(self.entry["sources"])
+
+
+class ResponseCache:
+    """Answers to repeated questions, per channel.
+
+    An entry is keyed by the normalized question and a fingerprint of everything else
+    the answer was built from (model, system message, attached files, retrieved
+    document excerpts). A lookup first tries the exact question; with an `embed`
+    function it then looks for an earlier question of the same channel and fingerprint
+    whose embedding is at least `min_similarity` close. Entries expire after `ttl`
+    seconds, the oldest are evicted past `max_entries`.
+
+    The conversation history is not part of the key, so very short questions
+    (fewer than `min_words` words, usually follow-ups like "why?") are never cached.
+    """
+
+    def __init__(
+        self,
+        ttl: float = 3600,
+        max_entries: int = 500,
+        embed=None,
+        min_similarity: float = 0.95,
+        min_words: int = 3,
+    ) -> None:
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.embed = embed
+        self.min_similarity = min_similarity
+        self.min_words = min_words
+
+        # (scope, fingerprint, question) -> {"reply", "sources", "expires", "vector"}
+        self._entries: OrderedDict[tuple, dict] = OrderedDict()
+        self._lock = threading.Lock()
+        # scope -> hit/miss counters
+        self._stats: dict[str, dict] = {}
+
+    @staticmethod
+    def normalize(prompt: str) -> str:
+        # Case, spacing and trailing punctuation do not change the question
+        text = re.sub(r"\s+", " ", (prompt or "").lower()).strip()
+        return text.rstrip("?!. ")
+
+    @staticmethod
+    def fingerprint(model: str, system_message: str, file_hashes: list[str], excerpts: list[str]) -> str:
+        hasher = hashlib.sha256()
+        for part in [model, system_message, *sorted(file_hashes), *excerpts]:
+            hasher.update(hashlib.sha256((part or "").encode("utf-8")).digest())
+        return hasher.hexdigest()
+
+    def cacheable(self, prompt: str) -> bool:
+        return len(self.normalize(prompt).split()) >= self.min_words
+
+    def lookup(self, scope: str, prompt: str, fingerprint: str) -> CacheLookup:
+        question = self.normalize(prompt)
+        lookup = CacheLookup(scope, fingerprint, question)
+        now = time.time()
+
+        with self._lock:
+            self._expire(now)
+            entry = self._entries.get((scope, fingerprint, question))
+            if entry is not None:
+                self._entries.move_to_end((scope, fingerprint, question))
+                lookup.entry, lookup.kind = entry, "exact"
+            has_candidates = entry is None and self.embed is not None and any(
+                key[0] == scope and key[1] == fingerprint for key in self._entries
+            )
+
+        if entry is None and self.embed is not None:
+            try:
+                lookup.vector = self._normalize(self.embed(question))
+            except Exception as e:
+                print(f"[Cache] Question embedding failed: {e}")
+
+            if lookup.vector is not None and has_candidates:
+                with self._lock:
+                    key, entry = self._most_similar(scope, fingerprint, lookup.vector)
+                    if entry is not None:
+                        self._entries.move_to_end(key)
+                        lookup.entry, lookup.kind = entry, "similar"
+
+        self._count(scope, lookup.kind)
+        return lookup
+
+    def store(self, lookup: CacheLookup, reply: str, sources: list[str], tools_used: list[str], search_ttl: float | None = None) -> bool:
+        """Caches a freshly generated answer. Returns False when it must not be reused."""
+        if not reply or not lookup.question:
+            return False
+        if any(tool in UNCACHEABLE_TOOLS for tool in tools_used):
+            return False
+
+        ttl = self.ttl
+        if search_ttl is not None and any(tool in SEARCH_TOOLS for tool in tools_used):
+            ttl = min(ttl, search_ttl)
+        if ttl <= 0:
+            return False
+
+        with self._lock:
+            key = (lookup.scope, lookup.fingerprint, lookup.question)
+            self._entries[key] = {
+                "reply": reply,
+                "sources": list(sources),
+                "expires": time.time() + ttl,
+                "vector": lookup.vector,
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            channels = {}
+            for scope, counts in self._stats.items():
+                lookups = counts["hits"] + counts["misses"]
+                channels[scope] = dict(counts, hit_rate=counts["hits"] / lookups if lookups else 0.0)
+            return {"entries": len(self._entries), "channels": channels}
+
+    def _most_similar(self, scope, fingerprint, vector):
+        # Call with the lock held
+        best_key, best_entry, best_score = None, None, self.min_similarity
+        for key, entry in self._entries.items():
+            if key[0] != scope or key[1] != fingerprint or entry["vector"] is None:
+                continue
+            score = float(np.dot(entry["vector"], vector))
+            if score >= best_score:
+                best_key, best_entry, best_score = key, entry, score
+        return best_key, best_entry
+
+    def _expire(self, now: float) -> None:
+        # Call with the lock held
+        for key in [key for key, entry in self._entries.items() if entry["expires"] <= now]:
+            del self._entries[key]
+
+    def _count(self, scope: str, kind: str | None) -> None:
+        with self._lock:
+            counts = self._stats.setdefault(scope, {"hits": 0, "exact": 0, "similar": 0, "misses": 0})
+            if kind is None:
+                counts["misses"] += 1
+            else:
+                counts["hits"] += 1
+                counts[kind] += 1
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+def create_response_cache(config, embeddings=None) -> ResponseCache | None:
+    """Returns the answer cache when RESPONSE_CACHE is on, otherwise None.
+
+    Similar-question matching needs an embedding model (EMBEDDING_MODEL) and
+    RESPONSE_CACHE_SIMILARITY > 0; without them only exact questions match.
+    """
+    if not getattr(config, "RESPONSE_CACHE", False):
+        return None
+
+    min_similarity = float(getattr(config, "RESPONSE_CACHE_SIMILARITY", 0.95))
+    embed = embeddings.embed_query if embeddings is not None and min_similarity > 0 else None
+    return ResponseCache(
+        ttl=float(getattr(config, "RESPONSE_CACHE_TTL", 3600)),
+        max_entries=int(getattr(config, "RESPONSE_CACHE_SIZE", 500)),
+        embed=embed,
+        min_similarity=min_similarity,
+        min_words=int(getattr(config, "RESPONSE_CACHE_MIN_WORDS", 3)),
+    )
@@ -4,6 +4,8 @@ from services.llm_service import LLMService
 import time
 from handlers.group_chat import GroupChatHandler
 from handlers.private_chat import PrivateChatHandler
+from services.event_dispatcher import ConversationDispatcher
+from services.comfy_tracker import ComfyCompletionTracker
 
 class SlackBotService:
     def __init__(
@@ -12,15 +14,24 @@ class SlackBotService:
         bot_token: str,
         app_token: str,
         allowed_channel_ids: set[str] | None,
-        max_memory: int = 10
+        max_memory: int = 10,
+        worker_pool_size: int = 4
     ) -> None:
         self.llm_service = llm_service
         self.app = App(token=bot_token)
         self.app_token = app_token
         
+        # One shared tracker uploads finished ComfyUI images to the right thread
+        self.image_tracker = ComfyCompletionTracker(
+            image_path=llm_service.config.COMFYUI_IMAGE_PATH,
+        )
+
         # Handlers
-        self.group_handler = GroupChatHandler(llm_service)
-        self.private_handler = PrivateChatHandler(llm_service)
+        self.group_handler = GroupChatHandler(llm_service, self.image_tracker)
+        self.private_handler = PrivateChatHandler(llm_service, self.image_tracker)
+
+        # Events are acked right away and processed here, in order per conversation
+        self.dispatcher = ConversationDispatcher(max_workers=worker_pool_size)
         
         self.handler: SocketModeHandler | None = None
         self._register_handlers()
@@ -30,14 +41,20 @@ class SlackBotService:
         def handle_mention(event, say, client):
             # This only fires in channels/groups when @bot is tagged
             thread_ts = event.get("thread_ts") or event.get("ts")
-            self.group_handler.handle(event, say, client, thread_ts)
+            self.dispatcher.submit(
+                event.get("channel"),
+                self.group_handler.handle, event, say, client, thread_ts
+            )
 
         @self.app.event("message")
         def handle_message(event, say, client):
             # Check if this is a Direct Message (IM)
             # This prevents the bot from replying twice in groups
             if event.get("channel_type") == "im":
-                self.private_handler.handle(event, say, client)
+                self.dispatcher.submit(
+                    event.get("channel"),
+                    self.private_handler.handle, event, say, client
+                )
 
 
     def run_sync(self) -> None:
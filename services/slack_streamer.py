@@ -0,0 +1,188 @@
+import time
+import asyncio
+import threading
+
+# Friendly status lines shown while a tool runs
+TOOL_STATUS = {
+    "serper_search": "🔎 Searching the web...",
+    "generate_image": "🎨 Starting image generation...",
+    "cancel_image_generation": "🚫 Cancelling image generation...",
+    "get_current_date": "🕒 Checking the date...",
+    "get_current_time": "🕒 Checking the time...",
+}
+
+
+class SlackStreamer:
+    """Pushes streamed LLM tokens into a placeholder message with throttled chat_update calls.
+
+    Updates are coalesced: a new update is sent only when `min_interval` seconds have passed
+    and at least `min_chars` new characters arrived. Status changes skip the size check; one
+    that arrives inside the interval is sent when the interval is over.
+    """
+
+    def __init__(self, client, channel, ts, min_interval: float = 1.0, min_chars: int = 20) -> None:
+        self.client = client
+        self.channel = channel
+        self.ts = ts
+        self.min_interval = min_interval
+        self.min_chars = min_chars
+
+        self.text = ""
+        self.status = ""
+        self._sent_length = 0
+        self._sent_display = None
+        self._last_update = 0.0
+        self._closed = False
+        # Timer (or task) that sends a throttled status change later
+        self._pending_flush = None
+        self._lock = threading.Lock()
+
+        self.started_at = time.perf_counter()
+        self.first_token_at = None
+        self.updates_sent = 0
+
+    @property
+    def time_to_first_token(self) -> float | None:
+        if self.first_token_at is None:
+            return None
+        return self.first_token_at - self.started_at
+
+    def on_llm_start(self) -> None:
+        # Each agent step is a new LLM call; its text replaces the previous step's text
+        with self._lock:
+            self.text = ""
+            self._sent_length = 0
+
+    def on_token(self, token: str) -> None:
+        if not token:
+            return
+        with self._lock:
+            self.text += token
+        self._flush(force=False)
+
+    def on_tool(self, tool_name: str | None) -> None:
+        """Shows a status line for a running tool, or clears it when tool_name is None."""
+        with self._lock:
+            self._set_status(tool_name)
+        self._flush(force=True)
+
+    def close(self) -> None:
+        """Stops further updates. The caller posts the final message itself."""
+        with self._lock:
+            self._closed = True
+            if self._pending_flush is not None:
+                self._pending_flush.cancel()
+        if self.time_to_first_token is not None:
+            print(f"[Stream] first token visible after {self.time_to_first_token * 1000:.0f}ms, {self.updates_sent} updates")
+
+    def _set_status(self, tool_name: str | None) -> None:
+        if tool_name is None:
+            self.status = ""
+        else:
+            self.status = TOOL_STATUS.get(tool_name, f"⚙️ Using {tool_name}...")
+
+    def _flush(self, force: bool) -> None:
+        # The lock only guards the state; the Slack call runs without it so token
+        # callbacks never wait on Slack
+        with self._lock:
+            claimed = self._claim(force)
+        if claimed is None:
+            return
+
+        display, length = claimed
+        try:
+            self.client.chat_update(channel=self.channel, ts=self.ts, text=display)
+        except Exception as e:
+            print(f"Stream update failed: {e}")
+            return
+
+        with self._lock:
+            self._mark_sent(display, length)
+
+    def _schedule_flush(self, delay: float) -> None:
+        timer = threading.Timer(delay, self._trailing_flush)
+        timer.daemon = True
+        self._pending_flush = timer
+        timer.start()
+
+    def _trailing_flush(self) -> None:
+        with self._lock:
+            self._pending_flush = None
+        self._flush(force=True)
+
+    def _claim(self, force: bool) -> tuple[str, int] | None:
+        """(text to show, length of self.text it covers) when an update is due now, else None.
+
+        Claims the interval, so a token arriving while the update is sent does not send
+        another one. A throttled status change is sent once the interval is over.
+        """
+        if self._closed:
+            return None
+        if not force and len(self.text) - self._sent_length < self.min_chars:
+            return None
+
+        elapsed = time.perf_counter() - self._last_update
+        if elapsed < self.min_interval:
+            if force and self._pending_flush is None:
+                # Shows the latest state then, whatever changed in between
+                self._schedule_flush(self.min_interval - elapsed)
+            return None
+
+        display = self.text.strip()
+        if self.status:
+            display = f"{display}\n\n_{self.status}_" if display else f"_{self.status}_"
+        if not display or display == self._sent_display:
+            return None
+        self._last_update = time.perf_counter()
+        return display, len(self.text)
+
+    def _mark_sent(self, display: str, length: int) -> None:
+        if self.first_token_at is None and self.text.strip():
+            self.first_token_at = time.perf_counter()
+        # A new agent step may have reset the text while the update was sent
+        self._sent_length = min(length, len(self.text))
+        self._sent_display = display
+        self.updates_sent += 1
+
+
+class AsyncSlackStreamer(SlackStreamer):
+    """SlackStreamer for the asyncio runtime: same throttling, awaited AsyncWebClient calls.
+
+    All callbacks run on the event loop, so no lock is needed around the state.
+    """
+
+    async def on_llm_start(self) -> None:
+        self.text = ""
+        self._sent_length = 0
+
+    async def on_token(self, token: str) -> None:
+        if not token:
+            return
+        self.text += token
+        await self._aflush(force=False)
+
+    async def on_tool(self, tool_name: str | None) -> None:
+        self._set_status(tool_name)
+        await self._aflush(force=True)
+
+    async def _aflush(self, force: bool) -> None:
+        claimed = self._claim(force)
+        if claimed is None:
+            return
+
+        display, length = claimed
+        try:
+            await self.client.chat_update(channel=self.channel, ts=self.ts, text=display)
+        except Exception as e:
+            print(f"Stream update failed: {e}")
+            return
+
+        self._mark_sent(display, length)
+
+    def _schedule_flush(self, delay: float) -> None:
+        self._pending_flush = asyncio.get_running_loop().create_task(self._atrailing_flush(delay))
+
+    async def _atrailing_flush(self, delay: float) -> None:
+        await asyncio.sleep(delay)
+        self._pending_flush = None
+        await self._aflush(force=True)
@@ -0,0 +1,33 @@
+import time
+import threading
+from contextlib import contextmanager
+
+
+class StageTimer:
+    """Collects wall time per pipeline stage. Stages may run in parallel threads."""
+
+    def __init__(self) -> None:
+        self.timings: dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self.timings[name] = self.timings.get(name, 0.0) + seconds
+
+    @property
+    def total(self) -> float:
+        return time.perf_counter() - self._start
+
+    def summary(self) -> str:
+        parts = [f"{name}={seconds * 1000:.0f}ms" for name, seconds in self.timings.items()]
+        parts.append(f"total={self.total * 1000:.0f}ms")
+        return " ".join(parts)
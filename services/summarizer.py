@@ -0,0 +1,81 @@
+import queue
+import threading
+from langchain_core.messages import SystemMessage, HumanMessage
+
+SUMMARY_PROMPT = (
+    "You maintain a running summary of a chat between a user and an AI assistant.\n"
+    "Merge the existing summary with the new messages into one updated summary.\n"
+    "Keep facts, names, decisions, open questions and user preferences. Drop small talk.\n"
+    "Write at most {max_words} words. Reply with the summary only."
+)
+
+
+class ConversationSummarizer:
+    """Compresses turns that fall out of the history window into a running summary.
+
+    Runs on one background thread, off the request path. Each conversation is queued at
+    most once at a time. The summary is stored with the conversation in the memory store
+    and the summarized messages are removed from the history in the same step.
+    """
+
+    def __init__(self, llm_service, max_words: int = 200) -> None:
+        self.llm_service = llm_service
+        self.max_words = max_words
+
+        self._queue: queue.Queue[str] = queue.Queue()
+        self._pending: set[str] = set()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._worker, daemon=True)
+        self._thread.start()
+
+    def schedule(self, conversation_id: str) -> None:
+        with self._lock:
+            if conversation_id in self._pending:
+                return
+            self._pending.add(conversation_id)
+        self._queue.put(conversation_id)
+
+    def _worker(self) -> None:
+        while True:
+            conversation_id = self._queue.get()
+            with self._lock:
+                self._pending.discard(conversation_id)
+            try:
+                self.summarize(conversation_id)
+            except Exception as e:
+                print(f"[Summary] Failed for {conversation_id}: {e}")
+
+    def summarize(self, conversation_id: str) -> None:
+        service = self.llm_service
+        memory = service.memory
+
+        history = memory.get(conversation_id)
+        window = service.select_window(conversation_id, history)
+        overflow = history[:len(history) - len(window)]
+        if not overflow:
+            return
+
+        previous = memory.get_summary(conversation_id)
+        transcript = "\n".join(
+            f"{'User' if m.type == 'human' else 'Assistant'}: {m.content}" for m in overflow
+        )
+
+        response = service.invoke_summary([
+            SystemMessage(content=SUMMARY_PROMPT.format(max_words=self.max_words)),
+            HumanMessage(content=(
+                f"EXISTING SUMMARY:\n{previous or '(none)'}\n\n"
+                f"NEW MESSAGES:\n{transcript}"
+            )),
+        ])
+
+        summary = (response.content or "").strip()
+        if not summary:
+            return
+
+        # Summary and removal happen in one step under the store's lock, and the removed
+        # messages are the summarized ones even if turns were trimmed or added meanwhile
+        removed = memory.compact(conversation_id, summary, overflow)
+        if removed:
+            print(f"[Summary] {conversation_id}: compressed {removed} messages")
+        else:
+            print(f"[Summary] {conversation_id}: history changed, summary discarded")
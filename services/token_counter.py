@@ -0,0 +1,81 @@
+import threading
+import tiktoken
+from langchain_core.messages import BaseMessage
+
+# Key used to cache the count on the message itself, so it is stored with the history
+TOKEN_COUNT_KEY = "token_count"
+
+# Per-message overhead of the chat format (role, separators)
+MESSAGE_OVERHEAD = 4
+
+# The encoding is loaded on first use; None afterwards means the estimate is used
+_NOT_LOADED = object()
+_load_lock = threading.Lock()
+
+
+class TokenCounter:
+    """Counts tokens of chat messages and caches the count on each message.
+
+    Local models use their own tokenizers, so cl100k_base is an estimate. It is close
+    enough to keep prompt sizes predictable. tiktoken downloads the encoding on first use;
+    offline, point TIKTOKEN_CACHE_DIR at a copied cache. If it cannot be loaded, a
+    4-characters-per-token estimate is used instead.
+    """
+
+    def __init__(self, encoding_name: str = "cl100k_base") -> None:
+        self.encoding_name = encoding_name
+        # Loaded by the first count, so starting the bot never waits on the download
+        self._encoding = _NOT_LOADED
+
+    def count_text(self, text: str) -> int:
+        if not text:
+            return 0
+        if self._encoding is _NOT_LOADED:
+            self._load()
+        if self._encoding is None:
+            return len(text) // 4 + 1
+        return len(self._encoding.encode(text, disallowed_special=()))
+
+    def _load(self) -> None:
+        with _load_lock:
+            if self._encoding is not _NOT_LOADED:
+                return
+            try:
+                self._encoding = tiktoken.get_encoding(self.encoding_name)
+            except Exception as e:
+                # Logged once, every later count uses the estimate without trying again
+                print(f"Token encoding {self.encoding_name} unavailable (set TIKTOKEN_CACHE_DIR when offline), using estimate: {e}")
+                self._encoding = None
+
+    def count_message(self, message: BaseMessage) -> int:
+        cached = message.additional_kwargs.get(TOKEN_COUNT_KEY)
+        if cached is not None:
+            return cached
+
+        content = message.content
+        if isinstance(content, list):
+            # Multimodal content: only text parts count here
+            content = " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+
+        count = self.count_text(content) + MESSAGE_OVERHEAD
+        message.additional_kwargs[TOKEN_COUNT_KEY] = count
+        return count
+
+    def select_window(self, messages: list[BaseMessage], budget: int) -> list[BaseMessage]:
+        """Returns the newest messages whose total token count fits in the budget."""
+        selected = []
+        used = 0
+        for message in reversed(messages):
+            tokens = self.count_message(message)
+            if used + tokens > budget:
+                break
+            selected.append(message)
+            used += tokens
+
+        selected.reverse()
+
+        # Start the window on a user turn so the model never sees a dangling reply
+        while selected and selected[0].type != "human":
+            selected.pop(0)
+
+        return selected
@@ -0,0 +1,92 @@
+import os
+import json
+import queue
+import threading
+
+
+class TraceLogWriter:
+    """Appends one JSON line per handled request to a trace log, off the request path.
+
+    write() only puts the record on a queue; a background thread serializes and
+    appends everything queued every `flush_interval` seconds. When the queue is full
+    (the disk cannot keep up) records are dropped and counted instead of blocking
+    the handler. Past `max_bytes` the file is rotated to <path>.1.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        flush_interval: float = 1.0,
+        max_queue: int = 10000,
+        max_bytes: int = 100 * 1024 * 1024,
+    ) -> None:
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.written = 0
+        self.dropped = 0
+
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def write(self, record: dict) -> None:
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self) -> None:
+        """Writes out what is still queued and stops the writer thread."""
+        self._stop.set()
+        self._thread.join(timeout=5)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.flush_interval):
+            self._flush()
+        self._flush()
+
+    def _flush(self) -> None:
+        records = []
+        while True:
+            try:
+                records.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if not records:
+            return
+
+        lines = []
+        for record in records:
+            try:
+                lines.append(json.dumps(record, ensure_ascii=False, default=str))
+            except Exception as e:
+                print(f"[Trace] Record skipped: {e}")
+
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._rotate()
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+            self.written += len(lines)
+        except OSError as e:
+            self.dropped += len(lines)
+            print(f"[Trace] Writing {self.path} failed: {e}")
+
+    def _rotate(self) -> None:
+        if self.max_bytes > 0 and os.path.exists(self.path) and os.path.getsize(self.path) > self.max_bytes:
+            os.replace(self.path, self.path + ".1")
+
+
+def create_trace_log(config) -> TraceLogWriter | None:
+    path = getattr(config, "TRACE_LOG_PATH", "")
+    if not path:
+        return None
+    return TraceLogWriter(
+        path,
+        flush_interval=float(getattr(config, "TRACE_LOG_FLUSH_INTERVAL", 1.0)),
+        max_bytes=int(getattr(config, "TRACE_LOG_MAX_MB", 100)) * 1024 * 1024,
+    )
@@ -0,0 +1,175 @@
+"""Summarizes trace logs written by TraceLogWriter.
+
+Run from the repo root:
+    python -m services.trace_report                      # logs/requests.jsonl (+ rotated .1)
+    python -m services.trace_report old.jsonl new.jsonl --hours 24 --top 5
+
+Prints request latency percentiles (overall and per handler), the stages that
+take the longest, tool call timings, token counts and the slowest requests.
+"""
+import os
+import sys
+import json
+import math
+import time
+import argparse
+from datetime import datetime
+
+DEFAULT_PATH = os.path.join("logs", "requests.jsonl")
+# Part of the agent stage; older trace logs listed them as stages of their own
+MODEL_PHASES = ("prefill", "decode")
+
+
+def percentile(values: list[float], pct: float) -> float:
+    """Nearest-rank percentile, 0.0 for no values."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(math.ceil(pct / 100 * len(ordered)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def load_records(paths: list[str], since: float | None = None, handler: str | None = None) -> list[dict]:
+    records = []
+    skipped = 0
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # A line cut short by a crash or rotation
+                    skipped += 1
+                    continue
+                if since is not None and record.get("ts", 0) < since:
+                    continue
+                if handler and record.get("handler") != handler:
+                    continue
+                records.append(record)
+    if skipped:
+        print(f"Skipped {skipped} malformed line(s)", file=sys.stderr)
+    return sorted(records, key=lambda r: r.get("ts", 0))
+
+
+def _ms(seconds: float) -> str:
+    return f"{seconds * 1000:8.0f}ms"
+
+
+def _latency_row(label: str, values: list[float]) -> str:
+    return (
+        f"{label:<22}{len(values):>7} "
+        f"{_ms(percentile(values, 50))} {_ms(percentile(values, 95))} "
+        f"{_ms(percentile(values, 99))} {_ms(max(values) if values else 0.0)}"
+    )
+
+
+def _header(label: str) -> str:
+    return f"{label:<22}{'count':>7} {'p50':>10} {'p95':>10} {'p99':>10} {'max':>10}"
+
+
+def summarize(records: list[dict], top: int = 10) -> str:
+    if not records:
+        return "No requests in the trace log."
+
+    lines = []
+    first = datetime.fromtimestamp(records[0].get("ts", 0)).strftime("%Y-%m-%d %H:%M")
+    last = datetime.fromtimestamp(records[-1].get("ts", 0)).strftime("%Y-%m-%d %H:%M")
+    outcomes = {}
+    for record in records:
+        outcomes[record.get("outcome", "ok")] = outcomes.get(record.get("outcome", "ok"), 0) + 1
+    lines.append(f"{len(records)} requests from {first} to {last}")
+    lines.append("Outcomes: " + ", ".join(f"{name}={count}" for name, count in sorted(outcomes.items())))
+
+    # REQUEST LATENCY
+    lines.append("")
+    lines.append(_header("Request latency"))
+    lines.append(_latency_row("all", [r["seconds"] for r in records]))
+    handlers = sorted({r.get("handler", "?") for r in records})
+    for name in handlers:
+        lines.append(_latency_row(f"  {name}", [r["seconds"] for r in records if r.get("handler", "?") == name]))
+
+    # STAGES (sorted by their share of the total time)
+    stage_values: dict[str, list[float]] = {}
+    for record in records:
+        for stage, seconds in (record.get("stages") or {}).items():
+            if stage not in MODEL_PHASES:
+                stage_values.setdefault(stage, []).append(seconds)
+    total_time = sum(r["seconds"] for r in records) or 1.0
+    slow_stages = sorted(stage_values.items(), key=lambda item: sum(item[1]), reverse=True)[:top]
+    if slow_stages:
+        lines.append("")
+        lines.append(_header("Slowest stages") + f" {'share':>6}")
+        for stage, values in slow_stages:
+            lines.append(_latency_row(stage, values) + f" {sum(values) / total_time:>6.0%}")
+
+    # TOOLS
+    tool_values: dict[str, list[float]] = {}
+    tool_errors: dict[str, int] = {}
+    for record in records:
+        for call in record.get("tool_calls") or []:
+            tool_values.setdefault(call["tool"], []).append(call["seconds"])
+            if call.get("status") != "ok":
+                tool_errors[call["tool"]] = tool_errors.get(call["tool"], 0) + 1
+    if tool_values:
+        lines.append("")
+        lines.append(_header("Tool calls") + f" {'errors':>6}")
+        for tool, values in sorted(tool_values.items(), key=lambda item: sum(item[1]), reverse=True):
+            lines.append(_latency_row(tool, values) + f" {tool_errors.get(tool, 0):>6}")
+
+    # TOKENS
+    prompt_tokens = [r.get("prompt_tokens", 0) for r in records if r.get("llm_calls")]
+    completion_tokens = [r.get("completion_tokens", 0) for r in records if r.get("llm_calls")]
+    decode_seconds = sum(call.get("decode", 0.0) for r in records for call in r.get("llm_calls") or [])
+    if prompt_tokens:
+        lines.append("")
+        lines.append(
+            f"Prompt tokens p50={percentile(prompt_tokens, 50):.0f} p95={percentile(prompt_tokens, 95):.0f}, "
+            f"completion tokens p50={percentile(completion_tokens, 50):.0f} p95={percentile(completion_tokens, 95):.0f}"
+        )
+        phases = []
+        for phase in MODEL_PHASES:
+            values = [sum(call.get(phase, 0.0) for call in r["llm_calls"]) for r in records if r.get("llm_calls")]
+            phases.append(f"{phase} p50={percentile(values, 50) * 1000:.0f}ms p95={percentile(values, 95) * 1000:.0f}ms")
+        lines.append("Model time per request (part of agent): " + ", ".join(phases))
+        if decode_seconds > 0:
+            lines.append(f"Decode speed: {sum(completion_tokens) / decode_seconds:.1f} tokens/s")
+
+    # SLOWEST REQUESTS
+    lines.append("")
+    lines.append("Slowest requests:")
+    for record in sorted(records, key=lambda r: r["seconds"], reverse=True)[:top]:
+        stages = {name: value for name, value in (record.get("stages") or {}).items() if name not in MODEL_PHASES}
+        worst = max(stages.items(), key=lambda item: item[1]) if stages else ("-", 0.0)
+        when = datetime.fromtimestamp(record.get("ts", 0)).strftime("%m-%d %H:%M:%S")
+        lines.append(
+            f"  {when} {record.get('handler', '?'):<8} {record.get('conversation', '?'):<12} "
+            f"{_ms(record['seconds'])}  slowest stage {worst[0]}={worst[1] * 1000:.0f}ms"
+            f"{'  ERROR: ' + str(record.get('error')) if record.get('outcome') == 'error' else ''}"
+        )
+
+    return "\n".join(lines)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Latency summary of the request trace log.")
+    parser.add_argument("paths", nargs="*", help=f"trace log files (default: {DEFAULT_PATH} and its rotated .1)")
+    parser.add_argument("--hours", type=float, help="only requests from the last N hours")
+    parser.add_argument("--handler", help="only this handler (group or private)")
+    parser.add_argument("--top", type=int, default=10, help="number of stages and requests listed")
+    args = parser.parse_args(argv)
+
+    paths = args.paths or [p for p in (DEFAULT_PATH + ".1", DEFAULT_PATH) if os.path.exists(p)]
+    if not paths:
+        print(f"No trace log found at {DEFAULT_PATH}", file=sys.stderr)
+        return 1
+
+    since = time.time() - args.hours * 3600 if args.hours else None
+    print(summarize(load_records(paths, since, args.handler), args.top))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
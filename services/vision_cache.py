@@ -0,0 +1,99 @@
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+class VisionCache:
+    """LRU cache of vision model descriptions keyed by image content hash and model.
+
+    Bounded by the total size of the cached descriptions. With a `path`, descriptions are
+    also kept in SQLite so they survive restarts (the disk copy is bounded by entry count).
+    """
+
+    def __init__(self, max_bytes: int = 2 * 1024 * 1024, path: str | None = None, max_disk_entries: int = 10000) -> None:
+        self.max_bytes = max_bytes
+        self.max_disk_entries = max_disk_entries
+        self._entries: OrderedDict[str, str] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+        self._conn = None
+        if path:
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS descriptions ("
+                " key TEXT PRIMARY KEY,"
+                " description TEXT NOT NULL,"
+                " last_used REAL NOT NULL)"
+            )
+            self._conn.commit()
+
+    @staticmethod
+    def make_key(model: str, images: list[dict]) -> str:
+        hasher = hashlib.sha256(model.encode("utf-8"))
+        for img in images:
+            data = img.get("data") or img.get("base64", "").encode("ascii")
+            hasher.update(hashlib.sha256(data).digest())
+        return hasher.hexdigest()
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            description = self._entries.get(key)
+            if description is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return description
+
+            if self._conn is not None:
+                row = self._conn.execute("SELECT description FROM descriptions WHERE key = ?", (key,)).fetchone()
+                if row:
+                    with self._conn:
+                        self._conn.execute("UPDATE descriptions SET last_used = ? WHERE key = ?", (time.time(), key))
+                    self._remember(key, row[0])
+                    self.hits += 1
+                    return row[0]
+
+            self.misses += 1
+            return None
+
+    def put(self, key: str, description: str) -> None:
+        if not description:
+            return
+        with self._lock:
+            self._remember(key, description)
+            if self._conn is not None:
+                with self._conn:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO descriptions (key, description, last_used) VALUES (?, ?, ?)",
+                        (key, description, time.time()),
+                    )
+                    self._conn.execute(
+                        "DELETE FROM descriptions WHERE key NOT IN ("
+                        " SELECT key FROM descriptions ORDER BY last_used DESC LIMIT ?)",
+                        (self.max_disk_entries,),
+                    )
+
+    def _remember(self, key: str, description: str) -> None:
+        # Call with the lock held
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._size -= len(previous)
+        self._entries[key] = description
+        self._size += len(description)
+
+        while self._size > self.max_bytes and len(self._entries) > 1:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted)
+
+
+def create_vision_cache(config) -> VisionCache | None:
+    max_kb = int(getattr(config, "VISION_CACHE_MAX_KB", 0))
+    if max_kb <= 0:
+        return None
+    return VisionCache(max_bytes=max_kb * 1024, path=getattr(config, "VISION_CACHE_PATH", "") or None)
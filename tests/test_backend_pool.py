@@ -0,0 +1,118 @@
+import asyncio
+import httpx
+import openai
+import pytest
+from services.llm_backend_pool import LLMBackendPool
+from services.llm_service import LLMService
+from services.request_context import RequestContext, request_scope
+
+URLS = ["http://a/v1", "http://b/v1"]
+
+
+def _pool(**kwargs):
+    return LLMBackendPool("model", URLS, probe_interval=0, **kwargs)
+
+
+def _failover(pool, call, affinity_key=None):
+    # _with_failover only uses the pool and the call, no clients need to be built
+    return LLMService.__new__(LLMService)._with_failover(pool, call, affinity_key)
+
+
+def test_least_busy_backend_is_picked():
+    pool = _pool()
+    first = pool.acquire()
+    second = pool.acquire()
+    assert {first.url, second.url} == set(URLS)
+    pool.release(first)
+    assert pool.acquire().url == first.url
+
+
+def test_conversation_sticks_to_its_backend():
+    pool = _pool()
+    url = pool.acquire(affinity_key="C1").url
+    pool.release(pool.backends[URLS.index(url)])
+    for _ in range(3):
+        backend = pool.acquire(affinity_key="C1")
+        assert backend.url == url
+        pool.release(backend)
+    assert pool.pinned("C1") == url
+
+
+def test_connection_error_fails_over_to_the_other_backend():
+    pool = _pool()
+    tried = []
+
+    def call(url):
+        tried.append(url)
+        if len(tried) == 1:
+            raise ConnectionError("refused")
+        return "ok"
+
+    assert _failover(pool, call) == "ok"
+    assert len(set(tried)) == 2
+    assert not pool.backends[URLS.index(tried[0])].healthy
+
+
+def test_rate_limit_fails_over_without_marking_the_backend_down():
+    pool = _pool()
+    tried = []
+
+    def call(url):
+        tried.append(url)
+        if len(tried) == 1:
+            response = httpx.Response(429, request=httpx.Request("POST", f"{url}/chat/completions"))
+            raise openai.RateLimitError("busy", response=response, body=None)
+        return "ok"
+
+    assert _failover(pool, call) == "ok"
+    assert len(set(tried)) == 2
+    assert all(b.healthy and b.outstanding == 0 for b in pool.backends)
+
+
+def test_no_failover_after_output_started():
+    pool = _pool()
+    context = RequestContext("C1")
+    tried = []
+
+    def call(url):
+        tried.append(url)
+        # Tokens already reached Slack when the connection dropped
+        context.output_started = True
+        raise ConnectionError("reset mid-stream")
+
+    with request_scope(context), pytest.raises(ConnectionError):
+        _failover(pool, call)
+    assert len(tried) == 1
+
+
+def test_other_errors_are_not_retried():
+    pool = _pool()
+    tried = []
+
+    def call(url):
+        tried.append(url)
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        _failover(pool, call)
+    assert len(tried) == 1
+
+
+def test_cancelled_call_releases_its_backend():
+    pool = _pool()
+    started = asyncio.Event()
+
+    async def call(url):
+        started.set()
+        await asyncio.sleep(60)
+
+    async def main():
+        task = asyncio.create_task(LLMService.__new__(LLMService)._awith_failover(pool, call))
+        await started.wait()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+    assert [b.outstanding for b in pool.backends] == [0, 0]
+    assert all(b.healthy for b in pool.backends)
@@ -0,0 +1,109 @@
+import asyncio
+from types import SimpleNamespace
+from handlers.group_chat import AsyncGroupChatHandler, GroupChatHandler
+from handlers.private_chat import AsyncPrivateChatHandler, PrivateChatHandler
+
+CONFIG = SimpleNamespace(STREAM_REPLIES=False, STREAM_UPDATE_INTERVAL=1.0)
+
+
+class FakeClient:
+    token = "xoxb-test"
+
+    def __init__(self):
+        self.calls = []
+
+    def chat_postMessage(self, **kwargs):
+        self.calls.append(("chat_postMessage", kwargs))
+        return {"ts": "200.1"}
+
+    def chat_postEphemeral(self, **kwargs):
+        self.calls.append(("chat_postEphemeral", kwargs))
+
+    def chat_update(self, **kwargs):
+        self.calls.append(("chat_update", kwargs))
+
+
+class AsyncFakeClient(FakeClient):
+    async def chat_postMessage(self, **kwargs):
+        return FakeClient.chat_postMessage(self, **kwargs)
+
+    async def chat_postEphemeral(self, **kwargs):
+        FakeClient.chat_postEphemeral(self, **kwargs)
+
+    async def chat_update(self, **kwargs):
+        FakeClient.chat_update(self, **kwargs)
+
+
+class FakeLLMService:
+    config = CONFIG
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.requests = []
+        self.traced = []
+
+    def generate_reply(self, conversation_id, prompt, files=None, token=None, empty_prompt="", on_stage=None, streamer=None, context=None):
+        self.requests.append((prompt, empty_prompt, context.cache_replies))
+        if files:
+            on_stage("download")
+        on_stage("agent")
+        if self.fail:
+            raise RuntimeError("backend down")
+        context.add_source("https://example.com")
+        context.reply = "Hello"
+        return context
+
+    async def agenerate_reply(self, *args, on_stage=None, **kwargs):
+        stages = []
+        try:
+            return self.generate_reply(*args, on_stage=stages.append, **kwargs)
+        finally:
+            for stage in stages:
+                await on_stage(stage)
+
+    def trace_request(self, context, handler, seconds):
+        self.traced.append((handler, context.error))
+
+
+class FakeTracker:
+    def track(self, *args, **kwargs):
+        pass
+
+
+GROUP_EVENT = {"channel": "C1", "user": "U1", "text": "<@B1> hi there", "ts": "100.1", "files": [{"id": "F1"}]}
+DM_EVENT = {"channel": "D1", "user": "U1", "text": " hi ", "ts": "100.1"}
+
+
+def test_group_handler_runtimes_make_the_same_calls():
+    sync_client, async_client = FakeClient(), AsyncFakeClient()
+    sync_service, async_service = FakeLLMService(), FakeLLMService()
+
+    GroupChatHandler(sync_service, FakeTracker()).handle(GROUP_EVENT, None, sync_client, "100.1")
+    asyncio.run(AsyncGroupChatHandler(async_service, FakeTracker(), None).handle(GROUP_EVENT, None, async_client, "100.1"))
+
+    assert sync_client.calls == async_client.calls
+    assert [name for name, _ in sync_client.calls] == ["chat_postMessage", "chat_postEphemeral", "chat_update", "chat_update"]
+    final = sync_client.calls[-1][1]
+    assert final["text"] == "Hello" and final["attachments"][0]["title"] == "🔗 Research Sources"
+    assert sync_service.requests == async_service.requests == [("hi there", "Please analyze these files.", True)]
+    assert sync_service.traced == async_service.traced == [("group", None)]
+
+
+def test_private_handler_runtimes_report_errors_the_same_way():
+    sync_client, async_client = FakeClient(), AsyncFakeClient()
+    sync_service, async_service = FakeLLMService(fail=True), FakeLLMService(fail=True)
+
+    PrivateChatHandler(sync_service, FakeTracker()).handle(DM_EVENT, None, sync_client)
+    asyncio.run(AsyncPrivateChatHandler(async_service, FakeTracker(), None).handle(DM_EVENT, None, async_client))
+
+    assert sync_client.calls == async_client.calls
+    assert sync_client.calls[0][1]["thread_ts"] == "100.1"
+    assert sync_client.calls[-1] == ("chat_update", {"channel": "D1", "ts": "200.1", "text": "Sorry, I had trouble processing that request."})
+    assert sync_service.requests[0] == ("hi", "Please summarize this document.", False)
+    assert sync_service.traced == async_service.traced == [("private", "backend down")]
+
+
+def test_bot_messages_are_ignored():
+    client = FakeClient()
+    PrivateChatHandler(FakeLLMService(), FakeTracker()).handle({**DM_EVENT, "bot_id": "B1"}, None, client)
+    assert client.calls == []
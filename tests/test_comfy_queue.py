@@ -0,0 +1,134 @@
+import threading
+import time
+import pytest
+import requests
+from tools.comfy_queue import CANCELLED, DONE, QUEUED, RUNNING, ComfyJobQueue, QueueLimitError
+
+
+class FakeResponse:
+    status_code = 200
+
+    def __init__(self, data):
+        self.data = data
+
+    def json(self):
+        return self.data
+
+
+class FakeComfy:
+    """ComfyUI's /queue, /prompt and /history. Jobs finish on the next poll unless `hold` is set."""
+
+    def __init__(self, reachable=True, hold=True):
+        self.reachable = reachable
+        self.hold = hold
+        self.prompts = []
+        # Other POSTs: queue deletions and interrupts
+        self.requests = []
+
+    def get(self, url, **kwargs):
+        if not self.reachable:
+            raise requests.ConnectionError("refused")
+        if url.endswith("/queue"):
+            return FakeResponse({"queue_running": [], "queue_pending": []})
+        prompt_id = url.rsplit("/", 1)[-1]
+        if self.hold:
+            return FakeResponse({})
+        images = [{"filename": f"{prompt_id}.png", "type": "output"}, {"filename": "preview.png", "type": "temp"}]
+        return FakeResponse({prompt_id: {"status": {"completed": True}, "outputs": {"9": {"images": images}}}})
+
+    def post(self, url, json=None, **kwargs):
+        if not url.endswith("/prompt"):
+            self.requests.append((url.rsplit("/", 1)[-1], json))
+            return FakeResponse({})
+        self.prompts.append(json)
+        return FakeResponse({"prompt_id": f"p{len(self.prompts)}"})
+
+
+def _queue(urls=("http://comfy-a/", "http://comfy-b"), reachable=True, hold=True, **kwargs):
+    # Unreachable backends are tried once, the next poll is after the test is over
+    poll_interval = 0.05 if reachable else 60
+    queue = ComfyJobQueue(list(urls), poll_interval=poll_interval, **kwargs)
+    queue.session = FakeComfy(reachable, hold)
+    return queue
+
+
+def _wait_until(condition):
+    deadline = time.monotonic() + 5
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_identical_prompts_share_one_job():
+    queue = _queue()
+    job, deduplicated = queue.submit("U1", "A red  Fox", {}, 20)
+    same, again = queue.submit("U2", "a red fox", {}, 20)
+
+    assert not deduplicated and again
+    assert same is job and job.user_ids == ["U1", "U2"]
+
+
+def test_user_limit_counts_unfinished_jobs():
+    queue = _queue(max_per_user=1)
+    queue.submit("U1", "first", {}, 20)
+    with pytest.raises(QueueLimitError):
+        queue.submit("U1", "second", {}, 20)
+    # Joining an identical job does not count against the limit
+    assert not queue.submit("U2", "second", {}, 20)[0].finished
+    assert queue.submit("U2", "first", {}, 20)[1]
+
+
+def test_cancel_keeps_jobs_other_users_still_wait_for():
+    queue = _queue()
+    shared, _ = queue.submit("U1", "shared", {}, 20)
+    queue.submit("U2", "shared", {}, 20)
+    own, _ = queue.submit("U1", "own", {}, 20)
+
+    assert queue.cancel("U1") == [own]
+    assert own.state == CANCELLED and not shared.finished
+    assert shared.user_ids == ["U2"]
+
+
+def test_position_and_eta_follow_the_running_job():
+    queue = _queue(urls=["http://comfy"], max_concurrent=1)
+    first, _ = queue.submit("U1", "first", {}, 10)
+    second, _ = queue.submit("U2", "second", {}, 30)
+    _wait_until(lambda: first.state == RUNNING)
+
+    assert (queue.position(first), queue.position(second)) == (0, 1)
+    # 1s per step until measured: what is left of the running job, then its own steps
+    assert queue.eta(second) == pytest.approx(10 + 30, abs=1)
+
+
+def test_position_and_eta_while_backends_are_unreachable():
+    queue = _queue(reachable=False, max_concurrent=1)
+    first, _ = queue.submit("U1", "first", {}, 10)
+    second, _ = queue.submit("U2", "second", {}, 30)
+
+    assert (queue.position(first), queue.position(second)) == (1, 2)
+    assert queue.counts() == {QUEUED: 2, RUNNING: 0}
+    # The job ahead is shared by the slots of both backends
+    assert queue.eta(second) == pytest.approx(10 / 2 + 30)
+
+
+def test_jobs_run_to_completion_on_a_backend():
+    queue = _queue(hold=False)
+    finished = threading.Event()
+    job, _ = queue.submit("U1", "a red fox", {"prompt": 1}, 4)
+    job.listeners.append(lambda changed: changed.finished and finished.set())
+
+    assert finished.wait(5)
+    assert job.state == DONE and job.backend in ("http://comfy-a", "http://comfy-b")
+    assert [image["filename"] for image in job.images] == ["p1.png"]
+    assert queue.session.prompts == [{"prompt": 1}]
+    assert queue.eta(job) == 0.0
+
+
+def test_timed_out_job_is_removed_from_comfy():
+    queue = _queue(urls=["http://comfy"], timeout=0.1)
+    job, _ = queue.submit("U1", "slow", {}, 20)
+
+    _wait_until(lambda: job.finished)
+    assert job.error == "timed out"
+    _wait_until(lambda: queue.session.requests)
+    assert queue.session.requests[0] == ("queue", {"delete": [job.prompt_id]})
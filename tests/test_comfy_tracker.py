@@ -0,0 +1,67 @@
+import time
+from services.comfy_tracker import ComfyCompletionTracker
+from tools.comfy_queue import DONE, QUEUED, RUNNING
+
+
+class FakeJob:
+    def __init__(self):
+        self.state = QUEUED
+        self.listeners = []
+        self.images = []
+        self.error = None
+
+    def change(self, state):
+        self.state = state
+        for listener in self.listeners:
+            listener(self)
+
+
+class FakeQueue:
+    def position(self, job):
+        return 1
+
+    def eta(self, job):
+        return 30
+
+
+class FakeClient:
+    def __init__(self):
+        self.texts = []
+
+    def chat_postMessage(self, **kwargs):
+        self.texts.append(kwargs["text"])
+        return {"ts": "1.0"}
+
+    def chat_update(self, **kwargs):
+        self.texts.append(kwargs["text"])
+
+
+def _wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_change_inside_the_interval_is_flushed_later():
+    tracker = ComfyCompletionTracker(update_interval=0.3)
+    job, client = FakeJob(), FakeClient()
+    tracker.track(job, FakeQueue(), client, "C1", "1.0")
+    assert _wait_for(lambda: len(client.texts) == 1)
+
+    job.change(RUNNING)
+    time.sleep(0.1)
+    assert len(client.texts) == 1
+
+    assert _wait_for(lambda: len(client.texts) == 2)
+    assert client.texts[-1].startswith("🎨 _Generating image")
+
+
+def test_finished_job_is_shown_at_once():
+    tracker = ComfyCompletionTracker(update_interval=10)
+    job, client = FakeJob(), FakeClient()
+    tracker.track(job, FakeQueue(), client, "C1", "1.0")
+    assert _wait_for(lambda: len(client.texts) == 1)
+
+    job.change(DONE)
+    assert _wait_for(lambda: client.texts[-1] == "🎨 _Image generated._")
@@ -0,0 +1,49 @@
+from types import SimpleNamespace
+from services.llm_service import LLMService
+
+
+def _config(tmp_path, **overrides):
+    settings = {
+        "LOCAL_HOST": "http://127.0.0.1:18080/v1",
+        "API_KEY": "key",
+        "MODEL": "model",
+        "VISION_MODEL": "vision",
+        "SERPER_API_KEY": "serper",
+        "SYSTEM_MESSAGE": "You are a bot.",
+        "SHORT_MEMORY": 10,
+        "COMFYUI_API": "http://127.0.0.1:8188",
+        "MEMORY_DB_PATH": str(tmp_path / "memory.db"),
+        "LLM_HEALTH_INTERVAL": 3600,
+    }
+    settings.update(overrides)
+    return SimpleNamespace(**settings)
+
+
+def test_reload_keeps_stateful_tools_and_unchanged_clients(tmp_path):
+    service = LLMService(_config(tmp_path))
+    search, images, queue = service.serper_web_search_tool, service.comfy_image_tool, service.comfy_image_tool.queue
+    model_pool, vision_llms, executors = service.model_pool, service.vision_llms, service._executors
+
+    service.reload_config(_config(tmp_path, COMFYUI_STEPS=8, SERPER_API_KEY="new", SERPER_CACHE_SIZE=10))
+
+    assert service.serper_web_search_tool is search and search.api_key == "new" and search.cache_size == 10
+    assert service.comfy_image_tool is images and images.queue is queue and images.steps == 8
+    assert service.model_pool is model_pool
+    assert service.vision_llms is vision_llms
+    assert service._executors is executors
+
+
+def test_reload_rebuilds_what_the_new_settings_affect(tmp_path):
+    service = LLMService(_config(tmp_path))
+    model_pool, vision_llms, summary_llms = service.model_pool, service.vision_llms, service.summary_llms
+    executor = service.get_executor(service.PROFILE_TEXT)
+
+    service.reload_config(_config(tmp_path, SYSTEM_MESSAGE="Be brief.", VISION_MODEL="other"))
+
+    assert service.model_pool is model_pool and service.summary_llms is summary_llms
+    assert service.vision_llms is not vision_llms
+    assert service.get_executor(service.PROFILE_TEXT) is not executor
+
+    service.reload_config(_config(tmp_path, SYSTEM_MESSAGE="Be brief.", VISION_MODEL="other", LOCAL_HOST="http://127.0.0.1:18081/v1"))
+    assert service.model_pool is not model_pool
+    assert service.model_pool.urls == ["http://127.0.0.1:18081/v1"]
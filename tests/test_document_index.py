@@ -0,0 +1,45 @@
+from services.document_index import DocumentRetriever
+
+TOPICS = ["vpn", "printer", "holiday"]
+
+
+class FakeEmbeddings:
+    """One direction per topic word, so similarity is 1 within a topic and 0 across."""
+
+    def __init__(self):
+        self.embedded = 0
+
+    def _vector(self, text):
+        return [1.0 if topic in text else 0.0 for topic in TOPICS] + [0.1]
+
+    def embed_documents(self, texts):
+        self.embedded += len(texts)
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+
+def _retriever():
+    return DocumentRetriever(FakeEmbeddings(), chunk_size=100, chunk_overlap=0, min_score=0.0, followup_min_score=0.5)
+
+
+def test_same_file_is_indexed_once():
+    retriever = _retriever()
+    guide = {"name": "guide.txt", "content": "Install the vpn client first.", "hash": "h1"}
+
+    assert retriever.add_documents("C1", [guide, dict(guide, name="copy.txt")]) == 1
+    assert retriever.add_documents("C1", [guide]) == 0
+    assert retriever.embeddings.embedded == 1
+    # Another channel gets its own index
+    assert retriever.add_documents("C2", [guide]) == 1
+
+
+def test_followup_questions_only_get_close_excerpts():
+    retriever = _retriever()
+    retriever.add_documents("C1", [{"name": "guide.txt", "content": "Install the vpn client first.", "hash": "h1"}])
+
+    assert [c["source"] for c in retriever.retrieve("C1", "how do I set up the vpn", followup=True)] == ["guide.txt"]
+    assert retriever.retrieve("C1", "when is the next holiday", followup=True) == []
+    # With the document attached to this very message, the lower bound applies
+    assert retriever.retrieve("C1", "when is the next holiday") != []
@@ -0,0 +1,54 @@
+import time
+import multiprocessing
+import pytest
+from services import document_parser
+from services.document_parser import DocumentParserPool, ParseTimeoutError
+
+
+# Stands in for parse_document in the (forked) workers: b"hang" never finishes in time
+def _fake_parse(extension, data, max_pages, max_chars):
+    if data == b"hang":
+        time.sleep(30)
+    return data.decode()
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(document_parser, "parse_document", _fake_parse)
+    pool = DocumentParserPool(max_workers=1, timeout=0.5)
+    yield pool
+    pool.shutdown()
+
+
+def test_hung_file_does_not_fail_the_files_behind_it(pool):
+    hung = pool.submit(".pdf", b"hang")
+    queued = pool.submit(".pdf", b"fine")
+
+    with pytest.raises(ParseTimeoutError):
+        pool.result(hung)
+    # Its pool was retired, the queued file runs again on a fresh one
+    assert pool.result(queued) == "fine"
+    assert pool.result(pool.submit(".pdf", b"next")) == "next"
+
+
+def test_deadline_counts_from_submit(pool):
+    pool.max_workers = 3
+    jobs = [pool.submit(".pdf", b"hang") for _ in range(3)]
+
+    start = time.monotonic()
+    for job in jobs:
+        with pytest.raises(ParseTimeoutError):
+            pool.result(job)
+    # One timeout for the batch plus at most one resubmission, not one timeout per file
+    assert time.monotonic() - start < 2.5 * pool.timeout
+
+
+def test_hung_worker_is_killed(pool):
+    with pytest.raises(ParseTimeoutError):
+        pool.result(pool.submit(".pdf", b"hang"))
+
+    # Without the kill it would sleep on for 30s
+    deadline = time.monotonic() + 5
+    while multiprocessing.active_children():
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
@@ -0,0 +1,87 @@
+import asyncio
+import threading
+import time
+from services.event_dispatcher import AsyncConversationDispatcher, ConversationDispatcher
+
+
+def test_conversation_work_runs_in_order_while_others_run_in_parallel():
+    dispatcher = ConversationDispatcher(max_workers=2)
+    order = []
+    other_ran = threading.Event()
+    done = threading.Event()
+
+    def slow(label):
+        time.sleep(0.3)
+        order.append(label)
+
+    dispatcher.submit("C1", slow, "first")
+    dispatcher.submit("C1", order.append, "second")
+    dispatcher.submit("C2", other_ran.set)
+    dispatcher.submit("C1", lambda: done.set())
+
+    # C2 does not wait behind the busy conversation
+    assert other_ran.wait(0.2)
+    assert done.wait(2)
+    assert order == ["first", "second"]
+
+    stats = dispatcher.stats()
+    assert stats["processed"] == 4 and stats["queue_depth"] == 0 and stats["conversations"] == 0
+    dispatcher.shutdown()
+
+
+def test_failing_work_does_not_block_the_conversation():
+    dispatcher = ConversationDispatcher(max_workers=1)
+    done = threading.Event()
+    dispatcher.submit("C1", lambda: 1 / 0)
+    dispatcher.submit("C1", done.set)
+    assert done.wait(2)
+    dispatcher.shutdown()
+
+
+def test_async_dispatcher_keeps_order_and_bounds_concurrency():
+    dispatcher = AsyncConversationDispatcher(max_concurrency=1)
+    order = []
+    running = []
+
+    async def handler(label):
+        running.append(label)
+        assert len(running) == 1
+        await asyncio.sleep(0.01)
+        order.append(label)
+        running.remove(label)
+
+    async def main():
+        for label in ("a1", "a2", "a3"):
+            dispatcher.submit("C1", handler, label)
+        dispatcher.submit("C2", handler, "b1")
+        while dispatcher._tasks:
+            await asyncio.sleep(0.01)
+
+    asyncio.run(main())
+    assert [label for label in order if label.startswith("a")] == ["a1", "a2", "a3"]
+    assert "b1" in order
+    stats = dispatcher.stats()
+    assert stats["processed"] == 4 and stats["active"] == 0 and stats["workers"] == 1
+
+
+def test_async_shutdown_stops_counting_dropped_work():
+    dispatcher = AsyncConversationDispatcher(max_concurrency=1)
+
+    async def main():
+        started = asyncio.Event()
+
+        async def handler():
+            started.set()
+            await asyncio.sleep(60)
+
+        for _ in range(3):
+            dispatcher.submit("C1", handler)
+        dispatcher.submit("C2", handler)
+        await started.wait()
+        dispatcher.shutdown()
+        while dispatcher._tasks:
+            await asyncio.sleep(0.01)
+
+    asyncio.run(main())
+    stats = dispatcher.stats()
+    assert (stats["queue_depth"], stats["active"], stats["conversations"]) == (0, 0, 0)
@@ -0,0 +1,85 @@
+import os
+from services.file_cache import FileCache
+from services.file_service import FileService
+
+FILE_INFO = {"id": "F1", "name": "notes.txt", "size": 5, "timestamp": 1, "url_private_download": "https://files/F1"}
+NOTES = {"name": "notes.txt", "content": "hello", "hash": FileCache.hash_bytes(b"hello")}
+
+
+class FakeResponse:
+    status_code = 200
+
+    def __init__(self, data):
+        self.data = data
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def iter_content(self, chunk_size):
+        yield self.data
+
+
+class FakeSession:
+    def __init__(self, data):
+        self.data = data
+        self.gets = 0
+
+    def get(self, url, **kwargs):
+        self.gets += 1
+        return FakeResponse(self.data)
+
+
+def _service(tmp_path, data=b"hello"):
+    service = FileService(cache=FileCache(str(tmp_path)))
+    service.session = FakeSession(data)
+    return service
+
+
+def test_known_file_is_served_without_downloading(tmp_path):
+    service = _service(tmp_path)
+    first = service.download([FILE_INFO], "token")
+    assert service.extract_texts(first) == [NOTES]
+
+    again = service.download([FILE_INFO], "token")
+    assert service.session.gets == 1
+    assert again[0]["data"] is None
+    assert service.extract_texts(again) == [NOTES]
+
+
+def test_evicted_content_is_downloaded_again(tmp_path):
+    service = _service(tmp_path)
+    service.extract_texts(service.download([FILE_INFO], "token"))
+
+    # The index still knows the file, but its content is gone
+    os.remove(service.cache._path(FileCache.hash_bytes(b"hello"), "text"))
+
+    again = service.download([FILE_INFO], "token")
+    assert service.session.gets == 2
+    assert again[0]["data"] == b"hello"
+    assert service.extract_texts(again) == [NOTES]
+
+
+def test_missing_content_is_dropped_from_the_index(tmp_path):
+    cache = FileCache(str(tmp_path))
+    content_hash = FileCache.hash_bytes(b"hello")
+    cache.put("F1:5:1", content_hash, "text", "hello")
+    assert cache.lookup("F1:5:1") == content_hash
+
+    os.remove(cache._path(content_hash, "text"))
+    assert cache.get(content_hash, "text") is None
+    assert cache.lookup("F1:5:1") is None
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = FileCache(str(tmp_path), max_bytes=10)
+    cache.put("a", "hash-a", "text", "aaaaa")
+    cache.put("b", "hash-b", "text", "bbbbb")
+    cache.get("hash-a", "text")
+    cache.put("c", "hash-c", "text", "ccccc")
+
+    assert cache.get("hash-a", "text") == "aaaaa"
+    assert cache.get("hash-b", "text") is None
+    assert cache.lookup("c") == "hash-c"
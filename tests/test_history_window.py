@@ -0,0 +1,71 @@
+import threading
+from types import SimpleNamespace
+from langchain_core.messages import AIMessage, HumanMessage
+from services.llm_service import LLMService
+from services.memory_store import InMemoryStore
+from services.token_counter import TokenCounter
+
+
+def _service(budget=60):
+    service = LLMService.__new__(LLMService)
+    service.config = SimpleNamespace(MODEL="m", HISTORY_TOKEN_BUDGET=budget, SHORT_MEMORY=5)
+    service.memory = InMemoryStore()
+    service.token_counter = TokenCounter.__new__(TokenCounter)
+    service.token_counter._encoding = None  # 4 characters per token, no download
+    service.prefix_cache = True
+    service._window_anchors = {}
+    service._anchor_lock = threading.Lock()
+    return service
+
+
+def _history(turns):
+    history = []
+    for index in range(turns):
+        history += [HumanMessage(content=f"question {index} " + "x" * 20), AIMessage(content=f"answer {index} " + "y" * 20)]
+    return history
+
+
+def test_window_start_stays_put_while_it_fits():
+    service = _service()
+    history = _history(4)
+    first = service.select_window("C1", history)
+    assert first and first[0].type == "human"
+
+    # One more turn: the window grows at the end instead of sliding
+    history += _history(5)[8:]
+    second = service.select_window("C1", history)
+    assert second[0] is first[0]
+    assert len(second) == len(first) + 2
+
+
+def test_window_jumps_forward_when_the_anchor_no_longer_fits():
+    service = _service()
+    history = _history(4)
+    first = service.select_window("C1", history)
+
+    history = _history(12)
+    window = service.select_window("C1", history)
+    assert window[0] is not first[0]
+    assert window[-1] is history[-1]
+
+
+def test_windows_are_selected_safely_from_many_threads():
+    service = _service()
+    history = _history(6)
+    errors = []
+
+    def worker(offset):
+        try:
+            for index in range(300):
+                service.select_window(f"C{offset}-{index % 50}", history)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert len(service._window_anchors) == 8 * 50
@@ -0,0 +1,85 @@
+from langchain_core.messages import AIMessage, HumanMessage
+from services.memory_store import InMemoryStore, SQLiteStore
+
+
+class CountingConnection:
+    """Wraps the store's sqlite connection and counts the statements it runs."""
+
+    def __init__(self, conn):
+        self._conn = conn
+        self.statements = 0
+
+    def execute(self, *args):
+        self.statements += 1
+        return self._conn.execute(*args)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        return self._conn.__enter__()
+
+    def __exit__(self, *exc):
+        return self._conn.__exit__(*exc)
+
+
+def _turn(text):
+    return [HumanMessage(content=text), AIMessage(content=f"re: {text}")]
+
+
+def test_history_and_summary_survive_a_restart(tmp_path):
+    path = str(tmp_path / "memory.db")
+    store = SQLiteStore(path)
+    store.append("C1", _turn("first"))
+    store.append("C1", _turn("second"))
+    store.drop_oldest("C1", 2)
+    store.set_summary("C1", "talked about first")
+    store.close()
+
+    reopened = SQLiteStore(path)
+    assert [m.content for m in reopened.get("C1")] == ["second", "re: second"]
+    assert reopened.get_summary("C1") == "talked about first"
+
+
+def test_hot_conversation_is_served_without_queries(tmp_path):
+    store = SQLiteStore(str(tmp_path / "memory.db"))
+    store.append("C1", _turn("hello"))
+    store.set_summary("C1", "greeting")
+
+    store._conn = CountingConnection(store._conn)
+    for _ in range(3):
+        assert len(store.get("C1")) == 2
+        assert store.get_summary("C1") == "greeting"
+    assert store._conn.statements == 0
+
+
+def test_cache_is_bounded_by_size(tmp_path):
+    store = SQLiteStore(str(tmp_path / "memory.db"), cache_size=100, max_cache_bytes=2000)
+    for index in range(10):
+        store.append(f"C{index}", _turn("x" * 300))
+
+    assert store._cache_bytes <= 2000
+    assert 1 < len(store._cache) < 10
+    assert store._cache_bytes == sum(entry.size for entry in store._cache.values())
+    # Evicted conversations come back from disk
+    assert store.get("C0")[0].content == "x" * 300
+
+
+def test_cache_is_bounded_by_count(tmp_path):
+    store = SQLiteStore(str(tmp_path / "memory.db"), cache_size=2)
+    for index in range(5):
+        store.append(f"C{index}", _turn("hi"))
+    assert list(store._cache) == ["C3", "C4"]
+
+
+def test_in_memory_store_trims_and_clears():
+    store = InMemoryStore()
+    for text in ("a", "b", "c"):
+        store.append("C1", _turn(text))
+    store.set_summary("C1", "summary")
+
+    store.trim("C1", 2)
+    assert [m.content for m in store.get("C1")] == ["c", "re: c"]
+
+    store.clear("C1")
+    assert store.get("C1") == [] and store.get_summary("C1") == ""
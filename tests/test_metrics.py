@@ -0,0 +1,67 @@
+import asyncio
+import pytest
+from services.metrics import SLACK_API_CALLS, SLACK_API_SECONDS, InstrumentedSlackClient, Registry
+
+
+def test_registry_renders_the_prometheus_text_format():
+    registry = Registry()
+    requests = registry.counter("bot_requests_total", "Requests.", ["handler"])
+    in_flight = registry.gauge("bot_in_flight", "In flight.")
+    seconds = registry.histogram("bot_seconds", "Latency.", buckets=(0.1, 1))
+
+    requests.inc(handler="group")
+    requests.inc(2, handler='say "hi"')
+    in_flight.inc()
+    in_flight.dec()
+    seconds.observe(0.05)
+    seconds.observe(0.5)
+    seconds.observe(5)
+
+    assert registry.render().splitlines() == [
+        "# HELP bot_requests_total Requests.",
+        "# TYPE bot_requests_total counter",
+        'bot_requests_total{handler="group"} 1',
+        'bot_requests_total{handler="say \\"hi\\""} 2',
+        "# HELP bot_in_flight In flight.",
+        "# TYPE bot_in_flight gauge",
+        "bot_in_flight 0",
+        "# HELP bot_seconds Latency.",
+        "# TYPE bot_seconds histogram",
+        'bot_seconds_bucket{le="0.1"} 1',
+        'bot_seconds_bucket{le="1"} 2',
+        'bot_seconds_bucket{le="+Inf"} 3',
+        "bot_seconds_sum 5.55",
+        "bot_seconds_count 3",
+    ]
+
+
+class FakeClient:
+    token = "xoxb-test"
+
+    def chat_postMessage(self, **kwargs):
+        return {"ts": "1.0"}
+
+    def chat_update(self, **kwargs):
+        raise RuntimeError("ratelimited")
+
+    async def chat_delete(self, **kwargs):
+        return {"ok": True}
+
+
+def _calls(method, status):
+    return SLACK_API_CALLS._values.get((method, status), 0)
+
+
+def test_slack_client_calls_are_counted_and_timed():
+    client = InstrumentedSlackClient(FakeClient())
+    before = (_calls("chat_postMessage", "ok"), _calls("chat_update", "error"), _calls("chat_delete", "ok"))
+
+    assert client.token == "xoxb-test"
+    assert client.chat_postMessage(channel="C1") == {"ts": "1.0"}
+    with pytest.raises(RuntimeError):
+        client.chat_update(channel="C1")
+    assert asyncio.run(client.chat_delete(channel="C1")) == {"ok": True}
+
+    after = (_calls("chat_postMessage", "ok"), _calls("chat_update", "error"), _calls("chat_delete", "ok"))
+    assert [a - b for a, b in zip(after, before)] == [1, 1, 1]
+    assert SLACK_API_SECONDS._values[("chat_delete",)]["count"] >= 1
@@ -0,0 +1,84 @@
+import time
+from types import SimpleNamespace
+from services.llm_service import LLMService, ToolMetricsCallbackHandler
+from services.request_context import RequestContext
+from services.response_cache import ResponseCache
+from tools.time_tool import get_current_time
+
+QUESTION = "what time is it now"
+
+
+def _service(cache):
+    # _cache_store only needs the cache and the search TTLs
+    config = SimpleNamespace(SERPER_CACHE_TTL=600, SERPER_NEWS_CACHE_TTL=120)
+    return SimpleNamespace(response_cache=cache, config=config)
+
+
+def _store(cache, context, output):
+    lookup = cache.lookup("C1", QUESTION, "fp")
+    # Same shape as the executors' result: no intermediate_steps
+    LLMService._cache_store(_service(cache), context, lookup, {"input": QUESTION, "output": output})
+
+
+def test_time_tool_answer_is_not_cached():
+    cache = ResponseCache()
+    context = RequestContext("C1", "U1", cache_replies=True)
+    get_current_time.invoke({}, config={"callbacks": [ToolMetricsCallbackHandler(context)]})
+    assert context.tools_used == ["get_current_time"]
+
+    _store(cache, context, "It is 10:00 AM")
+
+    assert not cache.lookup("C1", QUESTION, "fp").hit
+
+
+def test_answer_without_tools_is_cached():
+    cache = ResponseCache()
+    _store(cache, RequestContext("C1", "U1", cache_replies=True), "Ask the IT desk")
+
+    lookup = cache.lookup("C1", "What time is it now?", "fp")
+    assert lookup.hit and lookup.kind == "exact"
+    assert not cache.lookup("C2", QUESTION, "fp").hit
+
+
+def test_search_answer_expires_with_the_search_cache():
+    cache = ResponseCache(ttl=3600)
+    context = RequestContext("C1", "U1", cache_replies=True)
+    context.add_tool_used("serper_search")
+
+    _store(cache, context, "Found it")
+
+    entry = cache.lookup("C1", QUESTION, "fp").entry
+    assert entry["expires"] - time.time() <= 120
+
+
+def _embed(question):
+    # Questions about the same topic word get the same direction
+    return [1.0, 0.0] if "vpn" in question else [0.0, 1.0]
+
+
+def test_similar_question_of_the_same_channel_and_fingerprint_is_served():
+    cache = ResponseCache(embed=_embed)
+    lookup = cache.lookup("C1", "How do I set up the VPN?", "fp")
+    assert not lookup.hit
+    assert cache.store(lookup, "Use the installer", [], [])
+
+    similar = cache.lookup("C1", "how can I configure vpn access", "fp")
+    assert similar.hit and similar.kind == "similar" and similar.reply == "Use the installer"
+    assert not cache.lookup("C1", "how can I configure vpn access", "other-fp").hit
+    assert not cache.lookup("C2", "how can I configure vpn access", "fp").hit
+    assert not cache.lookup("C1", "where is the printer room", "fp").hit
+
+    stats = cache.stats()["channels"]["C1"]
+    assert (stats["hits"], stats["similar"], stats["misses"]) == (1, 1, 3)
+
+
+def test_entries_expire_and_short_questions_are_not_cached():
+    cache = ResponseCache(ttl=0.05)
+    assert not cache.cacheable("why?")
+    assert cache.cacheable(QUESTION)
+
+    cache.store(cache.lookup("C1", QUESTION, "fp"), "Ask the IT desk", [], [])
+    assert cache.lookup("C1", QUESTION, "fp").hit
+    time.sleep(0.1)
+    assert not cache.lookup("C1", QUESTION, "fp").hit
+    assert cache.stats()["entries"] == 0
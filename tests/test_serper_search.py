@@ -0,0 +1,93 @@
+import asyncio
+import threading
+import time
+import pytest
+from tools.serper_web_search import SerperSearchTool
+
+RESULTS = [("Title", "Snippet", "https://example.com")]
+
+
+def _tool(**kwargs):
+    return SerperSearchTool(api_key="test", timeout=kwargs.pop("timeout", 0.5), **kwargs)
+
+
+def test_identical_searches_share_one_fetch():
+    tool = _tool()
+    calls = []
+
+    def fetch(endpoint, query):
+        calls.append(query)
+        time.sleep(0.1)
+        return RESULTS
+
+    tool._fetch = fetch
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(tool._search("Python release"))) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == [RESULTS] * 3
+    assert len(calls) == 1
+    assert tool._search("python   RELEASE") == RESULTS
+    assert tool.stats()["hits"] == 1
+
+
+def test_failed_search_is_not_cached():
+    tool = _tool()
+    tool._fetch = lambda endpoint, query: (_ for _ in ()).throw(ConnectionError("down"))
+
+    with pytest.raises(ConnectionError):
+        tool._search("python release")
+
+    tool._fetch = lambda endpoint, query: RESULTS
+    assert tool._search("python release") == RESULTS
+    assert tool.stats()["errors"] == 1
+
+
+def test_cancelled_async_search_frees_its_slot():
+    tool = _tool()
+    calls = []
+
+    async def slow_fetch(endpoint, query):
+        calls.append(query)
+        if len(calls) == 1:
+            await asyncio.sleep(10)
+        return RESULTS
+
+    tool._afetch = slow_fetch
+
+    async def scenario():
+        # A tool timeout cancels the search that owns the in-flight slot
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(tool._asearch("python release"), timeout=0.05)
+        assert tool._async_in_flight == {}
+        return await asyncio.wait_for(tool._asearch("python release"), timeout=1)
+
+    assert asyncio.run(scenario()) == RESULTS
+    assert len(calls) == 2
+
+
+def test_waiter_retries_when_the_search_it_waits_for_is_cancelled():
+    tool = _tool()
+    calls = []
+
+    async def slow_fetch(endpoint, query):
+        calls.append(query)
+        if len(calls) == 1:
+            await asyncio.sleep(10)
+        return RESULTS
+
+    tool._afetch = slow_fetch
+
+    async def scenario():
+        owner = asyncio.create_task(tool._asearch("python release"))
+        await asyncio.sleep(0.01)
+        waiter = asyncio.create_task(tool._asearch("python release"))
+        await asyncio.sleep(0.01)
+        owner.cancel()
+        return await asyncio.wait_for(waiter, timeout=1)
+
+    assert asyncio.run(scenario()) == RESULTS
+    assert len(calls) == 2
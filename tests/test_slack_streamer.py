@@ -0,0 +1,70 @@
+import asyncio
+import time
+from services.slack_streamer import AsyncSlackStreamer, SlackStreamer
+
+TOKEN = "x" * 25
+
+
+class FakeClient:
+    def __init__(self):
+        self.texts = []
+        self.streamer = None
+        self.locked = []
+
+    def chat_update(self, channel, ts, text):
+        self.locked.append(self.streamer._lock.locked())
+        self.texts.append(text)
+
+
+class AsyncFakeClient(FakeClient):
+    async def chat_update(self, channel, ts, text):
+        FakeClient.chat_update(self, channel, ts, text)
+
+
+def _streamer(cls, client):
+    streamer = cls(client, "C1", "1.0", min_interval=0.2)
+    client.streamer = streamer
+    return streamer
+
+
+def test_status_change_inside_the_interval_is_sent_when_it_ends():
+    client = FakeClient()
+    streamer = _streamer(SlackStreamer, client)
+
+    streamer.on_token(TOKEN)
+    streamer.on_tool("serper_search")
+    assert client.texts == [TOKEN]
+
+    time.sleep(0.4)
+    assert client.texts == [TOKEN, f"{TOKEN}\n\n_🔎 Searching the web..._"]
+    # Slack is called without holding the lock the token callbacks need
+    assert client.locked == [False, False]
+    streamer.close()
+
+
+def test_close_drops_a_pending_status_change():
+    client = FakeClient()
+    streamer = _streamer(SlackStreamer, client)
+    streamer.on_token(TOKEN)
+    streamer.on_tool("serper_search")
+    streamer.close()
+
+    time.sleep(0.4)
+    assert client.texts == [TOKEN]
+
+
+def test_async_status_change_inside_the_interval_is_sent_when_it_ends():
+    client = AsyncFakeClient()
+
+    async def main():
+        streamer = _streamer(AsyncSlackStreamer, client)
+        await streamer.on_token(TOKEN)
+        await streamer.on_tool("serper_search")
+        await streamer.on_tool(None)
+        assert client.texts == [TOKEN]
+        await asyncio.sleep(0.4)
+        streamer.close()
+
+    asyncio.run(main())
+    # Only the latest state counts: the search already finished, nothing changed
+    assert client.texts == [TOKEN]
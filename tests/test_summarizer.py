@@ -0,0 +1,94 @@
+import threading
+from types import SimpleNamespace
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+from services.memory_store import InMemoryStore, SQLiteStore
+from services.summarizer import ConversationSummarizer
+
+
+def _turn(text):
+    return [HumanMessage(content=text), AIMessage(content=f"re: {text}")]
+
+
+class FakeService:
+    """Keeps the newest 2 messages in the window; the summary call can be paused."""
+
+    def __init__(self, memory):
+        self.memory = memory
+        self.started = threading.Event()
+        self.resume = threading.Event()
+        self.resume.set()
+
+    def select_window(self, conversation_id, history):
+        return history[-2:]
+
+    def invoke_summary(self, messages):
+        self.started.set()
+        self.resume.wait(5)
+        return SimpleNamespace(content="summary of old turns")
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def memory(request, tmp_path):
+    if request.param == "memory":
+        return InMemoryStore()
+    return SQLiteStore(str(tmp_path / "memory.db"))
+
+
+def _summarizer(service):
+    summarizer = ConversationSummarizer.__new__(ConversationSummarizer)
+    summarizer.llm_service = service
+    summarizer.max_words = 50
+    return summarizer
+
+
+def _contents(memory):
+    return [m.content for m in memory.get("C1")]
+
+
+def test_overflow_is_replaced_by_the_summary(memory):
+    for text in ("a", "b", "c"):
+        memory.append("C1", _turn(text))
+
+    _summarizer(FakeService(memory)).summarize("C1")
+
+    assert _contents(memory) == ["c", "re: c"]
+    assert memory.get_summary("C1") == "summary of old turns"
+
+
+def test_turns_trimmed_and_added_during_the_summary_are_kept(memory):
+    for text in ("a", "b", "c"):
+        memory.append("C1", _turn(text))
+    service = FakeService(memory)
+    service.resume.clear()
+
+    worker = threading.Thread(target=_summarizer(service).summarize, args=("C1",))
+    worker.start()
+    assert service.started.wait(5)
+    # A reply lands while the summary is being written: append, then trim to 6 messages
+    memory.append("C1", _turn("d"))
+    memory.trim("C1", 6)
+    service.resume.set()
+    worker.join(5)
+
+    # Dropping by count would also have removed "c"; only the summarized "b" turn goes
+    assert _contents(memory) == ["c", "re: c", "d", "re: d"]
+    assert memory.get_summary("C1") == "summary of old turns"
+
+
+def test_summary_of_a_cleared_conversation_is_discarded(memory):
+    for text in ("a", "b"):
+        memory.append("C1", _turn(text))
+    service = FakeService(memory)
+    service.resume.clear()
+
+    worker = threading.Thread(target=_summarizer(service).summarize, args=("C1",))
+    worker.start()
+    assert service.started.wait(5)
+    memory.clear("C1")
+    memory.append("C1", _turn("fresh"))
+    service.resume.set()
+    worker.join(5)
+
+    assert _contents(memory) == ["fresh", "re: fresh"]
+    assert memory.get_summary("C1") == ""
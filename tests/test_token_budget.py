@@ -0,0 +1,57 @@
+from langchain_core.messages import AIMessage, HumanMessage
+from services import token_counter
+from services.token_counter import MESSAGE_OVERHEAD, TOKEN_COUNT_KEY, TokenCounter
+
+
+def _counter():
+    counter = TokenCounter.__new__(TokenCounter)
+    counter._encoding = None  # 4 characters per token, no download
+    return counter
+
+
+def test_count_is_cached_on_the_message():
+    counter = _counter()
+    message = HumanMessage(content="x" * 40)
+
+    assert counter.count_message(message) == 11 + MESSAGE_OVERHEAD
+    assert message.additional_kwargs[TOKEN_COUNT_KEY] == 11 + MESSAGE_OVERHEAD
+
+    # The stored count is used as is, the text is not counted again
+    message.additional_kwargs[TOKEN_COUNT_KEY] = 3
+    assert counter.count_message(message) == 3
+
+
+def test_multimodal_content_counts_only_text():
+    counter = _counter()
+    message = HumanMessage(content=[{"type": "text", "text": "x" * 40}, {"type": "image_url", "image_url": {"url": "data:"}}])
+    assert counter.count_message(message) == 11 + MESSAGE_OVERHEAD
+
+
+def test_window_keeps_the_newest_messages_that_fit():
+    counter = _counter()
+    history = []
+    for index in range(5):
+        history += [HumanMessage(content=f"q{index}" + "x" * 38), AIMessage(content=f"a{index}" + "y" * 38)]
+
+    # 15 tokens per message: room for 3, the first of which is a reply
+    window = counter.select_window(history, budget=45)
+    assert [m.content[:2] for m in window] == ["q4", "a4"]
+
+    assert counter.select_window(history, budget=1000) == history
+    assert counter.select_window(history, budget=10) == []
+
+
+def test_unavailable_encoding_is_tried_once(monkeypatch):
+    attempts = []
+
+    def get_encoding(name):
+        attempts.append(name)
+        raise OSError("offline")
+
+    monkeypatch.setattr(token_counter.tiktoken, "get_encoding", get_encoding)
+    counter = TokenCounter()
+    assert attempts == []
+
+    assert counter.count_text("x" * 40) == 11
+    assert counter.count_text("x" * 8) == 3
+    assert attempts == ["cl100k_base"]
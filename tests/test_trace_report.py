@@ -0,0 +1,65 @@
+import json
+from services.trace_log import TraceLogWriter
+from services.trace_report import load_records, percentile, summarize
+
+
+def _record(ts, seconds, handler="group", **extra):
+    return {"ts": ts, "handler": handler, "conversation": "C1", "seconds": seconds, **extra}
+
+
+def test_writer_appends_json_lines_and_rotates(tmp_path):
+    path = str(tmp_path / "logs" / "requests.jsonl")
+    writer = TraceLogWriter(path, flush_interval=60, max_bytes=1)
+    writer.write(_record(1, 0.5))
+    writer._flush()
+    writer.write(_record(2, 0.7, when=object()))
+    writer.close()
+
+    assert writer.written == 2 and writer.dropped == 0
+    with open(path + ".1", encoding="utf-8") as f:
+        assert json.loads(f.read())["ts"] == 1
+    with open(path, encoding="utf-8") as f:
+        assert json.loads(f.read())["ts"] == 2
+
+
+def test_percentile_is_nearest_rank():
+    values = [float(v) for v in range(1, 101)]
+    assert percentile(values, 50) == 50
+    assert percentile(values, 95) == 95
+    assert percentile(values, 100) == 100
+    assert percentile([], 50) == 0.0
+
+
+def test_malformed_lines_are_skipped_and_filters_applied(tmp_path):
+    path = tmp_path / "requests.jsonl"
+    lines = [json.dumps(_record(30, 1.0)), '{"ts": 40, "sec', "", json.dumps(_record(10, 2.0, handler="private"))]
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+    assert [r["ts"] for r in load_records([str(path)])] == [10, 30]
+    assert [r["ts"] for r in load_records([str(path)], since=20)] == [30]
+    assert [r["ts"] for r in load_records([str(path)], handler="private")] == [10]
+
+
+def test_summary_lists_latency_stages_tools_and_slowest_requests():
+    records = [
+        _record(
+            10, 2.0,
+            # An older record that still listed the model phases as stages
+            stages={"agent": 1.5, "download": 0.2, "prefill": 0.5, "decode": 1.0},
+            tool_calls=[{"tool": "serper_search", "seconds": 0.8, "status": "error"}],
+            llm_calls=[{"prefill": 0.5, "decode": 1.0}], prompt_tokens=500, completion_tokens=50,
+        ),
+        _record(20, 0.5, handler="private", outcome="error", error="backend down", stages={"agent": 0.4}),
+    ]
+    report = summarize(records, top=5)
+
+    assert report.startswith("2 requests from ")
+    assert "Outcomes: error=1, ok=1" in report
+    assert "  group" in report and "  private" in report
+    stage_lines = [line for line in report.splitlines() if line.startswith(("agent", "download"))]
+    assert [line.split()[0] for line in stage_lines] == ["agent", "download"]
+    assert any(line.startswith("serper_search") and line.endswith(" 1") for line in report.splitlines())
+    assert "Model time per request (part of agent): prefill p50=500ms p95=500ms, decode p50=1000ms" in report
+    assert "Decode speed: 50.0 tokens/s" in report
+    assert "slowest stage agent=1500ms" in report and "ERROR: backend down" in report
+    assert summarize([]) == "No requests in the trace log."
@@ -0,0 +1,42 @@
+from services.vision_cache import VisionCache
+
+IMAGE = [{"data": b"png-bytes"}]
+
+
+def test_key_depends_on_model_and_content():
+    key = VisionCache.make_key("llava", IMAGE)
+    assert key == VisionCache.make_key("llava", [{"data": b"png-bytes"}])
+    assert key != VisionCache.make_key("other", IMAGE)
+    assert key != VisionCache.make_key("llava", [{"data": b"other-bytes"}])
+
+
+def test_least_recently_used_descriptions_are_evicted_by_size():
+    cache = VisionCache(max_bytes=10)
+    cache.put("a", "aaaaa")
+    cache.put("b", "bbbbb")
+    assert cache.get("a") == "aaaaa"
+    cache.put("c", "ccccc")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "aaaaa" and cache.get("c") == "ccccc"
+    assert (cache.hits, cache.misses) == (3, 1)
+
+
+def test_descriptions_survive_a_restart(tmp_path):
+    path = str(tmp_path / "vision.db")
+    VisionCache(path=path).put("a", "a cat on a sofa")
+
+    cache = VisionCache(path=path)
+    assert cache.get("a") == "a cat on a sofa"
+    assert cache.get("b") is None
+
+
+def test_disk_copy_is_bounded_by_entry_count(tmp_path):
+    path = str(tmp_path / "vision.db")
+    cache = VisionCache(path=path, max_disk_entries=2)
+    for key in ("a", "b", "c"):
+        cache.put(key, key * 3)
+
+    restarted = VisionCache(path=path)
+    assert restarted.get("a") is None
+    assert restarted.get("c") == "ccc"
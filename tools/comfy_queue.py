@@ -0,0 +1,361 @@
+import re
+import time
+import uuid
+import threading
+import requests
+from services.metrics import ERRORS
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+class QueueLimitError(Exception):
+    pass
+
+
+class ComfyJob:
+    def __init__(self, key: str, user_id: str | None, prompt: str, workflow: dict, steps: int) -> None:
+        self.id = uuid.uuid4().hex[:8]
+        self.key = key
+        self.user_ids = [user_id] if user_id else []
+        self.prompt = prompt
+        self.workflow = workflow
+        self.steps = steps
+
+        self.state = QUEUED
+        # ComfyUI endpoint the job was dispatched to
+        self.backend: str | None = None
+        self.prompt_id: str | None = None
+        self.images: list[dict] = []
+        self.error: str | None = None
+        self.created = time.monotonic()
+        self.submitted_at: float | None = None
+        self.finished_at: float | None = None
+
+        # Called with the job on every state or queue position change
+        self.listeners = []
+
+    @property
+    def finished(self) -> bool:
+        return self.state in (DONE, FAILED, CANCELLED)
+
+
+class ComfyJobQueue:
+    """Generation job queue in front of one or more ComfyUI backends.
+
+    Keeps at most `max_concurrent` jobs inside each backend and the rest in a local FIFO,
+    limits jobs per user, merges identical prompts into one job, supports cancellation
+    and estimates waiting time from measured seconds per sampling step. One background
+    thread dispatches each job to the least-loaded backend (by its /queue) and follows it
+    through /history/<prompt_id>; results are fetched back over /view.
+    """
+
+    def __init__(
+        self,
+        api_urls: list[str],
+        max_concurrent: int = 1,
+        max_per_user: int = 2,
+        poll_interval: float = 1.0,
+        timeout: float = 300,
+    ) -> None:
+        self.api_urls = [url.rstrip("/") for url in api_urls]
+        self.max_concurrent = max_concurrent
+        self.max_per_user = max_per_user
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+
+        # Measured generation speed, starts with a guess until the first job finishes
+        self.seconds_per_step = 1.0
+        self._measured = False
+
+        self.session = requests.Session()
+        self.session.trust_env = False # Ignore system proxies that might block 127.0.0.1
+
+        self._jobs: list[ComfyJob] = []
+        self._lock = threading.RLock()
+        self._wakeup = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    # PUBLIC API
+    def configure(self, api_urls: list[str], max_concurrent: int, max_per_user: int, timeout: float) -> None:
+        """New backends and limits; jobs already running finish on the backend they started on."""
+        with self._lock:
+            self.api_urls = [url.rstrip("/") for url in api_urls]
+            self.max_concurrent = max_concurrent
+            self.max_per_user = max_per_user
+            self.timeout = timeout
+        # Queued jobs may fit now
+        self._wakeup.set()
+
+    def submit(self, user_id: str | None, prompt: str, workflow: dict, steps: int) -> tuple[ComfyJob, bool]:
+        """Queues a job. Returns (job, deduplicated); raises QueueLimitError over the user limit."""
+        key = self._normalize(prompt)
+
+        with self._lock:
+            existing = next((j for j in self._jobs if j.key == key and not j.finished), None)
+            if existing is not None:
+                if user_id and user_id not in existing.user_ids:
+                    existing.user_ids.append(user_id)
+                return existing, True
+
+            if user_id and self.max_per_user > 0:
+                active = sum(1 for j in self._jobs if user_id in j.user_ids and not j.finished)
+                if active >= self.max_per_user:
+                    raise QueueLimitError(f"you already have {active} image(s) in progress")
+
+            job = ComfyJob(key, user_id, prompt, workflow, steps)
+            self._jobs.append(job)
+            self._ensure_thread()
+
+        self._wakeup.set()
+        return job, False
+
+    def cancel(self, user_id: str) -> list[ComfyJob]:
+        """Cancels the user's unfinished jobs (jobs shared with other users are kept for them)."""
+        cancelled = []
+        with self._lock:
+            for job in self._jobs:
+                if job.finished or user_id not in job.user_ids:
+                    continue
+                job.user_ids.remove(user_id)
+                if job.user_ids:
+                    continue
+                was_running = job.state == RUNNING
+                job.state = CANCELLED
+                job.finished_at = time.monotonic()
+                cancelled.append((job, was_running))
+
+        for job, was_running in cancelled:
+            if was_running:
+                self._cancel_in_comfy(job)
+            self._notify(job)
+        self._wakeup.set()
+        return [job for job, _ in cancelled]
+
+    def position(self, job: ComfyJob) -> int:
+        """0 while running, otherwise the number of jobs that will start before it plus one."""
+        with self._lock:
+            if job.state != QUEUED:
+                return 0
+            queued = [j for j in self._jobs if j.state == QUEUED]
+            return queued.index(job) + 1 if job in queued else 0
+
+    def counts(self) -> dict[str, int]:
+        """Number of unfinished jobs per state."""
+        with self._lock:
+            return {
+                QUEUED: sum(1 for j in self._jobs if j.state == QUEUED),
+                RUNNING: sum(1 for j in self._jobs if j.state == RUNNING),
+            }
+
+    def eta(self, job: ComfyJob) -> float:
+        """Estimated seconds until the job's image is ready."""
+        with self._lock:
+            now = time.monotonic()
+            if job.finished:
+                return 0.0
+            if job.state == RUNNING:
+                return max(self._estimate(job) - (now - job.submitted_at), 0.0)
+
+            # Work ahead of this job is shared by the concurrent slots of all backends
+            ahead = sum(
+                max(self._estimate(j) - (now - j.submitted_at), 0.0) for j in self._jobs if j.state == RUNNING
+            )
+            for j in self._jobs:
+                if j is job:
+                    break
+                if j.state == QUEUED:
+                    ahead += self._estimate(j)
+            return ahead / max(self.max_concurrent * len(self.api_urls), 1) + self._estimate(job)
+
+    def fetch_image(self, job: ComfyJob, image: dict) -> bytes:
+        """Downloads one output image of a finished job from the backend that rendered it."""
+        params = {
+            "filename": image["filename"],
+            "subfolder": image.get("subfolder", ""),
+            "type": image.get("type", "output"),
+        }
+        response = self.session.get(f"{job.backend}/view", params=params, timeout=30)
+        response.raise_for_status()
+        return response.content
+
+    # WORKER
+    def _ensure_thread(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                self._jobs = [j for j in self._jobs if not j.finished]
+                idle = not self._jobs
+
+            if idle:
+                self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+
+            try:
+                self._start_queued()
+                self._check_running()
+            except Exception as e:
+                print(f"[ComfyUI] Queue error: {e}")
+
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    def _start_queued(self) -> None:
+        with self._lock:
+            queued = [j for j in self._jobs if j.state == QUEUED]
+        started = False
+
+        for job in queued:
+            backend = self._pick_backend()
+            if backend is None:
+                # Every backend is full or unreachable, retry on the next poll
+                break
+            try:
+                response = self.session.post(f"{backend}/prompt", json=job.workflow, timeout=15)
+                if response.status_code != 200:
+                    raise RuntimeError(f"ComfyUI error: {response.status_code} - {response.text}")
+                with self._lock:
+                    job.backend = backend
+                    job.prompt_id = response.json().get("prompt_id")
+                    cancelled = job.state != QUEUED
+                    if not cancelled:
+                        job.state = RUNNING
+                        job.submitted_at = time.monotonic()
+                started = True
+                if cancelled:
+                    # Cancelled while the request was in flight
+                    self._cancel_in_comfy(job)
+                    continue
+                print(f"[ComfyUI] Job {job.id} started on {backend}: {job.prompt_id}")
+            except Exception as e:
+                print(f"[ComfyUI] Job {job.id} failed to start on {backend}: {e}")
+                self._fail(job, str(e))
+
+        if started:
+            # Everyone behind moved up in the queue
+            with self._lock:
+                waiting = [j for j in self._jobs if not j.finished]
+            for job in waiting:
+                self._notify(job)
+
+    def _pick_backend(self) -> str | None:
+        """Least-loaded backend with a free slot, by the length of its own queue."""
+        with self._lock:
+            ours = {url: 0 for url in self.api_urls}
+            for j in self._jobs:
+                if j.state == RUNNING and j.backend in ours:
+                    ours[j.backend] += 1
+
+        best, best_load = None, None
+        for url in self.api_urls:
+            if ours[url] >= self.max_concurrent:
+                continue
+            try:
+                queue = self.session.get(f"{url}/queue", timeout=5).json()
+                # Counts work from other clients of the same ComfyUI too
+                load = len(queue.get("queue_running", [])) + len(queue.get("queue_pending", []))
+            except Exception as e:
+                print(f"[ComfyUI] Backend {url} unreachable: {e}")
+                continue
+            load = max(load, ours[url])
+            if best_load is None or load < best_load:
+                best, best_load = url, load
+        return best
+
+    def _check_running(self) -> None:
+        with self._lock:
+            running = [j for j in self._jobs if j.state == RUNNING]
+
+        for job in running:
+            if time.monotonic() - job.submitted_at > self.timeout:
+                self._fail(job, "timed out")
+                # Otherwise it keeps the GPU busy while its slot counts as free
+                self._cancel_in_comfy(job)
+                continue
+
+            try:
+                response = self.session.get(f"{job.backend}/history/{job.prompt_id}", timeout=5)
+            except requests.RequestException as e:
+                # One unreachable backend must not hold up the jobs on the others
+                print(f"[ComfyUI] History of job {job.id} on {job.backend} failed: {e}")
+                continue
+            if response.status_code != 200:
+                continue
+            entry = response.json().get(job.prompt_id)
+            if not entry:
+                # Still running inside ComfyUI
+                continue
+
+            status = entry.get("status", {})
+            if status.get("status_str") == "error":
+                self._fail(job, "ComfyUI reported an error")
+                continue
+            if not status.get("completed", True):
+                continue
+
+            images = [
+                image
+                for output in entry.get("outputs", {}).values()
+                for image in output.get("images", [])
+                if image.get("type") == "output"
+            ]
+            self._complete(job, images)
+
+    def _complete(self, job: ComfyJob, images: list[dict]) -> None:
+        with self._lock:
+            if job.finished:
+                return
+            job.images = images
+            job.state = DONE
+            job.finished_at = time.monotonic()
+            self._record_timing(job)
+        self._notify(job)
+
+    def _fail(self, job: ComfyJob, error: str) -> None:
+        with self._lock:
+            if job.finished:
+                return
+            job.error = error
+            job.state = FAILED
+            job.finished_at = time.monotonic()
+        ERRORS.inc(component="comfyui")
+        self._notify(job)
+
+    def _cancel_in_comfy(self, job: ComfyJob) -> None:
+        try:
+            # Remove it from ComfyUI's pending queue, or interrupt it if it is the one executing
+            self.session.post(f"{job.backend}/queue", json={"delete": [job.prompt_id]}, timeout=5)
+            queue = self.session.get(f"{job.backend}/queue", timeout=5).json()
+            if any(item[1] == job.prompt_id for item in queue.get("queue_running", [])):
+                self.session.post(f"{job.backend}/interrupt", timeout=5)
+        except Exception as e:
+            print(f"[ComfyUI] Cancel of {job.prompt_id} failed: {e}")
+
+    # HELPERS
+    def _notify(self, job: ComfyJob) -> None:
+        for listener in list(job.listeners):
+            try:
+                listener(job)
+            except Exception as e:
+                print(f"[ComfyUI] Job listener error: {e}")
+
+    def _record_timing(self, job: ComfyJob) -> None:
+        per_step = (job.finished_at - job.submitted_at) / max(job.steps, 1)
+        # Moving average so one slow model load does not dominate the estimate
+        self.seconds_per_step = per_step if not self._measured else 0.7 * self.seconds_per_step + 0.3 * per_step
+        self._measured = True
+
+    def _estimate(self, job: ComfyJob) -> float:
+        return self.seconds_per_step * job.steps
+
+    @staticmethod
+    def _normalize(prompt: str) -> str:
+        return re.sub(r"\s+", " ", prompt).strip().lower()
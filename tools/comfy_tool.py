@@ -1,113 +1,139 @@
-import os
 import random
-import requests
-import json
 from langchain_core.tools import tool
+from tools.comfy_queue import ComfyJobQueue, QueueLimitError
+from services.request_context import current_request
 
 class ComfyUIImageTool:
     def __init__(self, config):
+        self.queue = None
+        self.configure(config)
+
+    def configure(self, config):
+        """Applies new settings; the job queue, its thread and the jobs in it are kept."""
         self.config = config
-        # .rstrip("/") prevents double slashes in the URL if the config has one
-        self.api_url = getattr(config, "COMFYUI_API", "http://127.0.0.1:8000").rstrip("/")
+        # One or more ComfyUI endpoints, comma separated; .rstrip("/") prevents double slashes
+        raw_urls = getattr(config, "COMFYUI_API", "http://127.0.0.1:8000")
+        self.api_urls = [url.strip().rstrip("/") for url in raw_urls.split(",") if url.strip()]
         
         # Fallback logic: if config value is 0, None, or missing, default to safe values
         self.width = int(getattr(config, "COMFYUI_IMAGE_WIDTH", 1024) or 1024)
         self.height = int(getattr(config, "COMFYUI_IMAGE_HEIGHT", 1024) or 1024)
         self.steps = int(getattr(config, "COMFYUI_STEPS", 20) or 20)
         
-        self.is_generating = False 
+        # Jobs go through a local queue: bounded concurrency, per-user limits, deduplication
+        queue_settings = {
+            "max_concurrent": int(getattr(config, "COMFYUI_MAX_CONCURRENT", 1) or 1),
+            "max_per_user": int(getattr(config, "COMFYUI_MAX_PER_USER", 2)),
+            "timeout": float(getattr(config, "COMFYUI_TIMEOUT", 300)),
+        }
+        if self.queue is None:
+            self.queue = ComfyJobQueue(self.api_urls, **queue_settings)
+        else:
+            self.queue.configure(self.api_urls, **queue_settings)
+
+        print(f"DEBUG: ComfyUI Tool Loaded -> API: {', '.join(self.api_urls)}, Dim: {self.width}x{self.height}, Steps: {self.steps}")
 
-        print(f"DEBUG: ComfyUI Tool Loaded -> API: {self.api_url}, Dim: {self.width}x{self.height}, Steps: {self.steps}")
+    @staticmethod
+    def _user_id() -> str | None:
+        # Jobs are counted and cancelled per Slack user of the current request
+        context = current_request()
+        return context.user_id if context else None
+
+    def get_cancel_tool(self):
+        @tool
+        def cancel_image_generation():
+            """Cancel the user's queued or running image generations. Use when the user asks to stop or cancel an image."""
+            cancelled = self.queue.cancel(self._user_id())
+            if not cancelled:
+                return "There was no image generation in progress to cancel."
+            return f"Cancelled {len(cancelled)} image generation(s)."
+
+        return cancel_image_generation
 
     def get_tool(self):
         @tool
         def generate_image(user_prompt: str):
             """Generate an image using the ComfyUI Lumina 2 workflow from a given text prompt. 
             It may take some time to finish."""
-            self.is_generating = True
-            
-            try:
-                target_url = f"{self.api_url}/prompt"
-                print(f"DEBUG: Sending POST to: {target_url}")
-                
-                random_seed = random.randint(10000, 999999999)
-                gen_text = (
-                    "You are an assistant designed to generate superior images with a "
-                    "superior degree of text-image alignment based on the following prompt: "
-                    f"<Prompt Start> {user_prompt}"
-                )
+            random_seed = random.randint(10000, 999999999)
+            gen_text = (
+                "You are an assistant designed to generate superior images with a "
+                "superior degree of text-image alignment based on the following prompt: "
+                f"<Prompt Start> {user_prompt}"
+            )
 
-                workflow = {
-                    "prompt": {
-                        "4": {
-                            "inputs": {"ckpt_name": "lumina_2.safetensors"},
-                            "class_type": "CheckpointLoaderSimple"
+            workflow = {
+                "prompt": {
+                    "4": {
+                        "inputs": {"ckpt_name": "lumina_2.safetensors"},
+                        "class_type": "CheckpointLoaderSimple"
+                    },
+                    "6": {
+                        "inputs": {"text": gen_text, "clip": ["4", 1]},
+                        "class_type": "CLIPTextEncode"
+                    },
+                    "7": {
+                        "inputs": {
+                            "text": "low quality, blurry, distorted, bad hands, bad anatomy", 
+                            "clip": ["4", 1]
                         },
-                        "6": {
-                            "inputs": {"text": gen_text, "clip": ["4", 1]},
-                            "class_type": "CLIPTextEncode"
+                        "class_type": "CLIPTextEncode"
+                    },
+                    "13": {
+                        "inputs": {"width": self.width, "height": self.height, "batch_size": 1},
+                        "class_type": "EmptySD3LatentImage"
+                    },
+                    "11": {
+                        "inputs": {"shift": 4, "model": ["4", 0]},
+                        "class_type": "ModelSamplingAuraFlow"
+                    },
+                    "3": {
+                        "inputs": {
+                            "seed": random_seed,
+                            "steps": self.steps,
+                            "cfg": 4,
+                            "sampler_name": "res_multistep",
+                            "scheduler": "simple",
+                            "denoise": 1,
+                            "model": ["11", 0],
+                            "positive": ["6", 0],
+                            "negative": ["7", 0],
+                            "latent_image": ["13", 0]
                         },
-                        "7": {
-                            "inputs": {
-                                "text": "low quality, blurry, distorted, bad hands, bad anatomy", 
-                                "clip": ["4", 1]
-                            },
-                            "class_type": "CLIPTextEncode"
-                        },
-                        "13": {
-                            "inputs": {"width": self.width, "height": self.height, "batch_size": 1},
-                            "class_type": "EmptySD3LatentImage"
-                        },
-                        "11": {
-                            "inputs": {"shift": 4, "model": ["4", 0]},
-                            "class_type": "ModelSamplingAuraFlow"
-                        },
-                        "3": {
-                            "inputs": {
-                                "seed": random_seed,
-                                "steps": self.steps,
-                                "cfg": 4,
-                                "sampler_name": "res_multistep",
-                                "scheduler": "simple",
-                                "denoise": 1,
-                                "model": ["11", 0],
-                                "positive": ["6", 0],
-                                "negative": ["7", 0],
-                                "latent_image": ["13", 0]
-                            },
-                            "class_type": "KSampler"
-                        },
-                        "8": {
-                            "inputs": {"samples": ["3", 0], "vae": ["4", 2]},
-                            "class_type": "VAEDecode"
-                        },
-                        "9": {
-                            "inputs": {"filename_prefix": "Lumina2_Num_", "images": ["8", 0]},
-                            "class_type": "SaveImage"
-                        }
+                        "class_type": "KSampler"
+                    },
+                    "8": {
+                        "inputs": {"samples": ["3", 0], "vae": ["4", 2]},
+                        "class_type": "VAEDecode"
+                    },
+                    "9": {
+                        "inputs": {"filename_prefix": "Lumina2_Num_", "images": ["8", 0]},
+                        "class_type": "SaveImage"
                     }
                 }
+            }
 
-                # Using a session to avoid some local loopback issues on Windows
-                with requests.Session() as session:
-                    session.trust_env = False # Ignore system proxies that might block 127.0.0.1
-                    response = session.post(
-                        target_url, 
-                        json=workflow,
-                        timeout=15
-                    )
+            try:
+                job, deduplicated = self.queue.submit(
+                    self._user_id(), user_prompt, workflow, self.steps
+                )
+            except QueueLimitError as e:
+                return f"Image not started: {e}. Please wait until they are ready."
 
-                if response.status_code != 200:
-                    self.is_generating = False
-                    print(f"[ComfyUI] Failed: {response.status_code} - {response.text}")
-                    return f"ComfyUI error: {response.status_code}"
+            # The handler follows the job and posts the image into this request's thread
+            context = current_request()
+            if context is not None:
+                context.add_image_job(job, self.queue)
 
-                print("[ComfyUI] Image generation started successfully.")
-                return "Image generation started successfully. I will post it here as soon as it is ready."
+            if deduplicated:
+                return "The same image is already being generated. I will post it here as soon as it is ready."
 
-            except Exception as e:
-                self.is_generating = False
-                print(f"[ComfyUI] Error: {str(e)}")
-                return f"Error connecting to ComfyUI: {str(e)}"
+            position = self.queue.position(job)
+            eta = self.queue.eta(job)
+            print(f"[ComfyUI] Job {job.id} queued at position {position}, ETA {eta:.0f}s")
+            return (
+                f"Image generation queued (position {position}, about {eta:.0f} seconds). "
+                "I will post it here as soon as it is ready."
+            )
 
         return generate_image
\ No newline at end of file
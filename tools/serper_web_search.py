@@ -1,49 +1,273 @@
-import requests
+import re
+import time
 import json
-from langchain_core.tools import tool
+import asyncio
+import threading
+from collections import OrderedDict
+from concurrent.futures import CancelledError, Future
+import aiohttp
+import requests
+from langchain_core.tools import StructuredTool
+from services.request_context import current_request
+from services.async_http import LoopBoundSession
+from services.metrics import ERRORS
 
 class SerperSearchTool:
-    def __init__(self, api_key: str):
-        self.api_key = api_key
-        self.latest_links = []
+    """Serper web search with a TTL cache and request coalescing.
+
+    Results are cached per normalized query (news results expire sooner than general
+    search), identical queries that arrive while one is in flight wait for that call
+    instead of sending their own, and all calls share one keep-alive session. The tool
+    also has an aiohttp coroutine, used when the agent runs with ainvoke (asyncio runtime).
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        cache_ttl: float = 600,
+        news_cache_ttl: float = 120,
+        cache_size: int = 256,
+        timeout: float = 10,
+    ):
+        self.session = requests.Session()
+        self.session.headers.update({'Content-Type': 'application/json'})
+        # The API key is sent per request, so configure() can change it
+        self.async_session = LoopBoundSession()
+
+        # key -> (expires_at, results); results are (title, snippet, link) tuples
+        self._cache: OrderedDict[tuple, tuple[float, list]] = OrderedDict()
+        self._in_flight: dict[tuple, Future] = {}
+        # Coalescing for the asyncio runtime (one event loop)
+        self._async_in_flight: dict[tuple, asyncio.Future] = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.errors = 0
+
+        self.configure(api_key, cache_ttl, news_cache_ttl, cache_size, timeout)
+
+    def configure(
+        self,
+        api_key: str,
+        cache_ttl: float = 600,
+        news_cache_ttl: float = 120,
+        cache_size: int = 256,
+        timeout: float = 10,
+    ) -> None:
+        """Applies new settings without dropping the cache or the in-flight searches."""
+        with self._lock:
+            self.api_key = api_key
+            self.cache_ttl = cache_ttl
+            self.news_cache_ttl = news_cache_ttl
+            self.cache_size = cache_size
+            self.timeout = timeout
+            self.session.headers['X-API-KEY'] = api_key
+            while len(self._cache) > max(cache_size, 0):
+                self._cache.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "errors": self.errors,
+                "cached_queries": len(self._cache),
+                "hit_rate": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+            }
 
     def get_web_tool(self):
-        @tool
         def serper_search(query: str):
             """Search the web for current events, news, or factual information that you don't know."""
-            self.latest_links.clear() # Clear previous links
-            
-            endpoint = "https://google.serper.dev/news" if "news" in query.lower() else "https://google.serper.dev/search"
-            
-            headers = {
-                'X-API-KEY': self.api_key,
-                'Content-Type': 'application/json'
-            }
-            payload = json.dumps({"q": query})
-            
             print(f"\n[Tool] Serper search starting: {query}")
-            
+
             try:
-                response = requests.post(endpoint, headers=headers, data=payload)
-                response.raise_for_status()
-                data = response.json()
-                
-                results = []
-                # Serper returns results in the 'organic' (or 'news') key
-                search_results = data.get("organic") or data.get("news") or []
-                
-                for item in search_results[:5]: # Take top 5
-                    title = item.get("title")
-                    link = item.get("link")
-                    snippet = item.get("snippet")
-                    
-                    results.append(f"Title: {title}\nSnippet: {snippet}\nSource: {link}\n")
-                    self.latest_links.append(link) # Get links
-                
-                return "\n".join(results) if results else "No results found."
-            
+                search_results = self._search(query)
             except Exception as e:
                 print(f"[Tool Error] Serper: {e}")
+                ERRORS.inc(component="serper")
                 return f"Error performing search: {e}"
 
-        return serper_search
\ No newline at end of file
+            return self._format_results(search_results)
+
+        async def aserper_search(query: str):
+            print(f"\n[Tool] Serper search starting: {query}")
+
+            try:
+                search_results = await self._asearch(query)
+            except Exception as e:
+                print(f"[Tool Error] Serper: {e}")
+                ERRORS.inc(component="serper")
+                return f"Error performing search: {e}"
+
+            return self._format_results(search_results)
+
+        return StructuredTool.from_function(func=serper_search, coroutine=aserper_search)
+
+    def _format_results(self, search_results) -> str:
+        # Links are shown as sources under the reply of this request only
+        context = current_request()
+        results = []
+        for title, snippet, link in search_results:
+            results.append(f"Title: {title}\nSnippet: {snippet}\nSource: {link}\n")
+            if context is not None:
+                context.add_source(link)
+
+        return "\n".join(results) if results else "No results found."
+
+    def _search(self, query: str) -> list:
+        endpoint, key, ttl = self._route(query)
+
+        with self._lock:
+            cached = self._cache_get(key, query)
+            if cached is not None:
+                return cached
+
+            future = self._in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._in_flight[key] = future
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not owner:
+            # Same query already on its way to Serper, share its answer
+            print(f"[Tool] Serper waiting for identical in-flight search: {query}")
+            try:
+                return future.result(timeout=self.timeout * 2)
+            except CancelledError:
+                # The search it waited for was abandoned, run it again
+                return self._search(query)
+
+        try:
+            results = self._fetch(endpoint, query)
+        except Exception as e:
+            with self._lock:
+                self.errors += 1
+            future.set_exception(e)
+            raise
+        except BaseException:
+            future.cancel()
+            raise
+        else:
+            with self._lock:
+                self._cache_put(key, ttl, results)
+            future.set_result(results)
+            return results
+        finally:
+            # Always leave the slot, otherwise later identical queries wait on a dead future
+            with self._lock:
+                if self._in_flight.get(key) is future:
+                    del self._in_flight[key]
+
+    async def _asearch(self, query: str) -> list:
+        endpoint, key, ttl = self._route(query)
+
+        with self._lock:
+            cached = self._cache_get(key, query)
+            if cached is not None:
+                return cached
+
+            future = self._async_in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = asyncio.get_running_loop().create_future()
+                self._async_in_flight[key] = future
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not owner:
+            print(f"[Tool] Serper waiting for identical in-flight search: {query}")
+            try:
+                return await asyncio.wait_for(asyncio.shield(future), timeout=self.timeout * 2)
+            except asyncio.CancelledError:
+                task = asyncio.current_task()
+                if not future.cancelled() or (task is not None and task.cancelling()):
+                    raise
+            # The search it waited for was cancelled (tool timeout, shutdown), run it again
+            return await self._asearch(query)
+
+        try:
+            results = await self._afetch(endpoint, query)
+        except Exception as e:
+            with self._lock:
+                self.errors += 1
+            future.set_exception(e)
+            # Nobody may be waiting, do not let asyncio warn about the stored exception
+            future.exception()
+            raise
+        except BaseException:
+            # CancelledError is not an Exception: cancel the waiters' future too
+            future.cancel()
+            raise
+        else:
+            with self._lock:
+                self._cache_put(key, ttl, results)
+            future.set_result(results)
+            return results
+        finally:
+            # Always leave the slot, otherwise later identical queries wait on a dead future
+            with self._lock:
+                if self._async_in_flight.get(key) is future:
+                    del self._async_in_flight[key]
+
+    def _route(self, query: str) -> tuple[str, tuple, float]:
+        news = "news" in query.lower()
+        endpoint = "https://google.serper.dev/news" if news else "https://google.serper.dev/search"
+        ttl = self.news_cache_ttl if news else self.cache_ttl
+        return endpoint, (endpoint, self._normalize(query)), ttl
+
+    def _cache_get(self, key: tuple, query: str) -> list | None:
+        # Call with the lock held
+        cached = self._cache.get(key)
+        if cached is None or cached[0] <= time.monotonic():
+            return None
+        self._cache.move_to_end(key)
+        self.hits += 1
+        print(f"[Tool] Serper cache hit: {query}")
+        return cached[1]
+
+    def _cache_put(self, key: tuple, ttl: float, results: list) -> None:
+        # Call with the lock held
+        if ttl <= 0 or self.cache_size <= 0:
+            return
+        self._cache[key] = (time.monotonic() + ttl, results)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _fetch(self, endpoint: str, query: str) -> list:
+        payload = json.dumps({"q": query})
+        response = self.session.post(endpoint, data=payload, timeout=self.timeout)
+        response.raise_for_status()
+        data = response.json()
+
+        # Serper returns results in the 'organic' (or 'news') key
+        search_results = data.get("organic") or data.get("news") or []
+
+        # Take top 5
+        return [(item.get("title"), item.get("snippet"), item.get("link")) for item in search_results[:5]]
+
+    async def _afetch(self, endpoint: str, query: str) -> list:
+        session = self.async_session.get()
+        async with session.post(
+            endpoint,
+            data=json.dumps({"q": query}),
+            headers={'X-API-KEY': self.api_key, 'Content-Type': 'application/json'},
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+        ) as response:
+            response.raise_for_status()
+            data = await response.json()
+
+        search_results = data.get("organic") or data.get("news") or []
+        return [(item.get("title"), item.get("snippet"), item.get("link")) for item in search_results[:5]]
+
+    @staticmethod
+    def _normalize(query: str) -> str:
+        return re.sub(r"\s+", " ", query).strip().lower()
@@ -1,8 +1,11 @@
 from fastapi import FastAPI, Request, Form
-from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, RedirectResponse
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
 from services.env_service import EnvService
+from config import Config
+from services import metrics
 
 app = FastAPI()
 env_service = EnvService()
@@ -45,6 +48,30 @@ def toggle_ajax(request: Request):
         }
     )
 
+@app.get("/stats")
+def stats(request: Request):
+    # Worker pool queue depth and wait times, web search and answer cache counters, LLM backends
+    manager = request.app.state.bot_manager
+    stats = manager.slack_bot.dispatcher.stats()
+    llm_service = request.app.state.llm_service
+    stats["search"] = llm_service.serper_web_search_tool.stats()
+    stats["llm_backends"] = llm_service.backend_stats()
+    if llm_service.response_cache is not None:
+        stats["response_cache"] = llm_service.response_cache.stats()
+    return JSONResponse(content=stats)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics(request: Request):
+    # Prometheus text format; queue gauges are read at scrape time
+    manager = request.app.state.bot_manager
+    dispatcher = manager.slack_bot.dispatcher.stats()
+    metrics.QUEUE_DEPTH.set(dispatcher["queue_depth"])
+    metrics.ACTIVE_HANDLERS.set(dispatcher["active"])
+    llm_service = request.app.state.llm_service
+    for state, count in llm_service.comfy_image_tool.queue.counts().items():
+        metrics.IMAGE_JOBS.set(count, state=state)
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/config", response_class=HTMLResponse)
 async def config_page(request: Request):
     env_data = env_service.read()
@@ -74,6 +101,7 @@ async def config_page(request: Request):
 
 @app.post("/config")
 async def save_config(
+    request: Request,
     bot_token: str = Form(...),
     app_token: str = Form(...),
     api_key: str = Form(...),
@@ -84,7 +112,7 @@ async def save_config(
     short_memory: str = Form(...),
     web_key: str = Form(...),  # In html name = web_key
     comfy_api: str = Form(...),
-    comfy_image_path: str = Form(...),
+    comfy_image_path: str = Form(""),
     comfy_image_width: str = Form(...),
     comfy_image_height: str = Form(...),
     comfy_steps: str = Form(...),
@@ -112,4 +140,13 @@ async def save_config(
 
     env_service.write_selected(updates)
 
+    # Rebuild what the new settings affect so the running bot picks them up; building
+    # clients and agents blocks, so it runs off the event loop
+    llm_service = getattr(request.app.state, "llm_service", None)
+    if llm_service is not None:
+        try:
+            await run_in_threadpool(lambda: llm_service.reload_config(Config(override=True)))
+        except Exception as e:
+            print(f"Config reload failed: {e}")
+
     return RedirectResponse("/config", status_code=303)